@@ -0,0 +1,152 @@
+"""Sound for the racing game.
+
+The engine and each effect play on their own reserved channel, so a crash or
+gear-shift sound never interrupts the engine loop. The engine is a bank of
+seamless loops at ENGINE_PITCH_STEPS pitches, picked from how far the car is
+into its current gear. Every sound is synthesized once and cached as a WAV
+file in the sounds directory; later starts only load the files, and a WAV
+placed there by hand replaces the synthesized sound of the same name.
+Sounds are loaded one at a time with load_effect() and load_engine(), so
+they can be loaded in the background; playing a sound that is not loaded
+yet does nothing.
+"""
+import io
+import os
+import wave
+
+import numpy
+import pygame
+
+from simulation import gear_speeds
+
+SAMPLE_RATE = 44100
+AMPLITUDE = 0.3 * 32767
+
+# Engine loops from idle to the top of a gear
+ENGINE_PITCH_STEPS = 8
+ENGINE_IDLE_HZ = 55
+ENGINE_TOP_HZ = 165
+ENGINE_LOOP_SECONDS = 0.25
+VOLUME_STEPS = 20  # engine volume is rounded to this many levels so it only changes when audible
+
+# Reserved channel of each sound; the engine loops are all played on channel 0
+ENGINE_CHANNEL = 0
+EFFECT_CHANNELS = {"crash": 1, "gear_shift": 2, "menu_select": 3}
+
+
+def engine_loop(frequency):
+    # A buzzy tone cut to a whole number of cycles so it loops without a click
+    cycles = max(1, round(frequency * ENGINE_LOOP_SECONDS))
+    length = round(cycles * SAMPLE_RATE / frequency)
+    phase = 2 * numpy.pi * cycles * numpy.arange(length) / length
+    wave_form = numpy.sin(phase) + 0.5 * numpy.sin(2 * phase) + 0.25 * numpy.sin(3 * phase)
+    return wave_form / 1.75
+
+
+def tone(frequency, seconds):
+    # A beep with a short fade at both ends
+    t = numpy.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    envelope = numpy.minimum(1, numpy.minimum(t, seconds - t) * 100)
+    return numpy.sin(2 * numpy.pi * frequency * t) * envelope
+
+
+def crash_noise(seconds=0.5):
+    # Decaying white noise; seeded so the cached file never changes
+    samples = numpy.random.default_rng(0).uniform(-1, 1, int(SAMPLE_RATE * seconds))
+    return samples * numpy.exp(-numpy.arange(len(samples)) / (SAMPLE_RATE * seconds / 4))
+
+
+EFFECTS = {
+    "crash": crash_noise,
+    "gear_shift": lambda: tone(440, 0.1),
+    "menu_select": lambda: tone(880, 0.1),
+}
+
+
+def engine_frequency(step):
+    return ENGINE_IDLE_HZ * (ENGINE_TOP_HZ / ENGINE_IDLE_HZ) ** (step / (ENGINE_PITCH_STEPS - 1))
+
+
+def engine_step(speed, gear):
+    """Pitch step for a speed: the fraction of the current gear's top speed reached"""
+    revs = min(1.0, abs(speed) / gear_speeds[gear])
+    return round(revs * (ENGINE_PITCH_STEPS - 1))
+
+
+def write_wav(file, samples):
+    """Write mono samples in [-1, 1] as a 16-bit WAV file (a path or a file object)"""
+    with wave.open(file, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((samples * AMPLITUDE).astype("<i2").tobytes())
+
+
+class Audio:
+    """Owns the game's sounds and their reserved mixer channels"""
+
+    def __init__(self, sound_dir):
+        self.sound_dir = sound_dir
+        self.available = pygame.mixer.get_init() is not None
+        self._engine_step = None
+        self._engine_volume = None
+        self.engine_bank = None
+        self.effects = {}
+        if not self.available:
+            return
+        pygame.mixer.set_reserved(1 + len(EFFECT_CHANNELS))
+        self.engine_channel = pygame.mixer.Channel(ENGINE_CHANNEL)
+        self.effect_channels = {name: pygame.mixer.Channel(channel) for name, channel in EFFECT_CHANNELS.items()}
+
+    def load_effect(self, name):
+        """Load one of the EFFECTS, synthesizing it if it is not cached yet"""
+        if self.available:
+            self.effects[name] = self._load(name, EFFECTS[name])
+
+    def load_engine(self):
+        """Load the whole engine pitch bank, synthesizing the loops that are not cached yet"""
+        if self.available:
+            self.engine_bank = [self._load(f"engine_{step}", lambda step=step: engine_loop(engine_frequency(step)))
+                                for step in range(ENGINE_PITCH_STEPS)]
+
+    def _load(self, name, synthesize):
+        # The cached WAV if there is one, otherwise synthesize and cache it
+        path = os.path.join(self.sound_dir, f"{name}.wav")
+        if not os.path.exists(path):
+            samples = synthesize()
+            try:
+                # Written under another name first, so an interrupted start never leaves half a file
+                write_wav(path + ".tmp", samples)
+                os.replace(path + ".tmp", path)
+            except OSError:  # read-only install: keep it in memory and synthesize again next start
+                buffer = io.BytesIO()
+                write_wav(buffer, samples)
+                buffer.seek(0)
+                return pygame.mixer.Sound(file=buffer)
+        return pygame.mixer.Sound(path)
+
+    def play(self, name):
+        """Play an effect on its channel, cutting off the previous play of the same effect"""
+        sound = self.effects.get(name)
+        if sound is not None:
+            self.effect_channels[name].play(sound)
+
+    def update_engine(self, speed, gear, max_speed):
+        """Match the engine loop to the car; the mixer is only touched when pitch or volume changes"""
+        if not self.engine_bank:
+            return
+        step = engine_step(speed, gear)
+        volume = round(min(1.0, abs(speed) / max_speed) * VOLUME_STEPS) / VOLUME_STEPS
+        if step != self._engine_step:
+            self.engine_channel.play(self.engine_bank[step], loops=-1)
+            self._engine_step = step
+            self._engine_volume = None  # apply the volume to the new loop too
+        if volume != self._engine_volume:
+            self.engine_channel.set_volume(volume)
+            self._engine_volume = volume
+
+    def stop_engine(self):
+        if self.available:
+            self.engine_channel.stop()
+        self._engine_step = None
+        self._engine_volume = None
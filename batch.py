@@ -0,0 +1,247 @@
+"""Batch simulator: plays many headless games in parallel to evaluate tuning changes.
+
+Every combination of car, difficulty and driving policy plays the same list of
+seeds, so configurations are compared on identical traffic. Games run in a
+process pool; the job table and the results live in one structured NumPy
+array in shared memory, which the workers fill in place, so nothing but row
+ranges crosses the process boundary.
+
+    python batch.py --games 500 --policies throttle cautious
+    python batch.py --games 500 --set car_friction=0.04 --set "gear_speeds={1: 6, 2: 9, 3: 13, 4: 17, 5: 21}"
+"""
+import argparse
+import ast
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy
+
+import simulation
+from simulation import (GameState, step, DOWN, SMALL_TRAFFIC_MARGIN, lane_centers,
+                        INPUT_UP, INPUT_LEFT, INPUT_RIGHT, INPUT_SHIFT_UP)
+
+# One row per game: the job (seed, car, difficulty, policy) and its outcome
+RESULT_DTYPE = numpy.dtype([
+    ("seed", numpy.uint64),
+    ("car", numpy.uint8),
+    ("difficulty", numpy.uint8),
+    ("policy", numpy.uint8),
+    ("cause", numpy.uint8),
+    ("ticks", numpy.uint32),
+    ("score", numpy.int64),
+])
+
+# Why a game ended
+CAUSE_TIME_LIMIT = 0  # survived until the tick limit
+CAUSE_ONCOMING = 1  # hit a car coming down the screen
+CAUSE_SAME_WAY = 2  # hit a car driving up the screen, like the player
+CAUSES = ["time limit", "oncoming car", "same-way car"]
+
+LOOK_AHEAD = 250  # how far up the screen the cautious policy watches for cars
+
+
+# Driving policies: called every tick with the state and a policy-owned RNG, return an input bitmask
+
+def shift_up(state):
+    # Shift up once the current gear is nearly flat out
+    if state.current_gear < simulation.max_gear and \
+            abs(state.car_speed) >= simulation.gear_speeds[state.current_gear] - 0.5:
+        return INPUT_SHIFT_UP
+    return 0
+
+
+def steer_towards(state, target_x):
+    # Turn towards target_x, then straighten up once there
+    width = state.car_type["width"]
+    offset = target_x - (state.car_x + width / 2)
+    if offset > 5 and state.car_rotation > -20:
+        return INPUT_RIGHT
+    if offset < -5 and state.car_rotation < 20:
+        return INPUT_LEFT
+    if state.car_rotation > 1:
+        return INPUT_RIGHT
+    if state.car_rotation < -1:
+        return INPUT_LEFT
+    return 0
+
+
+def idle_policy(state, rng):
+    return 0
+
+
+def throttle_policy(state, rng):
+    return INPUT_UP | shift_up(state)
+
+
+def cautious_policy(state, rng):
+    # Full throttle in a lane, moving to the next lane when a car is close ahead in the current one
+    center = state.car_x + state.car_type["width"] / 2
+    centers = lane_centers(state, state.car_y + state.car_type["height"] / 2)
+    lane_width = centers[1] - centers[0]
+    lane = min(range(len(centers)), key=lambda i: abs(centers[i] - center))
+    traffic = state.traffic
+    live = slice(0, traffic.count)
+    left = traffic.x[live]
+    right = left + traffic.width[live]
+    bottom = traffic.y[live] + traffic.height[live]
+    lane_left = centers[lane] - lane_width / 2
+    ahead = ((bottom > state.car_y - LOOK_AHEAD) & (traffic.y[live] < state.car_y + state.car_type["height"]) &
+             (right > lane_left) & (left < lane_left + lane_width))
+    if ahead.any():
+        lane = lane - 1 if lane else lane + 1
+    return INPUT_UP | shift_up(state) | steer_towards(state, centers[lane])
+
+
+def random_policy(state, rng):
+    # Mostly throttle, with random steering held for a few ticks at a time
+    inputs = INPUT_UP | shift_up(state)
+    roll = rng.random()
+    if roll < 0.1:
+        inputs |= INPUT_LEFT
+    elif roll < 0.2:
+        inputs |= INPUT_RIGHT
+    return inputs
+
+
+POLICIES = {
+    "idle": idle_policy,
+    "throttle": throttle_policy,
+    "cautious": cautious_policy,
+    "random": random_policy,
+}
+POLICY_NAMES = list(POLICIES)
+
+
+def play(seed, car, difficulty, policy, max_ticks):
+    """Play one game; returns (cause, ticks, score)"""
+    state = GameState(car, difficulty, seed=seed, traffic_margin=SMALL_TRAFFIC_MARGIN)
+    drive = POLICIES[POLICY_NAMES[policy]]
+    rng = random.Random(seed)  # separate from the simulation's own generator
+    spare = None
+    while state.game_time < max_ticks:
+        state, spare = step(state, drive(state, rng), spare), state
+        if state.game_over:
+            direction = state.traffic.direction[state.crash_slot]
+            return (CAUSE_ONCOMING if direction == DOWN else CAUSE_SAME_WAY), state.game_time, state.score
+    return CAUSE_TIME_LIMIT, state.game_time, state.score
+
+
+# Worker process state, set up once per process by init_worker()
+_memory = None
+_results = None
+
+
+def init_worker(name, count, overrides):
+    global _memory, _results
+    _memory = shared_memory.SharedMemory(name=name)
+    _results = numpy.ndarray(count, dtype=RESULT_DTYPE, buffer=_memory.buf)
+    apply_overrides(overrides)
+
+
+def run_rows(start, stop, max_ticks):
+    """Play the games in rows [start, stop) of the shared table, writing the outcomes in place"""
+    for row in _results[start:stop]:
+        row["cause"], row["ticks"], row["score"] = play(int(row["seed"]), int(row["car"]), int(row["difficulty"]),
+                                                        int(row["policy"]), max_ticks)
+    return stop - start
+
+
+def apply_overrides(overrides):
+    """Replace tuning constants in the simulation module, e.g. {"car_friction": 0.04}"""
+    for name, value in overrides.items():
+        setattr(simulation, name, value)
+
+
+def parse_override(text):
+    name, _, value = text.partition("=")
+    name = name.strip()
+    if not hasattr(simulation, name) or name.startswith("_") or callable(getattr(simulation, name)):
+        raise argparse.ArgumentTypeError(f"{name!r} is not a simulation constant")
+    try:
+        return name, ast.literal_eval(value.strip())
+    except (ValueError, SyntaxError):
+        raise argparse.ArgumentTypeError(f"bad value for {name}: {value!r}")
+
+
+def make_jobs(games, cars, difficulties, policies, first_seed):
+    """Job table with one row per (car, difficulty, policy, seed)"""
+    rows = [(first_seed + game, car, difficulty, POLICY_NAMES.index(policy), 0, 0, 0)
+            for car in cars for difficulty in difficulties for policy in policies for game in range(games)]
+    return numpy.array(rows, dtype=RESULT_DTYPE)
+
+
+def run_batch(jobs, max_ticks, workers, overrides, chunk_size=None):
+    """Play every job across a process pool and return the filled-in table"""
+    memory = shared_memory.SharedMemory(create=True, size=max(1, jobs.nbytes))
+    try:
+        results = numpy.ndarray(len(jobs), dtype=RESULT_DTYPE, buffer=memory.buf)
+        results[:] = jobs
+        # Several chunks per worker, so a worker stuck with long games doesn't hold up the end of the batch
+        chunk_size = chunk_size or max(1, len(jobs) // (workers * 8))
+        with ProcessPoolExecutor(workers, initializer=init_worker,
+                                 initargs=(memory.name, len(jobs), overrides)) as pool:
+            futures = [pool.submit(run_rows, start, min(start + chunk_size, len(jobs)), max_ticks)
+                       for start in range(0, len(jobs), chunk_size)]
+            for future in futures:
+                future.result()
+        return results.copy()
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def summarize(results):
+    """One line per (car, difficulty, policy) with mean score, survival and crash causes"""
+    lines = []
+    keys = numpy.unique(results[["car", "difficulty", "policy"]])
+    for car, difficulty, policy in keys.tolist():
+        group = results[(results["car"] == car) & (results["difficulty"] == difficulty) &
+                        (results["policy"] == policy)]
+        causes = numpy.bincount(group["cause"], minlength=len(CAUSES)) / len(group)
+        lines.append(f"{simulation.car_types[car]['name']:7} difficulty {difficulty}  {POLICY_NAMES[policy]:9} "
+                     f"{len(group):6} games   score {group['score'].mean():8.1f}   "
+                     f"survived {group['ticks'].mean() / simulation.TICK_RATE:6.1f}s   " +
+                     "   ".join(f"{cause} {share:5.1%}" for cause, share in zip(CAUSES, causes)))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play many headless games in parallel")
+    parser.add_argument("--games", type=int, default=100, help="seeds played by each configuration")
+    parser.add_argument("--seed", type=int, default=0, help="first seed")
+    parser.add_argument("--cars", type=int, nargs="+", default=list(range(len(simulation.car_types))),
+                        help="car type indices")
+    parser.add_argument("--difficulties", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--policies", nargs="+", choices=POLICY_NAMES, default=["throttle", "cautious"])
+    parser.add_argument("--max-ticks", type=int, default=3 * 60 * simulation.TICK_RATE,
+                        help="games still running after this many ticks end with the time limit")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--set", dest="overrides", type=parse_override, action="append", default=[],
+                        metavar="NAME=VALUE", help="override a simulation constant for every game")
+    parser.add_argument("--output", help="save the result table here as a .npy file")
+    options = parser.parse_args()
+
+    overrides = dict(options.overrides)
+    apply_overrides(overrides)  # so the summary sees overridden car_types too
+    jobs = make_jobs(options.games, options.cars, options.difficulties, options.policies, options.seed)
+    start = time.perf_counter()
+    results = run_batch(jobs, options.max_ticks, options.workers, overrides)
+    seconds = time.perf_counter() - start
+
+    for line in summarize(results):
+        print(line)
+    ticks = int(results["ticks"].sum())
+    print(f"{len(results)} games, {ticks} ticks in {seconds:.1f}s on {options.workers} workers "
+          f"({ticks / seconds:.0f} ticks/s)")
+    if options.output:
+        numpy.save(options.output, results)
+        print(f"Results written to {options.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""Headless benchmark suite for the racing game.
+
+Each scenario runs racing_game.py in its own process with SDL's dummy video
+and audio drivers, playing one scripted game for a fixed number of uncapped
+frames. Results are printed, written as JSON and compared against a stored
+baseline; any scenario that got slower or bigger than the tolerances allow
+fails the run, and so does a missing baseline unless --save-baseline makes it.
+
+    python benchmark.py                      # run every scenario, compare with the baseline
+    python benchmark.py --save-baseline      # store the results as the new baseline
+    python benchmark.py traffic-500 reverse  # run some scenarios only
+    python benchmark.py --replay game.rep    # add a recorded game as a "replay" scenario
+
+Every scenario is seeded, so reruns see the same traffic.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+GAME_DIR = os.path.dirname(os.path.abspath(__file__))
+GAME = os.path.join(GAME_DIR, "racing_game.py")
+BASELINE = os.path.join(GAME_DIR, "benchmark_baseline.json")
+SEED = 1
+
+# Scenario name -> racing_game.py arguments
+SCENARIOS = {
+    "day": ["--background", "0", "--hold", "up"],
+    "sunset": ["--background", "1", "--hold", "up"],
+    "night": ["--background", "2", "--hold", "up"],
+    "easy": ["--difficulty", "1", "--hold", "up"],
+    "medium": ["--difficulty", "2", "--hold", "up"],
+    "hard": ["--difficulty", "3", "--hold", "up"],
+    "traffic-10": ["--traffic", "10"],
+    "traffic-100": ["--traffic", "100"],
+    "traffic-500": ["--traffic", "500"],
+    "particles-10k": ["--hold", "up", "--particles", "10000"],
+    "top-gear": ["--hold", "up", "--gear", "5"],
+    "reverse": ["--hold", "down"],
+    "dirty-rects": ["--hold", "up", "--dirty-rects"],
+    "low-res": ["--hold", "up", "--low-res"],
+}
+
+# How much worse than the baseline a result may get, as a fraction
+TOLERANCES = {
+    "fps": 0.10,
+    "p95": 0.15,
+    "p99": 0.25,
+    "peak_memory_kb": 0.15,
+    "first_frame_ms": 0.50,  # startup is noisy, dominated by imports and opening the display
+}
+
+
+def run_scenario(name, frames, warmup, directory):
+    """Play one scenario in a fresh process and return its report"""
+    report = os.path.join(directory, f"{name}.json")
+    command = [sys.executable, GAME,
+               "--benchmark-frames", str(frames),
+               "--benchmark-warmup", str(warmup),
+               "--benchmark-report", report,
+               "--profile-csv", os.path.join(directory, f"{name}.csv"),
+               "--scores", os.path.join(directory, f"{name}.db"),  # never the cabinet's leaderboard
+               "--seed", str(SEED)] + SCENARIOS[name]
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy")
+    completed = subprocess.run(command, env=env, cwd=directory, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"scenario {name} failed:\n{completed.stderr}")
+    with open(report) as f:
+        return json.load(f)
+
+
+def regressions(result, baseline):
+    """Descriptions of every way a result is worse than its baseline"""
+    problems = []
+    if result["fps"] < baseline["fps"] * (1 - TOLERANCES["fps"]):
+        problems.append(f"fps {result['fps']:.1f} < baseline {baseline['fps']:.1f}")
+    for percentile in ("p95", "p99"):
+        value = result["frame_ms"][percentile]
+        limit = baseline["frame_ms"][percentile]
+        if value > limit * (1 + TOLERANCES[percentile]):
+            problems.append(f"{percentile} frame time {value:.2f} ms > baseline {limit:.2f} ms")
+    memory = result.get("peak_memory_kb")
+    limit = baseline.get("peak_memory_kb")
+    if memory and limit and memory > limit * (1 + TOLERANCES["peak_memory_kb"]):
+        problems.append(f"peak memory {memory / 1024:.1f} MB > baseline {limit / 1024:.1f} MB")
+    startup = result.get("first_frame_ms")
+    limit = baseline.get("first_frame_ms")
+    if startup and limit and startup > limit * (1 + TOLERANCES["first_frame_ms"]):
+        problems.append(f"first frame after {startup:.0f} ms > baseline {limit:.0f} ms")
+    return problems
+
+
+def format_result(name, result):
+    frame = result["frame_ms"]
+    memory = result.get("peak_memory_kb")
+    memory = f"{memory / 1024:7.1f} MB" if memory else "      n/a"
+    return (f"{name:13} {result['fps']:8.1f} fps   p50 {frame['p50']:6.2f}   p95 {frame['p95']:6.2f}   "
+            f"p99 {frame['p99']:6.2f} ms   peak {memory}   first frame {result.get('first_frame_ms', 0):5.0f} ms   "
+            f"cars {result.get('traffic', 0):4} ({result.get('traffic_on_screen', 0)} on screen)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the racing game benchmarks")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--replay", metavar="FILE", help="also benchmark this recorded game (see replay.py)")
+    parser.add_argument("--frames", type=int, default=600, help="measured frames per scenario")
+    parser.add_argument("--warmup", type=int, default=60, help="frames played before measuring")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the results")
+    parser.add_argument("--baseline", default=BASELINE, help="results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    options = parser.parse_args()
+    if options.replay:
+        SCENARIOS["replay"] = ["--replay", os.path.abspath(options.replay)]
+
+    unknown = [name for name in options.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in options.scenarios or SCENARIOS:
+            results[name] = run_scenario(name, options.frames, options.warmup, directory)
+            print(format_result(name, results[name]), flush=True)
+
+    with open(options.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {options.output}")
+
+    if options.save_baseline:
+        baseline = {}
+        if os.path.exists(options.baseline):
+            with open(options.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(options.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline saved to {options.baseline}")
+        return 0
+
+    if not os.path.exists(options.baseline):
+        print(f"No baseline at {options.baseline}; run with --save-baseline to create one")
+        return 1
+    with open(options.baseline) as f:
+        baseline = json.load(f)
+
+    failed = False
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name}: no baseline")
+            continue
+        for problem in regressions(result, baseline[name]):
+            print(f"REGRESSION {name}: {problem}")
+            failed = True
+    if failed:
+        return 1
+    print("No regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Uniform-grid broad phase for the racing game.
+
+Boxes are bucketed into fixed-size cells over the road area, so a query only
+runs the exact overlap test against the few boxes in nearby cells instead of
+against every car on the road.
+"""
+import numpy
+
+
+def boxes_overlap(x, y, width, height, other_x, other_y, other_width, other_height):
+    """Same test as pygame.Rect.colliderect, broadcast over arrays"""
+    return ((x < other_x + other_width) & (other_x < x + width) &
+            (y < other_y + other_height) & (other_y < y + height))
+
+
+class UniformGrid:
+    """Spatial hash of axis-aligned boxes over a fixed area; boxes outside it land in the border cells
+
+    Each box is stored once, in the cell holding its top-left corner. Queries
+    widen their cell range up and left by the largest box extent (in cells)
+    so boxes reaching in from neighbouring cells are still found.
+    """
+
+    def __init__(self, x, y, width, height, cell_width, cell_height):
+        self.x = x
+        self.y = y
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.columns = max(1, int(numpy.ceil(width / cell_width)))
+        self.rows = max(1, int(numpy.ceil(height / cell_height)))
+        self._cell_keys = numpy.arange(self.columns * self.rows + 1)
+        self.box_x = self.box_y = self.box_width = self.box_height = numpy.zeros(0)
+        self.clear()
+
+    def clear(self):
+        """Empty every cell"""
+        self.cell_ids = numpy.zeros(0, dtype=numpy.intp)
+        self.cell_start = numpy.zeros(self.columns * self.rows + 1, dtype=numpy.intp)
+        self.reach_columns = self.reach_rows = 0
+
+    def _cell(self, value, origin, size, limit):
+        cell = (value - origin) // size
+        return 0 if cell < 0 else limit if cell > limit else int(cell)
+
+    def rebuild(self, x, y, width, height, active=None):
+        """Re-bucket the boxes (only the active ones, if a mask is given); query indices refer to these arrays"""
+        self.box_x, self.box_y, self.box_width, self.box_height = x, y, width, height
+        ids = numpy.arange(len(x)) if active is None else numpy.flatnonzero(active)
+        if not len(ids):
+            self.clear()
+            return
+
+        columns = ((x[ids] - self.x) // self.cell_width).astype(numpy.intp)
+        rows = ((y[ids] - self.y) // self.cell_height).astype(numpy.intp)
+        numpy.clip(columns, 0, self.columns - 1, out=columns)
+        numpy.clip(rows, 0, self.rows - 1, out=rows)
+        keys = rows * self.columns + columns
+
+        order = numpy.argsort(keys, kind="stable")
+        self.cell_ids = ids[order]
+        self.cell_start = numpy.searchsorted(keys[order], self._cell_keys)
+        self.reach_columns = int(numpy.ceil(width[ids].max() / self.cell_width))
+        self.reach_rows = int(numpy.ceil(height[ids].max() / self.cell_height))
+
+    def query(self, x, y, width, height):
+        """Indices of the boxes in cells near the given box (candidates only, not overlap-tested)"""
+        column0 = self._cell(x, self.x, self.cell_width, self.columns - 1)
+        column1 = self._cell(x + width - 1, self.x, self.cell_width, self.columns - 1)
+        row0 = self._cell(y, self.y, self.cell_height, self.rows - 1)
+        row1 = self._cell(y + height - 1, self.y, self.cell_height, self.rows - 1)
+        column0 = max(0, column0 - self.reach_columns)
+        row0 = max(0, row0 - self.reach_rows)
+
+        # Cells are stored row-major, so each row of the range is one contiguous slice
+        slices = []
+        for row in range(row0, row1 + 1):
+            start = self.cell_start[row * self.columns + column0]
+            end = self.cell_start[row * self.columns + column1 + 1]
+            if end > start:
+                slices.append(self.cell_ids[start:end])
+        if not slices:
+            return self.cell_ids[:0]
+        return slices[0] if len(slices) == 1 else numpy.concatenate(slices)
+
+    def first_hit(self, x, y, width, height):
+        """Index of the first box overlapping the given box, or -1"""
+        for i in self.query(x, y, width, height).tolist():
+            if boxes_overlap(x, y, width, height, self.box_x[i], self.box_y[i], self.box_width[i], self.box_height[i]):
+                return i
+        return -1
+
+    def overlapping_pairs(self):
+        """Sorted list of (i, j) index pairs, i < j, of boxes that overlap each other"""
+        pairs = []
+        for i in self.cell_ids.tolist():
+            box = (self.box_x[i], self.box_y[i], self.box_width[i], self.box_height[i])
+            for j in self.query(*box).tolist():
+                if j != i and boxes_overlap(*box, self.box_x[j], self.box_y[j], self.box_width[j], self.box_height[j]):
+                    pairs.append((min(i, j), max(i, j)))
+        return sorted(set(pairs))
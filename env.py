@@ -0,0 +1,349 @@
+"""Vectorized, Gym-style environment over the headless racing simulation.
+
+VecRacingEnv runs N independent games in lockstep. reset() and step(actions)
+fill preallocated NumPy batches in place:
+
+- obs: float32 (N, OBS_SIZE), the player's lateral position, speed, gear and
+  heading, then the NEARBY_CARS closest traffic cars relative to the player
+- pixels (optional): uint8 (N, height, width, 3). Each game draws straight
+  into its slice of this array through a pygame Surface wrapping that
+  memory, at whatever size is asked for, so frames are never copied
+- rewards, terminated, truncated: (N,)
+
+An action is an input bitmask (simulation.INPUT_UP | INPUT_LEFT, ...), so
+there are ACTION_COUNT discrete actions. The reward is the score gained,
+minus crash_penalty on a crash. Finished games restart on the next step with
+a fresh seed; their final score and length are reported in the infos.
+Games keep traffic only SMALL_TRAFFIC_MARGIN rows past the screen edges
+rather than the game's whole traffic area, which would cost most of the
+throughput for cars the observations never see.
+
+With workers > 0 the games are split across processes that share the
+batches through shared memory, for throughput beyond one core.
+
+    env = VecRacingEnv(64, pixels=(84, 84))
+    obs, infos = env.reset()
+    obs, rewards, terminated, truncated, infos = env.step(actions)
+"""
+import math
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy
+
+from simulation import (GameState, step, car_types, max_gear, traffic_colors, SCREEN_WIDTH, SCREEN_HEIGHT,
+                        TICK_RATE, SMALL_TRAFFIC_MARGIN, road_line_width, road_line_height, road_line_gap, road_rows,
+                        row_indices, road_at,
+                        INPUT_UP, INPUT_DOWN, INPUT_LEFT, INPUT_RIGHT, INPUT_SHIFT_UP, INPUT_SHIFT_DOWN)
+
+ACTION_COUNT = (INPUT_UP | INPUT_DOWN | INPUT_LEFT | INPUT_RIGHT | INPUT_SHIFT_UP | INPUT_SHIFT_DOWN) + 1
+NEARBY_CARS = 8
+CAR_FEATURES = 5  # present, dx, dy, speed, direction
+OBS_SIZE = 5 + NEARBY_CARS * CAR_FEATURES
+MAX_SPEED = max(car_type["max_speed"] for car_type in car_types)
+ROAD_SAMPLE = 20  # rows between the points of the road outline in pixel observations
+
+# Pixel observation colors
+GRASS_COLOR = (34, 139, 34)
+ROAD_COLOR = (50, 50, 50)
+LINE_COLOR = (255, 255, 255)
+PLAYER_COLOR = (0, 255, 255)
+
+
+def observe(state, out):
+    """Write the state observation of one game into out (a float32 row of OBS_SIZE)"""
+    car_type = state.car_type
+    center_x = state.car_x + car_type["width"] / 2
+    center_y = state.car_y + car_type["height"] / 2
+    angle = math.radians(state.car_rotation)
+    road_center, road_width, _ = road_at(state, center_y)
+    out[:5] = ((center_x - road_center) / (road_width / 2), state.car_speed / MAX_SPEED,
+               state.current_gear / max_gear, math.sin(angle), math.cos(angle))
+
+    cars = out[5:].reshape(NEARBY_CARS, CAR_FEATURES)
+    cars[:] = 0
+    traffic = state.traffic
+    live = slice(0, traffic.count)
+    if not traffic.count:
+        return
+    dx = traffic.x[live] + traffic.width[live] / 2 - center_x
+    dy = traffic.y[live] + traffic.height[live] / 2 - center_y
+    nearest = numpy.argsort(dx * dx + dy * dy)[:NEARBY_CARS]
+    count = len(nearest)
+    cars[:count, 0] = 1
+    cars[:count, 1] = dx[nearest] / road_width
+    cars[:count, 2] = dy[nearest] / SCREEN_HEIGHT
+    cars[:count, 3] = traffic.speed[live][nearest] / 3
+    cars[:count, 4] = traffic.direction[live][nearest]
+
+
+class PixelRenderer:
+    """Draws flat-colored game frames into slices of a uint8 (N, height, width, 3) array"""
+
+    def __init__(self, frames):
+        import pygame  # only needed for pixel observations
+        self.pygame = pygame
+        self.height, self.width = frames.shape[1:3]
+        self.surfaces = [pygame.image.frombuffer(frame, (self.width, self.height), "RGB") for frame in frames]
+        self.scale_x = self.width / SCREEN_WIDTH
+        self.scale_y = self.height / SCREEN_HEIGHT
+        # Screen rows the road outline goes through, as road_rows() indices and in pixels
+        rows = numpy.arange(0, SCREEN_HEIGHT + ROAD_SAMPLE, ROAD_SAMPLE)
+        self.outline_rows = row_indices(rows)
+        self.outline_y = (rows * self.scale_y).tolist()
+        self.line_width = max(1, int(road_line_width * self.scale_x))
+
+    def _rect(self, x, y, width, height):
+        return (int(x * self.scale_x), int(y * self.scale_y),
+                max(1, int(width * self.scale_x)), max(1, int(height * self.scale_y)))
+
+    def draw(self, index, state):
+        draw_rect = self.pygame.draw.rect
+        surface = self.surfaces[index]
+        surface.fill(GRASS_COLOR)
+        center, width, lanes = road_rows(state)
+        middle = center[self.outline_rows]
+        half = width[self.outline_rows] / 2
+        left = ((middle - half) * self.scale_x).tolist()
+        right = ((middle + half) * self.scale_x).tolist()
+        self.pygame.draw.polygon(surface, ROAD_COLOR, list(zip(left, self.outline_y)) +
+                                 list(zip(right[::-1], self.outline_y[::-1])))
+
+        # Dashed lines between the lanes; a dash starts every period rows, in step with the track
+        period = road_line_height + road_line_gap
+        tops = numpy.arange(math.floor(state.distance) % period - period, SCREEN_HEIGHT, period)
+        count = len(tops)
+        ends = row_indices(numpy.concatenate([tops, tops + road_line_height]))  # tops, then bottoms
+        lane_width = width[ends] / lanes[ends]
+        left = center[ends] - width[ends] / 2
+        dividers = (numpy.minimum(lanes[ends[:count]], lanes[ends[count:]]) - 1).tolist()
+        y = (tops * self.scale_y).tolist()
+        height = road_line_height * self.scale_y
+        for divider in range(1, max(dividers) + 1):
+            x = ((left + divider * lane_width) * self.scale_x).tolist()
+            for i in range(count):
+                if dividers[i] >= divider:
+                    self.pygame.draw.line(surface, LINE_COLOR, (x[i], y[i]), (x[count + i], y[i] + height),
+                                          self.line_width)
+
+        # Only the cars on the screen; the traffic area runs on past both edges
+        traffic = state.traffic
+        y = traffic.y[:traffic.count]
+        shown = numpy.flatnonzero((y > -traffic.height[:traffic.count]) & (y < SCREEN_HEIGHT))
+        for x, y, width, height, color in zip(traffic.x[shown].tolist(), traffic.y[shown].tolist(),
+                                              traffic.width[shown].tolist(), traffic.height[shown].tolist(),
+                                              traffic.color[shown].tolist()):
+            draw_rect(surface, traffic_colors[color], self._rect(x, y, width, height))
+
+        # The player as a rotated rectangle
+        car_type = state.car_type
+        half_width = car_type["width"] / 2
+        half_height = car_type["height"] / 2
+        center_x = state.car_x + half_width
+        center_y = state.car_y + half_height
+        angle = math.radians(state.car_rotation)
+        cos_a = math.cos(angle)
+        sin_a = math.sin(angle)
+        corners = [((center_x + dx * cos_a + dy * sin_a) * self.scale_x,
+                    (center_y - dx * sin_a + dy * cos_a) * self.scale_y)
+                   for dx, dy in ((-half_width, -half_height), (half_width, -half_height),
+                                  (half_width, half_height), (-half_width, half_height))]
+        self.pygame.draw.polygon(surface, PLAYER_COLOR, corners)
+
+
+class _EnvBatch:
+    """Runs games [first, first + count) of a VecRacingEnv, writing into the shared batches"""
+
+    def __init__(self, arrays, first, count, num_envs, difficulty, car_index, seed, max_ticks, crash_penalty,
+                 frame_skip):
+        envs = slice(first, first + count)
+        self.arrays = {name: array[envs] for name, array in arrays.items()}
+        self.first = first
+        self.count = count
+        self.num_envs = num_envs
+        self.difficulty = difficulty
+        self.car_index = car_index
+        self.max_ticks = max_ticks
+        self.crash_penalty = crash_penalty
+        self.frame_skip = frame_skip
+        self.renderer = PixelRenderer(self.arrays["pixels"]) if "pixels" in self.arrays else None
+        self.seed = seed
+        self.episodes = numpy.zeros(count, dtype=numpy.int64)
+        self.states = [None] * count
+        self.spares = [None] * count
+
+    def _new_game(self, i):
+        # Every game of every env gets its own seed
+        seed = self.seed + self.first + i + int(self.episodes[i]) * self.num_envs
+        self.episodes[i] += 1
+        self.states[i] = GameState(self.car_index, self.difficulty, seed=seed, traffic_margin=SMALL_TRAFFIC_MARGIN)
+        self.spares[i] = None
+
+    def _write(self, i):
+        state = self.states[i]
+        observe(state, self.arrays["obs"][i])
+        if self.renderer is not None:
+            self.renderer.draw(i, state)
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seed = seed
+            self.episodes[:] = 0
+        for i in range(self.count):
+            self._new_game(i)
+            self._write(i)
+        self.arrays["score"][:] = 0
+        self.arrays["game_time"][:] = 0
+
+    def step(self):
+        arrays = self.arrays
+        actions = arrays["actions"].tolist()
+        rewards = arrays["rewards"]
+        terminated = arrays["terminated"]
+        truncated = arrays["truncated"]
+        for i in range(self.count):
+            state = self.states[i]
+            spare = self.spares[i]
+            score = state.score
+            for _ in range(self.frame_skip):
+                state, spare = step(state, actions[i], spare), state
+                if state.game_over:
+                    break
+            self.spares[i] = spare
+            self.states[i] = state
+            rewards[i] = state.score - score - (self.crash_penalty if state.game_over else 0)
+            terminated[i] = state.game_over
+            truncated[i] = not state.game_over and state.game_time >= self.max_ticks
+            arrays["score"][i] = state.score
+            arrays["game_time"][i] = state.game_time
+            if terminated[i] or truncated[i]:
+                self._new_game(i)
+            self._write(i)
+
+
+def _worker(connection, memory_name, layout, batch_args):
+    # Worker process: owns a slice of the games and serves reset/step/close commands
+    memory = shared_memory.SharedMemory(name=memory_name)
+    batch = _EnvBatch(_arrays_in(memory.buf, layout), *batch_args)
+    while True:
+        command, argument = connection.recv()
+        if command == "reset":
+            batch.reset(argument)
+        elif command == "step":
+            batch.step()
+        else:
+            break
+        connection.send(None)
+    del batch  # drop the views into the shared block so it can be closed
+    memory.close()
+
+
+def _layout(num_envs, pixels):
+    # (name, dtype, shape, offset) of every batch array, packed into one block
+    specs = [("actions", numpy.int64, (num_envs,)),
+             ("obs", numpy.float32, (num_envs, OBS_SIZE)),
+             ("rewards", numpy.float32, (num_envs,)),
+             ("terminated", numpy.bool_, (num_envs,)),
+             ("truncated", numpy.bool_, (num_envs,)),
+             ("score", numpy.int64, (num_envs,)),
+             ("game_time", numpy.int64, (num_envs,))]
+    if pixels is not None:
+        specs.append(("pixels", numpy.uint8, (num_envs, pixels[1], pixels[0], 3)))
+    layout = []
+    offset = 0
+    for name, dtype, shape in specs:
+        offset = -(-offset // 64) * 64  # align every array to a cache line
+        layout.append((name, dtype, shape, offset))
+        offset += numpy.dtype(dtype).itemsize * math.prod(shape)
+    return layout, offset
+
+
+def _arrays_in(buffer, layout):
+    return {name: numpy.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+            for name, dtype, shape, offset in layout}
+
+
+class VecRacingEnv:
+    """N racing games stepped in lockstep, with batched observations"""
+
+    def __init__(self, num_envs, difficulty=1, car_index=0, seed=0, max_ticks=3 * 60 * TICK_RATE,
+                 crash_penalty=100, frame_skip=1, pixels=None, workers=0):
+        self.num_envs = num_envs
+        self.pixels = pixels
+        layout, size = _layout(num_envs, pixels)
+        self._memory = None
+        self._connections = []
+        self._processes = []
+        if workers:
+            self._memory = shared_memory.SharedMemory(create=True, size=size)
+            self._arrays = _arrays_in(self._memory.buf, layout)
+        else:
+            self._arrays = _arrays_in(bytearray(size), layout)
+        batch_args = (num_envs, difficulty, car_index, seed, max_ticks, crash_penalty, frame_skip)
+
+        self.obs = self._arrays["obs"]
+        self.frames = self._arrays.get("pixels")
+        self.rewards = self._arrays["rewards"]
+        self.terminated = self._arrays["terminated"]
+        self.truncated = self._arrays["truncated"]
+
+        if not workers:
+            self._batch = _EnvBatch(self._arrays, 0, num_envs, *batch_args)
+            return
+        # Contiguous slices of games, as even as possible
+        bounds = numpy.linspace(0, num_envs, min(workers, num_envs) + 1).astype(int)
+        for first, last in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_worker, daemon=True,
+                                              args=(child, self._memory.name, layout,
+                                                    (first, last - first) + batch_args))
+            process.start()
+            self._connections.append(parent)
+            self._processes.append(process)
+
+    def _command(self, command, argument=None):
+        if not self._connections:
+            if command == "reset":
+                self._batch.reset(argument)
+            else:
+                self._batch.step()
+            return
+        for connection in self._connections:
+            connection.send((command, argument))
+        for connection in self._connections:
+            connection.recv()
+
+    def _infos(self):
+        return {"score": self._arrays["score"], "game_time": self._arrays["game_time"]}
+
+    def reset(self, seed=None):
+        """Start a new game in every env; returns (obs, infos)"""
+        self._command("reset", seed)
+        return self.obs, self._infos()
+
+    def step(self, actions):
+        """Apply one input bitmask per env; returns (obs, rewards, terminated, truncated, infos)
+
+        The returned arrays are reused by the next call. For envs that just
+        finished, obs is the first observation of their next game and infos
+        holds the final score and game_time of the one that ended.
+        """
+        self._arrays["actions"][:] = actions
+        self._command("step")
+        return self.obs, self.rewards, self.terminated, self.truncated, self._infos()
+
+    def close(self):
+        for connection in self._connections:
+            connection.send(("close", None))
+        for process in self._processes:
+            process.join()
+        self._connections = []
+        self._processes = []
+        if self._memory is not None:
+            self._arrays = self.obs = self.frames = self.rewards = self.terminated = self.truncated = None
+            self._memory.unlink()
+            try:
+                self._memory.close()
+            except BufferError:
+                pass  # the caller still holds batch arrays; the mapping goes when they do
+            self._memory = None
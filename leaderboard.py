@@ -0,0 +1,215 @@
+"""Persistent leaderboard for the racing game.
+
+Every finished run is appended to a SQLite table in WAL mode: score, car,
+difficulty, game time (in ticks) and when it was played. Rows are never
+updated or deleted (triggers refuse it), so the table is a log of every run
+on this cabinet. An index on (car, difficulty, score, game_time, timestamp)
+finds the best runs of one car and difficulty, in the order the heaps rank
+them, without reading the others, however many are stored.
+
+The game never waits on the database. load() reads the top TOP_N runs of
+each car and difficulty into min-heaps (on the asset loader's thread), and
+record() pushes a run onto its heap and queues it for a writer thread that
+inserts queued runs in batches. top() and best() are answered from the
+heaps, so the game over screen has the new run in its table at once.
+
+    python leaderboard.py                           # best runs of every car and difficulty
+    python leaderboard.py --car Sports --difficulty 3 --top 20
+    python leaderboard.py --fill 1000000            # add random runs, to time queries on a big store
+"""
+import argparse
+import heapq
+import os
+import queue
+import random
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scores.db")
+TOP_N = 10  # runs kept in memory per car and difficulty
+BATCH_SIZE = 256  # most runs the writer inserts in one transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    score INTEGER NOT NULL,
+    car TEXT NOT NULL,
+    difficulty INTEGER NOT NULL,
+    game_time INTEGER NOT NULL,
+    timestamp REAL NOT NULL
+);
+DROP INDEX IF EXISTS runs_by_score;
+CREATE INDEX IF NOT EXISTS runs_by_rank ON runs (car, difficulty, score DESC, game_time DESC, timestamp DESC);
+CREATE TRIGGER IF NOT EXISTS runs_no_update BEFORE UPDATE ON runs
+    BEGIN SELECT RAISE(ABORT, 'runs are append-only'); END;
+CREATE TRIGGER IF NOT EXISTS runs_no_delete BEFORE DELETE ON runs
+    BEGIN SELECT RAISE(ABORT, 'runs are append-only'); END;
+"""
+INSERT = "INSERT INTO runs (score, car, difficulty, game_time, timestamp) VALUES (?, ?, ?, ?, ?)"
+# Ranked like the heaps' (score, game_time, timestamp) tuples, so ties come back in the same order after a reload
+TOP_QUERY = ("SELECT score, game_time, timestamp FROM runs WHERE car = ? AND difficulty = ? "
+             "ORDER BY score DESC, game_time DESC, timestamp DESC LIMIT ?")
+
+_STOP = None  # queued by close() after the last run
+
+
+def connect(path):
+    """Open the database in WAL mode, creating the table if it is new"""
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent; a power cut may lose the last runs
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class Leaderboard:
+    """The best runs of each car and difficulty in memory, with every run written behind them to SQLite"""
+
+    def __init__(self, path=DEFAULT_PATH, size=TOP_N):
+        self.path = path
+        self.size = size
+        self._heaps = {}  # (car, difficulty) -> min-heap of (score, game_time, timestamp)
+        self._lock = threading.Lock()  # guards _heaps, which the loader fills while the game reads
+        self._queue = queue.Queue()
+        self._thread = None
+        self.errors = []  # database errors, which cost the runs they hit but never the game
+
+    def load(self, keys):
+        """Read the best runs of each (car, difficulty) in keys and start the writer thread"""
+        try:
+            connection = connect(self.path)
+            try:
+                tops = {key: connection.execute(TOP_QUERY, (*key, self.size)).fetchall() for key in keys}
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            self.errors.append(f"{self.path}: {e}")
+            return
+        with self._lock:
+            for key, runs in tops.items():
+                # Merge, in case runs were recorded before the load finished
+                heap = self._heaps.setdefault(key, [])
+                for run in runs:
+                    self._push(heap, run)
+        self._thread = threading.Thread(target=self._write, name="leaderboard writer", daemon=True)
+        self._thread.start()
+
+    def _push(self, heap, run):
+        # Keep the `size` best runs; a run that ties the worst one kept loses to it
+        if len(heap) < self.size:
+            heapq.heappush(heap, run)
+        elif run > heap[0]:
+            heapq.heapreplace(heap, run)
+
+    def record(self, score, car, difficulty, game_time):
+        """Add a finished run and return it as (score, game_time, timestamp), as top() lists it"""
+        run = (score, game_time, time.time())
+        with self._lock:
+            self._push(self._heaps.setdefault((car, difficulty), []), run)
+        self._queue.put((score, car, difficulty, game_time, run[2]))
+        return run
+
+    def top(self, car, difficulty, count=None):
+        """The best runs of a car and difficulty, best first"""
+        with self._lock:
+            runs = sorted(self._heaps.get((car, difficulty), ()), reverse=True)
+        return runs[:count]
+
+    def best(self):
+        """The best score of any car and difficulty, or 0"""
+        with self._lock:
+            return max((max(heap)[0] for heap in self._heaps.values() if heap), default=0)
+
+    def _write(self):
+        # Writer thread: insert the queued runs, as many as are waiting in one transaction
+        connection = None
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                stopping = True
+                batch = [run for run in batch if run is not _STOP]
+            if not batch:
+                continue
+            try:
+                if connection is None:
+                    connection = connect(self.path)
+                with connection:
+                    connection.executemany(INSERT, batch)
+            except sqlite3.Error as e:
+                self.errors.append(f"{self.path}: {e}")
+        if connection is not None:
+            connection.close()
+
+    def close(self):
+        """Write the runs still queued and stop the writer"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+
+def fill(path, count, keys, seed):
+    """Append `count` random runs spread over keys, for trying queries on a big store"""
+    rng = random.Random(seed)
+    now = time.time()
+    connection = connect(path)
+    with connection:
+        connection.executemany(INSERT, ((int(rng.expovariate(1 / 5000)), *rng.choice(keys),
+                                         rng.randrange(60, 60 * 600), now - rng.uniform(0, 3e7))
+                                        for _ in range(count)))
+    connection.close()
+
+
+def format_run(rank, run, tick_rate):
+    score, game_time, timestamp = run
+    seconds = game_time // tick_rate
+    return (f"{rank:2}. {score:8}   {seconds // 60:3}:{seconds % 60:02}   "
+            f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp))}")
+
+
+def main(argv=None):
+    from simulation import car_types, TICK_RATE  # only the command line needs the game's cars
+
+    parser = argparse.ArgumentParser(description="Show the racing game's best runs")
+    parser.add_argument("--scores", default=DEFAULT_PATH, help="the score database")
+    parser.add_argument("--car", choices=[car["name"] for car in car_types], help="only this car")
+    parser.add_argument("--difficulty", type=int, choices=[1, 2, 3], help="only this difficulty")
+    parser.add_argument("--top", type=int, default=TOP_N, help="runs to show per car and difficulty")
+    parser.add_argument("--fill", type=int, metavar="COUNT", help="first append this many random runs")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the --fill runs")
+    args = parser.parse_args(argv)
+
+    cars = [args.car] if args.car else [car["name"] for car in car_types]
+    difficulties = [args.difficulty] if args.difficulty else [1, 2, 3]
+    keys = [(car, difficulty) for car in cars for difficulty in difficulties]
+    if args.fill:
+        start = time.perf_counter()
+        fill(args.scores, args.fill, keys, args.seed)
+        print(f"Appended {args.fill} runs in {time.perf_counter() - start:.1f}s")
+
+    leaderboard = Leaderboard(args.scores, args.top)
+    start = time.perf_counter()
+    leaderboard.load(keys)
+    loaded = time.perf_counter() - start
+    leaderboard.close()
+    if leaderboard.errors:
+        sys.exit("\n".join(leaderboard.errors))
+    for car, difficulty in keys:
+        runs = leaderboard.top(car, difficulty)
+        print(f"{car}, difficulty {difficulty}: {len(runs) or 'no'} runs")
+        for rank, run in enumerate(runs, 1):
+            print("  " + format_run(rank, run, TICK_RATE))
+    print(f"Loaded the top {args.top} of {len(keys)} tables in {loaded * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Background asset loading for the racing game.
+
+Jobs run one at a time on a worker thread, lowest priority number first and
+in the order they were added within a priority, while the main loop keeps
+drawing and handling events. The game queues what its menus need at MENU
+priority and everything else at GAME priority, opens the menus once the
+MENU jobs are done and lets the GAME jobs finish behind them.
+
+Jobs fill the game's caches through the same functions the main thread uses
+on a cache miss, so anything not loaded yet is simply made on demand.
+"""
+import itertools
+import queue
+import threading
+
+MENU = 0
+GAME = 1
+_STOP = -1  # sorts before every job, so close() only waits for the job in progress
+
+
+class AssetLoader:
+    """Runs queued loading jobs on one worker thread and tracks their progress"""
+
+    def __init__(self):
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()  # keeps jobs of one priority in order, and never compares the functions
+        self._done = threading.Condition()
+        self._total = {}  # jobs added, per priority
+        self._finished = {}  # jobs done, per priority
+        self._thread = None
+        self.errors = []  # "name: error" for each job that failed
+
+    def add(self, priority, name, load):
+        """Queue load() to be called on the worker thread"""
+        with self._done:
+            self._total[priority] = self._total.get(priority, 0) + 1
+            self._finished.setdefault(priority, 0)
+        self._queue.put((priority, next(self._order), name, load))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="asset loader", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            priority, _, name, load = self._queue.get()
+            if priority == _STOP:
+                return
+            try:
+                load()
+            except Exception as e:  # a broken asset must not stop the others; it is made on demand instead
+                self.errors.append(f"{name}: {e}")
+            with self._done:
+                self._finished[priority] += 1
+                self._done.notify_all()
+
+    def _counts(self, priority):
+        # (done, total) over the jobs of this priority and all before it
+        priorities = [p for p in self._total if priority is None or p <= priority]
+        return sum(self._finished[p] for p in priorities), sum(self._total[p] for p in priorities)
+
+    def _all_done(self, priority):
+        done, total = self._counts(priority)
+        return done == total
+
+    def progress(self, priority=None):
+        """Fraction of the jobs (up to and including a priority) that are done"""
+        with self._done:
+            done, total = self._counts(priority)
+        return done / total if total else 1.0
+
+    def finished(self, priority=None):
+        """Whether every job (up to and including a priority) is done"""
+        with self._done:
+            return self._all_done(priority)
+
+    def wait(self, priority=None):
+        """Block until every job (up to and including a priority) is done"""
+        with self._done:
+            self._done.wait_for(lambda: self._all_done(priority))
+
+    def close(self):
+        """Stop the worker after the job in progress; jobs not started yet are dropped"""
+        if self._thread is not None:
+            self._queue.put((_STOP, next(self._order), None, None))
+            self._thread.join()
+            self._thread = None
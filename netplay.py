@@ -0,0 +1,695 @@
+"""Networked head-to-head races for the racing game.
+
+Two players race the same seed's track to the finish, RACE_DISTANCE rows
+along it. The server is authoritative: it keeps each player's game and
+advances it with step(), one tick for each input it receives from that
+player, in order. Every SNAPSHOT_INTERVAL ticks it sends each player a
+snapshot over UDP: the player's own game and where the opponent is. Both
+games start the same, but each player only meets the traffic of their own
+game; the opponent is drawn as a ghost.
+
+Clients predict. They step their own game as soon as they send a tick's
+inputs. When a snapshot arrives, they start from the server's state after
+the last input it applied and replay their newer inputs on top of it.
+Inputs are resent until the server has applied them, and it applies every
+one in order, so with a deterministic step() the replay lands exactly on
+the state already shown. Clients count any difference as a misprediction;
+one means the two ends have drifted apart.
+
+Snapshots are delta-compressed. The server encodes each snapshot against
+the newest one the client has acknowledged: every array is XORed bytewise
+with the baseline and split into byte planes, then the lot is compressed
+with zlib. Fields that did not change turn into runs of zeros, and values
+that changed a little turn into zeros in their high bytes. If no baseline
+is acknowledged, the snapshot is XORed with nothing, so it goes out whole.
+Nothing is rounded, so clients rebuild the server's state bit for bit.
+
+    python netplay.py server --port 7777 --traffic 100   # then: python racing_game.py --connect HOST:7777
+    python netplay.py loopback --traffic 300             # two bots race on a local server, with stats
+"""
+import argparse
+import collections
+import multiprocessing
+import random
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+import zlib
+
+import numpy
+
+from simulation import GameState, step, car_types, TICK_SECONDS, traffic_fields, tree_fields
+
+MAGIC = b"RGNP"
+VERSION = 4
+DEFAULT_PORT = 7777
+MAX_PACKET = 65507  # the largest UDP payload
+
+RACE_DISTANCE = 60000  # rows from the start to the finish, about a minute flat out
+SNAPSHOT_INTERVAL = 3  # server ticks between snapshots (20 a second)
+SNAPSHOT_HISTORY = 32  # snapshots kept on both ends as delta baselines
+MAX_STEPS_PER_TICK = 4  # inputs applied per player per server tick, so a lagging client catches up but no faster
+INPUT_WINDOW = 256  # inputs a client may send ahead of the ones the server has applied
+TIMEOUT = 5.0  # seconds without a packet before a player counts as gone
+LINGER = 1.0  # seconds the server keeps sending the result after a race
+BANDWIDTH_BUDGET = 1000  # snapshot bytes per server tick, per player, that the loopback test allows
+
+# Packet types
+HELLO, WELCOME, INPUTS, SNAPSHOT, QUIT = range(5)
+# Race status
+WAITING, RUNNING, OVER = range(3)
+DRAW = 0xFE
+NO_WINNER = 0xFF
+NO_BASE = 0xFFFFFFFF
+
+# magic, version, packet type
+HEADER = struct.Struct("<4sBB")
+# car index
+HELLO_PACKET = struct.Struct("<B")
+# player number, seed, difficulty, traffic kept on the road, race distance
+WELCOME_PACKET = struct.Struct("<BQBHI")
+# newest snapshot received, sequence number of the first input, number of inputs; then one byte per input
+INPUTS_PACKET = struct.Struct("<IIB")
+# snapshot number, baseline snapshot number, last input applied, race status, winner; then the opponent, then the delta
+SNAPSHOT_PACKET = struct.Struct("<IIIBB")
+# car index, car_x, distance, car_rotation, current_gear, car_speed, score, game over
+OPPONENT = struct.Struct("<BdddBdI?")
+MAX_INPUTS = 255
+
+# The scalar part of a player's game in a snapshot; the pools follow it as arrays
+SCALARS = struct.Struct("<dddBdQHIIBh")
+SCALAR_NAMES = ("car_x", "car_speed", "car_rotation", "current_gear", "distance", "rng", "tree_spawn_timer",
+                "score", "game_time", "game_over", "crash_slot")
+# live traffic, live trees
+COUNTS = struct.Struct("<HH")
+UNSIGNED = {1: numpy.uint8, 2: numpy.uint16, 4: numpy.uint32, 8: numpy.uint64}
+
+
+# Snapshots: a list of arrays, the packed scalars first and then each field of the live traffic and trees
+
+def capture(state):
+    """Snapshot of the parts of a state that step() reads"""
+    scalars = [getattr(state, name) for name in SCALAR_NAMES]
+    arrays = [numpy.frombuffer(SCALARS.pack(*scalars), dtype=numpy.uint8)]
+    for pool in (state.traffic, state.trees):
+        arrays += [getattr(pool, name)[:pool.count].copy() for name in pool.fields]
+    return arrays
+
+
+def restore(snapshot, template, into=None):
+    """A copy of `template` (a state of the same game) with the snapshot's contents, reusing `into` if given"""
+    state = template.copy(into)
+    for name, value in zip(SCALAR_NAMES, SCALARS.unpack(snapshot[0].tobytes())):
+        setattr(state, name, value)
+    state.game_over = bool(state.game_over)
+    arrays = iter(snapshot[1:])
+    for pool in (state.traffic, state.trees):
+        for name in pool.fields:
+            array = next(arrays)
+            getattr(pool, name)[:len(array)] = array
+        pool.count = len(array)
+        pool.high_water = max(pool.high_water, pool.count)
+    state.events = []
+    return state
+
+
+def snapshots_equal(a, b):
+    return len(a) == len(b) and all(numpy.array_equal(x, y) for x, y in zip(a, b))
+
+
+def _layout(traffic_count, tree_count):
+    # (dtype, length) of each array of a snapshot
+    return ([(numpy.dtype(numpy.uint8), SCALARS.size)] +
+            [(numpy.dtype(dtype), traffic_count) for dtype in traffic_fields.values()] +
+            [(numpy.dtype(dtype), tree_count) for dtype in tree_fields.values()])
+
+
+TRAFFIC_Y = 1 + list(traffic_fields).index("y")
+TRAFFIC_SPEED = 1 + list(traffic_fields).index("speed")
+TREE_Y = 1 + len(traffic_fields) + list(tree_fields).index("y")
+GAME_TIME = SCALAR_NAMES.index("game_time")
+DISTANCE = SCALAR_NAMES.index("distance")
+
+
+def _extrapolate(base, snapshot):
+    # Where the baseline's cars and trees would be by the snapshot's tick, moved by their speed and the scroll.
+    # Positions are XORed with these rather than with the baseline's: they change every tick, but seldom
+    # stray far from this, so only their low bytes differ. Needs only the snapshot's scalars and speeds.
+    old, new = (SCALARS.unpack(snapshot[0].tobytes()) for snapshot in (base, snapshot))
+    ticks = new[GAME_TIME] - old[GAME_TIME]
+    scroll = new[DISTANCE] - old[DISTANCE]
+    count = min(len(base[TRAFFIC_Y]), len(snapshot[TRAFFIC_SPEED]))
+    return {TRAFFIC_Y: base[TRAFFIC_Y][:count] + snapshot[TRAFFIC_SPEED][:count] * ticks + scroll,
+            TREE_Y: base[TREE_Y] + scroll}
+
+
+def _xor(bits, old):
+    # XOR an array's bits with another's, over the slots both have
+    count = min(len(old), len(bits))
+    bits[:count] ^= old[:count].view(bits.dtype)
+
+
+def encode_delta(snapshot, base=None):
+    """Compress a snapshot against a baseline snapshot the receiver has (or against nothing)"""
+    parts = [COUNTS.pack(len(snapshot[1]), len(snapshot[1 + len(traffic_fields)]))]
+    if base is not None:
+        base = list(base)
+        for i, predicted in _extrapolate(base, snapshot).items():
+            base[i] = predicted
+    for i, array in enumerate(snapshot):
+        bits = array.view(UNSIGNED[array.itemsize])
+        if base is not None:
+            # Slots past the end of the baseline's pool are sent as they are
+            bits = bits.copy()
+            _xor(bits, base[i])
+        # Byte planes: all the high bytes, then the next ones down and so on
+        parts.append(bits.view(numpy.uint8).reshape(-1, array.itemsize).T.tobytes())
+    return zlib.compress(b"".join(parts), 1)
+
+
+def decode_delta(data, base=None):
+    """The snapshot encode_delta() compressed against the same baseline"""
+    data = zlib.decompress(data)
+    layout = _layout(*COUNTS.unpack_from(data))
+    if sum(dtype.itemsize * length for dtype, length in layout) != len(data) - COUNTS.size:
+        raise ValueError("snapshot size does not match its counts")
+    bits = []
+    offset = COUNTS.size
+    for dtype, length in layout:
+        planes = numpy.frombuffer(data, numpy.uint8, length * dtype.itemsize, offset)
+        bits.append(planes.reshape(dtype.itemsize, length).T.copy().view(UNSIGNED[dtype.itemsize]).reshape(length))
+        offset += length * dtype.itemsize
+    snapshot = [array.view(dtype) for array, (dtype, _) in zip(bits, layout)]
+    if base is not None:
+        # The positions last, once the scalars and speeds they are extrapolated with are known
+        for i, old in enumerate(base):
+            if i not in (TRAFFIC_Y, TREE_Y):
+                _xor(bits[i], old)
+        for i, predicted in _extrapolate(base, snapshot).items():
+            _xor(bits[i], predicted)
+    return snapshot
+
+
+def new_game(seed, car_index, difficulty, traffic):
+    """The state a player starts a race from; the server and the client build the same one"""
+    return GameState(car_index, difficulty, seed=seed, fixed_traffic=traffic)
+
+
+def parse_packet(data):
+    """(packet type, body) of a packet of this protocol, or None for anything else"""
+    if len(data) < HEADER.size:
+        return None
+    magic, version, kind = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        return None
+    return kind, data[HEADER.size:]
+
+
+def packet(kind, *parts):
+    return HEADER.pack(MAGIC, VERSION, kind) + b"".join(parts)
+
+
+class NetStats:
+    """Packets and bytes through one end, and the time spent encoding or decoding snapshots"""
+
+    def __init__(self):
+        self.ticks = 0
+        self.snapshots = 0
+        self.bytes = 0
+        self.largest = 0
+        self.full = 0  # snapshots sent without a baseline
+        self.seconds = 0.0
+        self.slowest = 0.0
+
+    def add(self, size, seconds, full=False):
+        self.snapshots += 1
+        self.bytes += size
+        self.largest = max(self.largest, size)
+        self.full += full
+        self.seconds += seconds
+        self.slowest = max(self.slowest, seconds)
+
+    def bytes_per_tick(self):
+        return self.bytes / max(1, self.ticks)
+
+    def report(self, verb):
+        snapshots = max(1, self.snapshots)
+        return (f"{self.snapshots} snapshots ({self.full} whole), {self.bytes_per_tick():.0f} bytes/tick, "
+                f"{self.bytes / snapshots:.0f} bytes/snapshot (largest {self.largest}), "
+                f"{verb} {self.seconds / snapshots * 1e6:.0f} us (slowest {self.slowest * 1e6:.0f} us)")
+
+
+class Player:
+    """The server's side of one player: their game, their queued inputs and the snapshots sent to them"""
+
+    def __init__(self, number, address, car_index, state):
+        self.number = number
+        self.address = address
+        self.car_index = car_index
+        self.state = state
+        self.spare = None  # state buffers step() writes the next tick into
+        self.applied = 0  # sequence number of the last input applied; the first one is 1
+        self.inputs = {}  # sequence number -> inputs received but not applied yet
+        self.sent = collections.OrderedDict()  # snapshot number -> snapshot, the last SNAPSHOT_HISTORY
+        self.acked = NO_BASE  # newest snapshot the client has received
+        self.heard = time.perf_counter()
+        self.finish_tick = None  # the input on which the car crossed the finish
+        self.gone = False
+
+    @property
+    def done(self):
+        return self.gone or self.state.game_over or self.finish_tick is not None
+
+
+class RaceServer:
+    """Authoritative server running head-to-head races one after another on one UDP socket"""
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, seed=None, difficulty=1, traffic=0,
+                 distance=RACE_DISTANCE):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((host, port))
+        self.socket.setblocking(False)
+        self.address = self.socket.getsockname()
+        self.fixed_seed = seed
+        self.difficulty = difficulty
+        self.traffic = traffic
+        self.distance = distance
+        self.stats = NetStats()
+        self.races = 0
+        self.new_race()
+
+    def new_race(self):
+        self.seed = random.getrandbits(64) if self.fixed_seed is None else self.fixed_seed
+        self.players = []
+        self.status = WAITING
+        self.winner = NO_WINNER
+        self.tick = 0
+        self.over_at = None
+
+    def run(self, races=None, stop=None):
+        """Run races at TICK_RATE until `races` have been run (forever if None) or the `stop` event is set"""
+        next_tick = time.perf_counter()
+        while not (stop is not None and stop.is_set()):
+            self.receive()
+            self.update()
+            if self.over_at is not None and time.perf_counter() - self.over_at > LINGER:
+                self.races += 1
+                if races is not None and self.races >= races:
+                    return
+                self.new_race()
+            next_tick += TICK_SECONDS
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -MAX_STEPS_PER_TICK * TICK_SECONDS:
+                next_tick = time.perf_counter()  # too far behind to catch up; carry on from now
+
+    def close(self):
+        self.socket.close()
+
+    def receive(self):
+        while True:
+            try:
+                data, address = self.socket.recvfrom(MAX_PACKET)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionError:  # an earlier send went to a closed port (a client that left)
+                continue
+            parsed = parse_packet(data)
+            if parsed is None:
+                continue
+            kind, body = parsed
+            player = next((player for player in self.players if player.address == address), None)
+            try:
+                if kind == HELLO:
+                    self.hello(player, address, *HELLO_PACKET.unpack_from(body))
+                elif player is None:
+                    continue
+                elif kind == INPUTS:
+                    self.inputs(player, body)
+                elif kind == QUIT:
+                    player.gone = True
+            except struct.error:  # a truncated packet
+                continue
+
+    def hello(self, player, address, car_index):
+        if player is None:
+            if len(self.players) == 2 or self.status != WAITING or car_index >= len(car_types):
+                return  # full, or already racing; the client times out
+            number = len(self.players)
+            player = Player(number, address, car_index, new_game(self.seed, car_index, self.difficulty,
+                                                                 self.traffic))
+            self.players.append(player)
+        # Answered again for every HELLO, in case the last WELCOME was lost
+        self.socket.sendto(packet(WELCOME, WELCOME_PACKET.pack(player.number, self.seed, self.difficulty,
+                                                               self.traffic, self.distance)), address)
+
+    def inputs(self, player, body):
+        ack, first, count = INPUTS_PACKET.unpack_from(body)
+        inputs = body[INPUTS_PACKET.size:INPUTS_PACKET.size + count]
+        player.heard = time.perf_counter()
+        if ack in player.sent and (player.acked == NO_BASE or ack > player.acked):
+            player.acked = ack
+        # Inputs are resent until a snapshot shows them applied; keep the new ones
+        for seq, value in enumerate(inputs, first):
+            if player.applied < seq <= player.applied + INPUT_WINDOW:
+                player.inputs[seq] = value
+
+    def update(self):
+        self.tick += 1
+        self.stats.ticks += len(self.players)
+        now = time.perf_counter()
+        for player in self.players:
+            if now - player.heard > TIMEOUT:
+                player.gone = True
+        if self.status == WAITING and len(self.players) == 2:
+            self.status = RUNNING
+        if self.status == RUNNING:
+            for player in self.players:
+                for _ in range(MAX_STEPS_PER_TICK):
+                    inputs = player.inputs.pop(player.applied + 1, None)
+                    if player.done or inputs is None:
+                        break
+                    player.state, player.spare = step(player.state, inputs, player.spare), player.state
+                    player.applied += 1
+                    if player.state.distance >= self.distance:
+                        player.finish_tick = player.applied
+            self.judge()
+        if self.tick % SNAPSHOT_INTERVAL == 0 or self.status == OVER:
+            for player in self.players:
+                if not player.gone:
+                    self.send_snapshot(player)
+
+    def judge(self):
+        # End the race once its winner can no longer change
+        first, second = self.players
+        settled = first.done and second.done
+        for player, other in ((first, second), (second, first)):
+            # The other car can only finish later than this one now
+            if player.finish_tick is not None and not other.done and other.applied >= player.finish_tick:
+                settled = True
+        if not settled:
+            return
+        # Fewest ticks to the finish wins; between cars that did not make it, the one that got furthest
+        ranks = [(float("inf") if player.finish_tick is None else player.finish_tick, -player.state.distance)
+                 for player in self.players]
+        self.winner = DRAW if ranks[0] == ranks[1] else ranks.index(min(ranks))
+        self.status = OVER
+        self.over_at = time.perf_counter()
+
+    def send_snapshot(self, player):
+        snapshot = capture(player.state)
+        base = player.sent.get(player.acked)
+        start = time.perf_counter()
+        delta = encode_delta(snapshot, base)
+        seconds = time.perf_counter() - start
+        opponent = self.players[1 - player.number] if len(self.players) == 2 else player
+        state = opponent.state
+        data = packet(SNAPSHOT,
+                      SNAPSHOT_PACKET.pack(self.tick, NO_BASE if base is None else player.acked, player.applied,
+                                           self.status, self.winner),
+                      OPPONENT.pack(opponent.car_index, state.car_x, state.distance, state.car_rotation,
+                                    state.current_gear, state.car_speed, state.score, state.game_over),
+                      delta)
+        self.socket.sendto(data, player.address)
+        self.stats.add(len(data), seconds, base is None)
+        player.sent[self.tick] = snapshot
+        while len(player.sent) > SNAPSHOT_HISTORY:
+            player.sent.popitem(last=False)
+
+
+class RaceClient:
+    """One player's connection to a RaceServer, predicting their own game between snapshots"""
+
+    def __init__(self, address, car_index=0):
+        self.server = address
+        self.car_index = car_index
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.stats = NetStats()
+        self.number = None  # player number the server gave us
+        self.template = None  # the race's starting state; snapshots are restored onto copies of it
+        self.state = None  # the predicted state of our game
+        self.distance = RACE_DISTANCE
+        self.status = WAITING
+        self.winner = NO_WINNER
+        self.next_seq = 1
+        self.pending = collections.deque()  # (sequence number, inputs) the server has not applied yet
+        self.received = collections.OrderedDict()  # snapshot number -> snapshot, the last SNAPSHOT_HISTORY
+        self.latest = None  # newest snapshot number received
+        self.scratch = [None, None]  # states the reconciling is worked out in, never handed out
+        self.mispredictions = 0
+        self.replayed = 0  # ticks stepped again while reconciling
+        self.opponent = None  # the opponent in the last two snapshots, for interpolate_opponent()
+        self.previous_opponent = None
+        self.opponent_time = 0.0
+
+    def connect(self, timeout=5.0):
+        """Join the server's next race; raises ConnectionError if it does not answer in time"""
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            self.socket.sendto(packet(HELLO, HELLO_PACKET.pack(self.car_index)), self.server)
+            if select.select([self.socket], [], [], 0.25)[0]:
+                try:
+                    data = self.socket.recv(MAX_PACKET)
+                except (BlockingIOError, ConnectionError):
+                    continue
+                parsed = parse_packet(data)
+                if parsed is not None and parsed[0] == WELCOME:
+                    self.number, seed, difficulty, traffic, self.distance = WELCOME_PACKET.unpack_from(parsed[1])
+                    self.template = new_game(seed, self.car_index, difficulty, traffic)
+                    self.state = self.template.copy()
+                    return
+        raise ConnectionError(f"no race server answered at {self.server[0]}:{self.server[1]}")
+
+    def close(self):
+        """Leave the race; the opponent wins if it is still on"""
+        try:
+            self.socket.sendto(packet(QUIT), self.server)
+        except OSError:
+            pass
+        self.socket.close()
+
+    @property
+    def finished(self):
+        """Whether our car is out of the race: crossed the finish or crashed (as predicted)"""
+        return self.state.game_over or self.state.distance >= self.distance
+
+    def update(self, inputs, spare=None):
+        """Take in the snapshots that arrived, then predict one tick with these inputs; returns the state
+
+        The tick is written over `spare`, as step() does, if given: a state
+        this client handed out before and the caller no longer needs.
+        """
+        self.poll()
+        if self.status == RUNNING and not self.finished:
+            self.pending.append((self.next_seq, inputs))
+            self.next_seq += 1
+            self.state = step(self.state, inputs, spare)
+        self.send_inputs()
+        return self.state
+
+    def poll(self):
+        """Take in the snapshots that arrived without predicting a tick (while not driving)"""
+        self.stats.ticks += 1
+        while True:
+            try:
+                data = self.socket.recv(MAX_PACKET)
+            except (BlockingIOError, InterruptedError, ConnectionError):  # ConnectionError: the server has stopped
+                return
+            parsed = parse_packet(data)
+            if parsed is not None and parsed[0] == SNAPSHOT:
+                try:
+                    self.snapshot(parsed[1], len(data))
+                except (struct.error, zlib.error, ValueError):  # damaged; the next one is against an older base
+                    continue
+
+    def send_inputs(self):
+        # Every input the server has not applied yet, so a lost packet costs nothing
+        ack = NO_BASE if self.latest is None else self.latest
+        inputs = [value for _, value in self.pending][-MAX_INPUTS:]
+        first = self.next_seq - len(inputs)
+        data = packet(INPUTS, INPUTS_PACKET.pack(ack, first, len(inputs)), bytes(inputs))
+        try:
+            self.socket.sendto(data, self.server)
+        except OSError:  # the server's port is closed; it has stopped
+            pass
+
+    def snapshot(self, body, size):
+        number, base_number, applied, status, winner = SNAPSHOT_PACKET.unpack_from(body)
+        if self.latest is not None and number <= self.latest:
+            return  # out of order; a newer one is already applied
+        base = None
+        if base_number != NO_BASE:
+            base = self.received.get(base_number)
+            if base is None:
+                return
+        offset = SNAPSHOT_PACKET.size
+        opponent = OPPONENT.unpack_from(body, offset)
+        start = time.perf_counter()
+        snapshot = decode_delta(body[offset + OPPONENT.size:], base)
+        self.stats.add(size, time.perf_counter() - start, base is None)
+
+        self.received[number] = snapshot
+        while len(self.received) > SNAPSHOT_HISTORY:
+            self.received.popitem(last=False)
+        self.latest = number
+        self.status = status
+        self.winner = winner
+        self.previous_opponent = self.opponent or opponent
+        self.opponent = opponent
+        self.opponent_time = time.perf_counter()
+
+        # Reconcile: the server's state, with the inputs it has not applied yet played on top again, worked out
+        # in the scratch states. The prediction is kept when it matches, so no state handed out is written over.
+        while self.pending and self.pending[0][0] <= applied:
+            self.pending.popleft()
+        predicted = self.state
+        state, spare = self.scratch
+        state = restore(snapshot, self.template, state)
+        for _, inputs in self.pending:
+            state, spare = step(state, inputs, spare), state
+        self.scratch = [state, spare]
+        self.replayed += len(self.pending)
+        if predicted is None or not snapshots_equal(capture(state), capture(predicted)):
+            if predicted is not None and applied:
+                self.mispredictions += 1
+            self.state = state.copy()
+
+    def interpolate_opponent(self):
+        """(car index, car_x, distance, car_rotation, current_gear) of the opponent, or None before it joined
+
+        Drawn between the last two snapshots, a snapshot interval behind, so
+        it moves smoothly at the snapshot rate.
+        """
+        if self.opponent is None or self.status == WAITING:
+            return None
+        alpha = min(1.0, (time.perf_counter() - self.opponent_time) / (SNAPSHOT_INTERVAL * TICK_SECONDS))
+        previous, current = self.previous_opponent, self.opponent
+        car_x, distance, rotation = (a + (b - a) * alpha for a, b in zip(previous[1:4], current[1:4]))
+        return current[0], car_x, distance, rotation, current[4]
+
+    def result(self):
+        """"Won", "Lost", "Draw" or None while the race is on"""
+        if self.status != OVER:
+            return None
+        if self.winner == DRAW:
+            return "Draw"
+        return "Won" if self.winner == self.number else "Lost"
+
+
+def parse_address(text):
+    """(host, port) from "host:port", "host" or ":port" """
+    host, _, port = text.rpartition(":") if ":" in text else (text, "", "")
+    return socket.gethostbyname(host or "127.0.0.1"), int(port or DEFAULT_PORT)
+
+
+def _bot(address, car, policy, seed, seconds, results):
+    # One loopback player, in its own process so the bots and the server don't share a core through the GIL
+    from batch import POLICIES
+
+    client = RaceClient(address, car)
+    client.connect()
+    drive = POLICIES[policy]
+    rng = random.Random(seed)
+    deadline = time.perf_counter() + seconds
+    next_tick = time.perf_counter()
+    spare = None
+    while client.status != OVER and time.perf_counter() < deadline:
+        state = client.state
+        client.update(drive(state, rng) if client.status == RUNNING else 0, spare)
+        spare = state if state is not client.state else None
+        next_tick += TICK_SECONDS
+        time.sleep(max(0.0, next_tick - time.perf_counter()))
+    client.close()
+    state = client.state
+    results.put((client.number, client.status == OVER, client.mispredictions, [
+        f"Player {client.number} ({policy}): {client.result() or 'unfinished'}, "
+        f"{state.distance:.0f}/{client.distance} rows, {state.game_time} ticks, "
+        f"{'crashed, ' if state.game_over else ''}{len(state.traffic)} cars on the road",
+        f"  received {client.stats.report('decode')}",
+        f"  {client.replayed} ticks replayed reconciling, {client.mispredictions} mispredictions",
+    ]))
+
+
+def loopback(options):
+    # A server on a local port and two bots racing through it in real time
+    server = RaceServer("127.0.0.1", 0, options.seed, options.difficulty, options.traffic, options.distance)
+    stop = threading.Event()
+    thread = threading.Thread(target=server.run, kwargs={"races": 1, "stop": stop}, name="race server")
+    thread.start()
+    results = multiprocessing.Queue()
+    bots = [multiprocessing.Process(target=_bot, args=(server.address, car, policy, i, options.seconds, results))
+            for i, (car, policy) in enumerate(zip(options.cars, options.policies))]
+    for bot in bots:
+        bot.start()
+    try:
+        reports = sorted(results.get(timeout=options.seconds + 10) for _ in bots)
+    finally:
+        for bot in bots:
+            bot.join()
+        stop.set()
+        thread.join()
+        server.close()
+
+    failed = False
+    for _, finished, mispredictions, lines in reports:
+        print("\n".join(lines))
+        failed = failed or mispredictions > 0
+    print(f"Server: sent {server.stats.report('encode')}")
+    if server.stats.bytes_per_tick() > options.budget:
+        print(f"OVER BUDGET: {server.stats.bytes_per_tick():.0f} bytes/tick per player, "
+              f"the budget is {options.budget}")
+        failed = True
+    if not all(finished for _, finished, _, _ in reports):
+        print(f"The race did not finish in {options.seconds:g} seconds")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Head-to-head races over UDP")
+    commands = parser.add_subparsers(dest="command", required=True)
+    server_parser = commands.add_parser("server", help="run races for two players at a time")
+    server_parser.add_argument("--host", default="0.0.0.0", help="address to listen on")
+    server_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    server_parser.add_argument("--stats", type=float, default=10, metavar="SECONDS",
+                               help="seconds between bandwidth reports")
+    test_parser = commands.add_parser("loopback", help="race two bots through a server on this machine")
+    test_parser.add_argument("--seconds", type=float, default=120, help="give up on the race after this long")
+    test_parser.add_argument("--policies", nargs=2, default=["cautious", "random"], help="batch.py driving policies")
+    test_parser.add_argument("--cars", nargs=2, type=int, default=[0, 1], help="car type index of each bot")
+    test_parser.add_argument("--budget", type=int, default=BANDWIDTH_BUDGET,
+                             help="fail if the snapshots average more bytes per tick per player than this")
+    for command in (server_parser, test_parser):
+        command.add_argument("--difficulty", type=int, choices=[1, 2, 3], default=1)
+        command.add_argument("--traffic", type=int, default=0, help="keep this many cars on and around the screen")
+        command.add_argument("--distance", type=int, default=RACE_DISTANCE, help="length of a race in rows")
+        command.add_argument("--seed", type=int, help="race on this seed every time instead of a random one")
+    options = parser.parse_args()
+
+    if options.command == "loopback":
+        return loopback(options)
+
+    server = RaceServer(options.host, options.port, options.seed, options.difficulty, options.traffic,
+                        options.distance)
+    print(f"Racing on {server.address[0]}:{server.address[1]}")
+    stop = threading.Event()
+    thread = threading.Thread(target=server.run, kwargs={"stop": stop}, name="race server", daemon=True)
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(options.stats)
+            print(f"{server.races} races, {len(server.players)} players waiting or racing; "
+                  f"sent {server.stats.report('encode')}", flush=True)
+    except KeyboardInterrupt:
+        stop.set()
+        thread.join()
+    server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""Particle effects for the racing game: exhaust, tire smoke and crash debris.
+
+Particles live in preallocated NumPy arrays, packed into the first `count`
+slots like the simulation's EntityPool, but they come and go in batches:
+emit() writes a whole burst with one slice assignment per field, and update()
+moves every particle and packs the survivors down with one boolean index per
+field. Nothing is allocated per particle once the system is built.
+
+A particle's looks come from its style (how big it is and how it fades over
+its life) and its color. Each (style, color) pair is a "look", and the
+renderer keeps FRAMES pre-rendered sprites of every look, so drawing is just
+picking each particle's frame (sprite_indices()) and handing the sprites to
+one Surface.blits() call.
+
+The budget is hard: the system never holds more than `budget` particles.
+Once it is nearly full, emitters are cut back in proportion to the room left,
+so effects thin out instead of stopping dead.
+
+Particles are only for show. They run on the render loop's frame time and
+never touch a GameState, so replays and races come out the same with or
+without them. Nothing in here touches pygame.
+"""
+import math
+
+import numpy
+
+PARTICLE_BUDGET = 10000  # most particles alive at once
+HEADROOM = 0.2  # emission is thinned out once less than this fraction of the budget is free
+FRAMES = 8  # pre-rendered sprites per look, over a particle's life
+CULL_MARGIN = 50  # particles further than this past the top or bottom of the screen are dropped
+
+# Per-particle fields
+particle_fields = {
+    "x": numpy.float32,  # center, in screen pixels
+    "y": numpy.float32,
+    "vx": numpy.float32,  # pixels per second
+    "vy": numpy.float32,
+    "drag": numpy.float32,  # fraction of the velocity lost per second, as an exponential rate
+    "age": numpy.float32,  # seconds
+    "life": numpy.float32,
+    "look": numpy.uint16,  # index into ParticleSystem.looks
+}
+
+# How each kind of particle moves and looks. Sizes are radii in pixels and
+# alphas run 0-255, both going from the first value at birth to the second at death.
+STYLES = {
+    "exhaust": {"life": (0.3, 0.6), "speed": (30, 80), "spread": 0.3, "jitter": 2, "drag": 3.0,
+                "shape": "circle", "size": (3, 9), "alpha": (160, 0)},
+    "smoke": {"life": (0.6, 1.2), "speed": (20, 70), "spread": 0.8, "jitter": 6, "drag": 2.0,
+              "shape": "circle", "size": (4, 14), "alpha": (170, 0)},
+    "debris": {"life": (0.5, 1.0), "speed": (80, 320), "spread": math.pi, "jitter": 10, "drag": 2.5,
+               "shape": "square", "size": (3, 2), "alpha": (255, 60)},
+}
+
+
+class ParticleSystem:
+    """Fixed budget of particles in structure-of-arrays form; the live ones fill the first `count` slots"""
+
+    def __init__(self, height, budget=PARTICLE_BUDGET, seed=None):
+        self.height = height  # of the screen, for culling
+        self.budget = budget
+        self.count = 0
+        self.high_water = 0  # most particles alive at once
+        self.dropped = 0  # particles not emitted because the budget was (nearly) used up
+        for name, dtype in particle_fields.items():
+            setattr(self, name, numpy.zeros(budget, dtype=dtype))
+        self.looks = []  # (style name, color) of each look
+        self._look_ids = {}
+        self.rng = numpy.random.default_rng(seed)
+
+    def __len__(self):
+        return self.count
+
+    def look_id(self, style, color):
+        """Index of the look for a style and color, added on first use"""
+        key = (style, tuple(color))
+        look = self._look_ids.get(key)
+        if look is None:
+            look = self._look_ids[key] = len(self.looks)
+            self.looks.append(key)
+        return look
+
+    def emit(self, style, color, count, x, y, angle=0.0, spread=None):
+        """Emit about `count` particles (fractions are rounded at random) at (x, y); returns how many
+
+        They fly off at the style's speed in directions within `spread` (the
+        style's unless given) of `angle`, in radians: 0 points right and
+        pi / 2 down the screen, so a spread of pi sends them every way.
+        """
+        count = int(count + self.rng.random())
+        free = self.budget - self.count
+        headroom = self.budget * HEADROOM
+        allowed = count if free >= headroom else min(int(count * free / headroom + self.rng.random()), free)
+        self.dropped += count - allowed
+        if allowed <= 0:
+            return 0
+
+        settings = STYLES[style]
+        rng = self.rng
+        new = slice(self.count, self.count + allowed)
+        if spread is None:
+            spread = settings["spread"]
+        direction = angle + rng.uniform(-spread, spread, allowed)
+        speed = rng.uniform(*settings["speed"], allowed)
+        jitter = settings["jitter"]
+        self.x[new] = x + rng.uniform(-jitter, jitter, allowed)
+        self.y[new] = y + rng.uniform(-jitter, jitter, allowed)
+        self.vx[new] = speed * numpy.cos(direction)
+        self.vy[new] = speed * numpy.sin(direction)
+        self.drag[new] = settings["drag"]
+        self.age[new] = 0
+        self.life[new] = rng.uniform(*settings["life"], allowed)
+        self.look[new] = self.look_id(style, color)
+        self.count += allowed
+        self.high_water = max(self.high_water, self.count)
+        return allowed
+
+    def update(self, seconds, scroll=0.0):
+        """Age and move every particle by `seconds`; `scroll` is how far the road moved down the screen meanwhile"""
+        count = self.count
+        if not count:
+            return
+        live = slice(0, count)
+        age = self.age[live]
+        age += seconds
+        y = self.y[live]
+        keep = (age < self.life[live]) & (y > -CULL_MARGIN) & (y < self.height + CULL_MARGIN)
+        kept = int(numpy.count_nonzero(keep))
+        if kept < count:
+            for name in particle_fields:
+                array = getattr(self, name)
+                array[:kept] = array[live][keep]
+            self.count = count = kept
+            live = slice(0, count)
+
+        slowdown = numpy.exp(self.drag[live] * -seconds)
+        vx = self.vx[live]
+        vy = self.vy[live]
+        vx *= slowdown
+        vy *= slowdown
+        self.x[live] += vx * seconds
+        self.y[live] += vy * seconds + scroll
+
+    def sprite_indices(self):
+        """The sprite each live particle is drawn with: look * FRAMES + how far through its life it is"""
+        live = slice(0, self.count)
+        frame = (self.age[live] * (FRAMES / self.life[live])).astype(numpy.intp)
+        return self.look[live].astype(numpy.intp) * FRAMES + numpy.minimum(frame, FRAMES - 1)
+
+    def clear(self):
+        self.count = 0
+
+
+def sprite_frames(style):
+    """(radius, alpha) of each of a style's FRAMES sprites"""
+    settings = STYLES[style]
+    frames = []
+    for frame in range(FRAMES):
+        t = (frame + 0.5) / FRAMES
+        radius = settings["size"][0] + (settings["size"][1] - settings["size"][0]) * t
+        alpha = settings["alpha"][0] + (settings["alpha"][1] - settings["alpha"][0]) * t
+        frames.append((radius, round(alpha)))
+    return frames
@@ -0,0 +1,91 @@
+"""Per-phase frame profiler for the racing game.
+
+The main loop marks the end of each phase with lap(); the time since the
+previous mark is charged to that phase. The last HISTORY frames are kept in a
+ring buffer for rolling percentiles, and every recorded frame is appended to a
+CSV file. While disabled every call returns straight away, so the hooks can
+stay in the loop.
+"""
+import time
+
+import numpy
+
+HISTORY = 600  # frames kept for the rolling percentiles (10 seconds at 60 FPS)
+PERCENTILES = (50, 95, 99)
+
+
+class FrameProfiler:
+    """Times named phases of each frame with perf_counter_ns"""
+
+    def __init__(self, phases, csv_path, history=HISTORY):
+        self.phases = list(phases)
+        self.csv_path = csv_path
+        self.enabled = False
+        self._phase_index = {phase: i for i, phase in enumerate(self.phases)}
+        self._times = numpy.zeros((history, len(self.phases)), dtype=numpy.int64)  # ns, one row per frame
+        self._frames = 0  # frames recorded so far
+        self._written = 0  # frames already appended to the CSV file
+        self._row = None
+        self._mark = 0
+        self._csv = None
+
+    def toggle(self):
+        """Turn recording on or off; a frame in progress is discarded"""
+        self.enabled = not self.enabled
+        self._row = None
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self._row = self._times[self._frames % len(self._times)]
+        self._row[:] = 0
+        self._mark = time.perf_counter_ns()
+
+    def lap(self, phase):
+        """Charge the time since the last mark to a phase"""
+        if self._row is None:
+            return
+        now = time.perf_counter_ns()
+        self._row[self._phase_index[phase]] += now - self._mark
+        self._mark = now
+
+    def end_frame(self):
+        if self._row is None:
+            return
+        self._row = None
+        self._frames += 1
+        if self._frames % len(self._times) == 0:
+            self._flush()
+
+    def percentiles(self):
+        """{phase: (p50, p95, p99)} in milliseconds over the recent frames, including a "frame" total"""
+        count = min(self._frames, len(self._times))
+        if not count:
+            return {}
+        times = self._times[:count]
+        times = numpy.column_stack([times, times.sum(axis=1)]) / 1e6
+        values = numpy.percentile(times, PERCENTILES, axis=0)
+        return {phase: tuple(values[:, i].tolist()) for i, phase in enumerate(self.phases + ["frame"])}
+
+    def _flush(self):
+        # Append the frames recorded since the last flush to the CSV file
+        if self._frames == self._written:
+            return
+        if self._csv is None:
+            self._csv = open(self.csv_path, "w")
+            self._csv.write(",".join(["frame"] + [f"{phase}_ms" for phase in self.phases] + ["total_ms"]) + "\n")
+        history = len(self._times)
+        frames = numpy.arange(max(self._written, self._frames - history), self._frames)
+        times = self._times[frames % history] / 1e6
+        table = numpy.column_stack([frames, times, times.sum(axis=1)])
+        numpy.savetxt(self._csv, table, fmt=["%d"] + ["%.4f"] * (len(self.phases) + 1), delimiter=",")
+        self._written = self._frames
+
+    def close(self):
+        """Write any frames not yet in the CSV file and close it; returns the path, or None if nothing was recorded"""
+        self._flush()
+        if self._csv is None:
+            return None
+        self._csv.close()
+        self._csv = None
+        return self.csv_path
@@ -1,186 +1,364 @@
+import time
+STARTED = time.perf_counter()  # before the other imports, so the startup report includes them
 import pygame
 import sys
-import math
 import random
+import re
 import os
+import argparse
+import json
+import math
 import numpy
+from collections import OrderedDict
+from audio import Audio
+from leaderboard import Leaderboard, DEFAULT_PATH as SCORES_PATH
+from loader import AssetLoader, MENU as MENU_ASSETS, GAME as GAME_ASSETS
+from netplay import RaceClient, parse_address, OVER as RACE_OVER, WAITING as RACE_WAITING
+from particles import ParticleSystem, FRAMES as PARTICLE_FRAMES, STYLES as PARTICLE_STYLES, sprite_frames
+from profiler import FrameProfiler
+from replay import InputRecorder, Recording
+from simulation import (GameState, step, interpolate, TICK_RATE, TICK_SECONDS, car_types, traffic_colors,
+                        traffic_car_width, traffic_car_height, DOWN, SCREEN_WIDTH, SCREEN_HEIGHT, road_line_width,
+                        road_line_height, road_line_gap, INPUT_UP, INPUT_DOWN, INPUT_LEFT, INPUT_RIGHT,
+                        INPUT_SHIFT_UP, INPUT_SHIFT_DOWN, INPUT_BACKGROUND)
+from track import CHUNK_LENGTH, MAX_LANES
+
+# Internal resolution of the --low-res mode, as a fraction of the logical SCREEN_WIDTH x SCREEN_HEIGHT
+LOW_RES_SCALE = 0.5
+MAX_RENDER_SCALE = 4  # the framebuffer grows with the square of the scale
+
+def render_scale_type(text):
+    # --render-scale: a scale in (0, MAX_RENDER_SCALE]; argparse reports anything else as a usage error
+    try:
+        scale = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a number: {text!r}")
+    if not 0 < scale <= MAX_RENDER_SCALE:
+        raise argparse.ArgumentTypeError(f"must be above 0 and at most {MAX_RENDER_SCALE}, not {text}")
+    return scale
 
-# Initialize Pygame
-pygame.init()
-pygame.mixer.init()  # Initialize sound mixer
+# Command line; the benchmark options play one scripted game without menus (see benchmark.py)
+parser = argparse.ArgumentParser(description="Car racing game")
+parser.add_argument("--difficulty", type=int, choices=[1, 2, 3], default=1, help="1=easy, 2=medium, 3=hard")
+parser.add_argument("--background", type=int, choices=[0, 1, 2], default=0, help="0=day, 1=sunset, 2=night")
+parser.add_argument("--dirty-rects", action="store_true", help="start with the dirty-rectangle renderer")
+parser.add_argument("--render-scale", type=render_scale_type, default=1.0,
+                    help=f"internal resolution as a fraction of {SCREEN_WIDTH}x{SCREEN_HEIGHT}")
+parser.add_argument("--low-res", dest="render_scale", action="store_const", const=LOW_RES_SCALE,
+                    help=f"render at {LOW_RES_SCALE:g} of the normal resolution, for slow machines")
+parser.add_argument("--smooth-scaling", action="store_true", help="filter the frame when scaling it to the window")
+parser.add_argument("--seed", type=int, help="seed every game with this instead of a random seed")
+parser.add_argument("--record", metavar="FILE", help="record the inputs of each game to FILE (see replay.py)")
+parser.add_argument("--replay", metavar="FILE", help="play back a recorded game instead of reading the keyboard")
+parser.add_argument("--connect", metavar="HOST:PORT", help="race another player through a netplay.py server")
+parser.add_argument("--scores", default=SCORES_PATH, help="the leaderboard's database (see leaderboard.py)")
+parser.add_argument("--profile-csv", default="frame_profile.csv", help="where the F3 profiler writes its timings")
+parser.add_argument("--benchmark-frames", type=int, help="play this many uncapped frames, write a report and exit")
+parser.add_argument("--benchmark-warmup", type=int, default=60, help="frames played before measuring starts")
+parser.add_argument("--benchmark-report", default="benchmark_report.json", help="where the benchmark report goes")
+parser.add_argument("--traffic", type=int, default=0,
+                    help="benchmark: keep exactly this many traffic cars on and around the screen")
+parser.add_argument("--hold", choices=["none", "up", "down"], default="none", help="benchmark: key held down")
+parser.add_argument("--gear", type=int, choices=range(1, 6), default=1, help="benchmark: gear to drive in")
+parser.add_argument("--particles", type=int, default=0, help="benchmark: keep this many particles in the air")
+args = parser.parse_args([])  # the defaults until main() parses the real command line
 
-# Create a directory for sound files if it doesn't exist
+# Sound files are synthesized into (and loaded from) this directory on first use
 sound_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sounds")
-os.makedirs(sound_dir, exist_ok=True)
 
-def play_sound(sound, volume=1.0):
-    """Play a sound if sound is enabled"""
-    if sound_enabled:
-        sound.set_volume(volume)
-        sound.play()
+def render_background(mode, width, height):
+    """Render the static sky, mountain and star layers for a background mode; the road is drawn over them in tiles"""
+    layer = pygame.Surface((width, height)).convert()
+    # Fixed seed per mode so mountains and stars keep the same layout every frame
+    rng = random.Random(mode)
+    rows = numpy.arange(height)
 
-def update_engine_sound():
-    """Update engine sound based on car speed"""
-    if sound_enabled:
-        # Adjust volume based on speed
-        volume = min(1.0, abs(car_speed) / car_max_speed)
-        engine_sound.set_volume(volume)
-        
-        # Play engine sound if not already playing
-        if not pygame.mixer.get_busy():
-            engine_sound.play(-1)  # Loop indefinitely
+    if mode == 0:  # Day
+        # Sky gradient from light blue to darker blue
+        sky = numpy.empty((height, 3), dtype=numpy.int32)
+        sky[:, 0] = 135
+        sky[:, 1] = numpy.maximum(100, 235 - (rows * 0.3).astype(numpy.int32))
+        sky[:, 2] = 235
+        pygame.surfarray.blit_array(layer, numpy.broadcast_to(sky, (width, height, 3)))
+        mountain_color = MOUNTAIN_BROWN
+
+    elif mode == 1:  # Sunset
+        # Top third: orange to yellow, bottom two-thirds: yellow to dark blue
+        third = height // 3
+        below = numpy.maximum(rows - third, 0)
+        sky = numpy.empty((height, 3), dtype=numpy.int32)
+        sky[:, 0] = numpy.where(rows < third, 255, numpy.maximum(25, 255 - (below * 0.8).astype(numpy.int32)))
+        sky[:, 1] = numpy.where(rows < third, numpy.minimum(255, 99 + (rows * 0.8).astype(numpy.int32)),
+                                numpy.maximum(25, 180 - (below * 0.6).astype(numpy.int32)))
+        sky[:, 2] = numpy.where(rows < third, 71, numpy.minimum(112, 71 + (below * 0.2).astype(numpy.int32)))
+        pygame.surfarray.blit_array(layer, numpy.broadcast_to(sky, (width, height, 3)))
 
-def draw_background():
-    """Draw a dynamic background based on the selected background mode"""
-    if background_mode == 0:  # Day
-        # Sky gradient
-        for y in range(SCREEN_HEIGHT):
-            # Create gradient from light blue to darker blue
-            color_value = max(100, 235 - int(y * 0.3))
-            sky_color = (135, color_value, 235)
-            pygame.draw.line(screen, sky_color, (0, y), (SCREEN_WIDTH, y))
-        
-        # Draw distant mountains
-        mountain_height = 150
-        for x in range(0, SCREEN_WIDTH, 100):
-            offset = random.randint(-30, 30)
-            points = [
-                (x, SCREEN_HEIGHT//2 - mountain_height + offset),
-                (x + 50, SCREEN_HEIGHT//2 - mountain_height - 30 + offset),
-                (x + 100, SCREEN_HEIGHT//2 - mountain_height + offset)
-            ]
-            pygame.draw.polygon(screen, MOUNTAIN_BROWN, points)
-        
-        # Draw grass on sides of road
-        pygame.draw.rect(screen, GRASS_GREEN, (0, SCREEN_HEIGHT, road_x, SCREEN_HEIGHT))
-        pygame.draw.rect(screen, GRASS_GREEN, (road_x + road_width, SCREEN_HEIGHT, SCREEN_WIDTH - road_x - road_width, SCREEN_HEIGHT))
-        
-    elif background_mode == 1:  # Sunset
-        # Sky gradient from orange to dark blue
-        for y in range(SCREEN_HEIGHT):
-            # Create sunset gradient
-            if y < SCREEN_HEIGHT // 3:
-                # Top third: orange to yellow
-                r = 255
-                g = min(255, 99 + int(y * 0.8))
-                b = 71
-            else:
-                # Bottom two-thirds: yellow to dark blue
-                r = max(25, 255 - int((y - SCREEN_HEIGHT // 3) * 0.8))
-                g = max(25, 180 - int((y - SCREEN_HEIGHT // 3) * 0.6))
-                b = min(112, 71 + int((y - SCREEN_HEIGHT // 3) * 0.2))
-            
-            pygame.draw.line(screen, (r, g, b), (0, y), (SCREEN_WIDTH, y))
-        
         # Draw sun
-        pygame.draw.circle(screen, YELLOW, (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 4), 50)
-        
-        # Draw distant mountains (silhouettes)
-        mountain_height = 150
-        for x in range(0, SCREEN_WIDTH, 100):
-            offset = random.randint(-30, 30)
-            points = [
-                (x, SCREEN_HEIGHT//2 - mountain_height + offset),
-                (x + 50, SCREEN_HEIGHT//2 - mountain_height - 30 + offset),
-                (x + 100, SCREEN_HEIGHT//2 - mountain_height + offset)
-            ]
-            pygame.draw.polygon(screen, (50, 50, 50), points)
-        
-        # Draw darker grass on sides of road
-        pygame.draw.rect(screen, (20, 80, 20), (0, SCREEN_HEIGHT, road_x, SCREEN_HEIGHT))
-        pygame.draw.rect(screen, (20, 80, 20), (road_x + road_width, SCREEN_HEIGHT, SCREEN_WIDTH - road_x - road_width, SCREEN_HEIGHT))
-        
+        pygame.draw.circle(layer, YELLOW, (width // 2, height // 4), 50)
+        mountain_color = (50, 50, 50)
+
     else:  # Night
         # Dark sky with stars
-        screen.fill(NIGHT_BLUE)
-        
-        # Draw stars
+        layer.fill(NIGHT_BLUE)
         for _ in range(100):
-            x = random.randint(0, SCREEN_WIDTH)
-            y = random.randint(0, SCREEN_HEIGHT // 2)
-            size = random.randint(1, 3)
-            brightness = random.randint(150, 255)
-            pygame.draw.circle(screen, (brightness, brightness, brightness), (x, y), size)
-        
+            x = rng.randint(0, width)
+            y = rng.randint(0, height // 2)
+            size = rng.randint(1, 3)
+            brightness = rng.randint(150, 255)
+            pygame.draw.circle(layer, (brightness, brightness, brightness), (x, y), size)
+
         # Draw moon
-        pygame.draw.circle(screen, WHITE, (SCREEN_WIDTH - 100, 100), 40)
-        pygame.draw.circle(screen, NIGHT_BLUE, (SCREEN_WIDTH - 85, 90), 40)
-        
-        # Draw distant mountains (dark silhouettes)
-        mountain_height = 150
-        for x in range(0, SCREEN_WIDTH, 100):
-            offset = random.randint(-30, 30)
-            points = [
-                (x, SCREEN_HEIGHT//2 - mountain_height + offset),
-                (x + 50, SCREEN_HEIGHT//2 - mountain_height - 30 + offset),
-                (x + 100, SCREEN_HEIGHT//2 - mountain_height + offset)
-            ]
-            pygame.draw.polygon(screen, (20, 20, 40), points)
-        
-        # Draw very dark grass on sides of road
-        pygame.draw.rect(screen, (10, 30, 10), (0, SCREEN_HEIGHT, road_x, SCREEN_HEIGHT))
-        pygame.draw.rect(screen, (10, 30, 10), (road_x + road_width, SCREEN_HEIGHT, SCREEN_WIDTH - road_x - road_width, SCREEN_HEIGHT))
-
-# Screen dimensions
-SCREEN_WIDTH = 800
-SCREEN_HEIGHT = 600
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Car Racing Game")
-
-# Get actual screen dimensions for fullscreen backgrounds
-info = pygame.display.Info()
-FULL_SCREEN_WIDTH = info.current_w
-FULL_SCREEN_HEIGHT = info.current_h
-
-# Try to load sounds
-try:
-    engine_sound = pygame.mixer.Sound(os.path.join(sound_dir, "engine.wav"))
-    crash_sound = pygame.mixer.Sound(os.path.join(sound_dir, "crash.wav"))
-    gear_shift_sound = pygame.mixer.Sound(os.path.join(sound_dir, "gear_shift.wav"))
-    menu_select_sound = pygame.mixer.Sound(os.path.join(sound_dir, "menu_select.wav"))
-except Exception as e:
-    print(f"Error loading sounds: {e}")
-    # Create simple sounds using pygame
+        pygame.draw.circle(layer, WHITE, (width - 100, 100), 40)
+        pygame.draw.circle(layer, NIGHT_BLUE, (width - 85, 90), 40)
+        mountain_color = (20, 20, 40)
+
+    # Draw distant mountains
+    mountain_height = 150
+    for x in range(0, width, 100):
+        offset = rng.randint(-30, 30)
+        points = [
+            (x, height//2 - mountain_height + offset),
+            (x + 50, height//2 - mountain_height - 30 + offset),
+            (x + 100, height//2 - mountain_height + offset)
+        ]
+        pygame.draw.polygon(layer, mountain_color, points)
+
+    return layer
+
+def invalidate_background_cache():
+    """Drop all cached background layers and sprites (the display surface changed)"""
+    background_cache.clear()
+    car_sprites.clear()
+    tree_sprites.clear()
+    road_tiles.clear()
+    rotated_car_sprites.clear()
+    menu_layers.clear()
+    request_full_redraw()
+
+def get_background_layer(mode, size):
+    """Look up the background layer for a mode and framebuffer size, rendering it on first use"""
+    key = (mode, size)
+    layer = background_cache.get(key)
+    if layer is None:
+        background_cache_stats["misses"] += 1
+        layer = render_background(mode, SCREEN_WIDTH, SCREEN_HEIGHT)
+        if size != layer.get_size():
+            layer = pygame.transform.smoothscale(layer, size)
+        background_cache[key] = layer
+    else:
+        background_cache_stats["hits"] += 1
+    return layer
+
+def get_background():
+    """Look up the background layer for the current mode and screen size"""
+    return get_background_layer(background_mode, screen.get_size())
+
+def draw_background():
+    """Draw a dynamic background based on the selected background mode"""
+    screen.blit(get_background(), (0, 0))
+
+def request_full_redraw():
+    """Repaint and present the whole screen on the next frame"""
+    global last_screen_key
+    last_screen_key = None
+
+def screen_needs_redraw(key):
+    """Whether to repaint the whole screen this frame; in dirty-rect mode only when key changes"""
+    global last_screen_key, full_redraw
+    if dirty_rect_mode and key == last_screen_key:
+        return False
+    last_screen_key = key
+    full_redraw = True
+    return True
+
+def get_menu_layer(key, draw, buttons):
+    """Look up a menu screen composed once (buttons not hovered) into an offscreen Surface"""
+    global screen
+    layer = menu_layers.get(key)
+    if layer is None:
+        # Point the draw functions at the offscreen layer while composing
+        target = screen
+        screen = layer = pygame.Surface(target.get_size()).convert()
+        hovered = [button.is_hovered for button in buttons]
+        for button in buttons:
+            button.is_hovered = False
+        layer.fill(BLACK)
+        draw()
+        for button, is_hovered in zip(buttons, hovered):
+            button.is_hovered = is_hovered
+        screen = target
+        menu_layers[key] = layer
+        if len(menu_layers) > MENU_LAYER_CACHE_SIZE:
+            menu_layers.popitem(last=False)
+    else:
+        menu_layers.move_to_end(key)
+    return layer
+
+def show_menu_screen(key, draw, buttons):
+    """Bring a menu screen up to date, repainting only what changed since the last frame"""
+    global last_screen_key, full_redraw
+    if key != last_screen_key:
+        last_screen_key = key
+        full_redraw = True
+        screen.blit(get_menu_layer(key, draw, buttons), (0, 0))
+        for button in buttons:
+            if button.is_hovered:
+                button.draw()
+            button.changed = False
+        return
+
+    # Same screen: only buttons whose hover state changed need repainting
+    for button in buttons:
+        if button.changed:
+            screen.blit(get_menu_layer(key, draw, buttons), button.rect, button.rect)
+            button.draw()
+            dirty_rects.append(button.rect)
+            button.changed = False
+
+def present():
+    """Show this frame (the whole screen, or just the dirty rectangles); False if nothing changed"""
+    global full_redraw
+    presented = full_redraw or bool(dirty_rects)
+    if presented and screen is not display:
+        # One scale of the whole frame into the window; the dirty rectangles move along with it
+        scale_frame(screen, view_rect.size, display_view)
+        scale_x = view_rect.width / screen.get_width()
+        scale_y = view_rect.height / screen.get_height()
+        dirty_rects[:] = [window_rect(rect, scale_x, scale_y) for rect in dirty_rects]
+    if full_redraw or (dirty_rects and not dirty_rect_mode):
+        pygame.display.flip()
+    elif dirty_rects:
+        pygame.display.update(dirty_rects)
+    dirty_rects.clear()
+    full_redraw = False
+    return presented
+
+def window_rect(rect, scale_x, scale_y):
+    """The window area covered by a rectangle of a frame scaled into view_rect"""
+    left = view_rect.x + int(rect.left * scale_x)
+    top = view_rect.y + int(rect.top * scale_y)
+    right = view_rect.x + math.ceil(rect.right * scale_x)
+    bottom = view_rect.y + math.ceil(rect.bottom * scale_y)
+    # One pixel more on each side for smooth scaling, which blends in the neighbouring pixels
+    return pygame.Rect(left - 1, top - 1, right - left + 2, bottom - top + 2).clip(view_rect)
+
+def window_to_logical(position):
+    """Map a window position (the mouse) to SCREEN_WIDTH x SCREEN_HEIGHT coordinates"""
+    x, y = position
+    return ((x - view_rect.x) * SCREEN_WIDTH // view_rect.width,
+            (y - view_rect.y) * SCREEN_HEIGHT // view_rect.height)
+
+def set_display_mode():
+    """(Re)create the window for the current fullscreen setting, and the surfaces drawn into it"""
+    global display, view_rect, display_view
+    if fullscreen:
+        display = pygame.display.set_mode((FULL_SCREEN_WIDTH, FULL_SCREEN_HEIGHT), pygame.FULLSCREEN)
+    else:
+        display = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    display.fill(BLACK)
+
+    # The largest area of the window with the game's aspect ratio, centered (black bars around it)
+    fit = min(display.get_width() / SCREEN_WIDTH, display.get_height() / SCREEN_HEIGHT)
+    view_rect = pygame.Rect(0, 0, round(SCREEN_WIDTH * fit), round(SCREEN_HEIGHT * fit))
+    view_rect.center = display.get_rect().center
+    display_view = display.subsurface(view_rect)
+    create_framebuffer()
+
+def create_framebuffer():
+    """(Re)create the framebuffer for the current render scale, and the menu canvas"""
+    global framebuffer, menu_canvas, screen
+    size = (round(SCREEN_WIDTH * render_scale), round(SCREEN_HEIGHT * render_scale))
+    # Drawn straight into the window when no scaling is needed
+    framebuffer = display if size == display.get_size() else pygame.Surface(size).convert()
+    # Menus are laid out at the logical resolution; they only change on input, so scaling them is cheap
+    if display.get_size() == (SCREEN_WIDTH, SCREEN_HEIGHT):
+        menu_canvas = display
+    elif framebuffer.get_size() == (SCREEN_WIDTH, SCREEN_HEIGHT):
+        menu_canvas = framebuffer
+    else:
+        menu_canvas = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
+    screen = framebuffer if game_state == GAME else menu_canvas
+    invalidate_background_cache()
+
+def init_display():
+    """Start pygame's display and fonts and open the window"""
+    global FULL_SCREEN_WIDTH, FULL_SCREEN_HEIGHT, scale_frame
+    # Only the modules the game needs; the mixer is started by the asset loader (see get_audio)
+    pygame.display.init()
+    pygame.font.init()
+
+    # Get actual screen dimensions for fullscreen (before set_mode, which changes them to the window's)
+    info = pygame.display.Info()
+    if info.current_w > 0 and info.current_h > 0:
+        FULL_SCREEN_WIDTH = info.current_w
+        FULL_SCREEN_HEIGHT = info.current_h
+
+    scale_frame = pygame.transform.smoothscale if args.smooth_scaling else pygame.transform.scale
+    set_display_mode()
+    pygame.display.set_caption("Car Racing Game")
+
+    # Set up icon
     try:
-        # Create simple beep sounds
-        sample_rate = 44100
-        duration = 0.5  # seconds
-        
-        # Engine sound (low hum)
-        buffer = numpy.sin(2 * numpy.pi * numpy.arange(sample_rate * duration) * 100 / sample_rate).astype(numpy.float32)
-        engine_sound = pygame.mixer.Sound(buffer)
-        
-        # Crash sound (noise)
-        buffer = numpy.random.rand(int(sample_rate * duration)).astype(numpy.float32)
-        crash_sound = pygame.mixer.Sound(buffer)
-        
-        # Gear shift sound (short beep)
-        buffer = numpy.sin(2 * numpy.pi * numpy.arange(sample_rate * 0.1) * 440 / sample_rate).astype(numpy.float32)
-        gear_shift_sound = pygame.mixer.Sound(buffer)
-        
-        # Menu select sound (higher beep)
-        buffer = numpy.sin(2 * numpy.pi * numpy.arange(sample_rate * 0.1) * 880 / sample_rate).astype(numpy.float32)
-        menu_select_sound = pygame.mixer.Sound(buffer)
+        icon = pygame.Surface((32, 32))
+        icon.fill((255, 0, 0))
+        pygame.draw.rect(icon, (0, 0, 255), (5, 5, 22, 22))
+        pygame.display.set_icon(icon)
     except:
-        # If sound creation fails, create dummy sound objects
-        class DummySound:
-            def play(self, loops=0): pass
-            def stop(self): pass
-            def set_volume(self, vol): pass
-        
-        engine_sound = DummySound()
-        crash_sound = DummySound()
-        gear_shift_sound = DummySound()
-        menu_select_sound = DummySound()
-
-# Set up icon
-try:
-    icon = pygame.Surface((32, 32))
-    icon.fill((255, 0, 0))
-    pygame.draw.rect(icon, (0, 0, 255), (5, 5, 22, 22))
-    pygame.display.set_icon(icon)
-except:
-    pass
+        pass
+
+def get_font(name, scale=1):
+    """Look up one of the FONT_SIZES fonts at a render scale, loading it on first use"""
+    font = fonts.get((name, scale))
+    if font is None:
+        font = fonts[name, scale] = pygame.font.SysFont(None, max(1, round(FONT_SIZES[name] * scale)))
+    return font
+
+def get_audio():
+    """The game's sounds, created (and the mixer started) on first use; see queue_assets for the loading"""
+    global audio
+    if audio is None:
+        try:
+            pygame.mixer.init()
+        except pygame.error as e:
+            print(f"Sound disabled: {e}")
+        try:
+            os.makedirs(sound_dir, exist_ok=True)
+        except OSError:  # read-only install; Audio keeps the sounds in memory instead
+            pass
+        audio = Audio(sound_dir)
+    return audio
+
+def play_sound(name):
+    # Sounds still loading in the background are skipped
+    if sound_enabled and audio is not None:
+        audio.play(name)
+
+def update_engine_sound():
+    if sound_enabled and audio is not None:
+        audio.update_engine(state.car_speed, state.current_gear, state.car_type["max_speed"])
+
+def stop_engine_sound():
+    if audio is not None:
+        audio.stop_engine()
+
+# The window, and the part of it the game is shown in (see set_display_mode)
+display = None
+view_rect = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+display_view = None
+FULL_SCREEN_WIDTH = SCREEN_WIDTH
+FULL_SCREEN_HEIGHT = SCREEN_HEIGHT
+
+# The game scene is drawn into the framebuffer at render_scale times the logical resolution, menus
+# into the menu canvas at the logical resolution; present() scales either one into the window with
+# scale_frame. screen is the one being drawn this frame. Without scaling all three are the window.
+render_scale = args.render_scale
+framebuffer = None
+menu_canvas = None
+screen = None
+scale_frame = pygame.transform.scale
+
+# Sounds, created by get_audio() on the asset loader's thread
+audio = None
 
 # Colors
 BLACK = (0, 0, 0)
@@ -207,21 +385,16 @@ COLOR_SELECT = 2
 SETTINGS = 3
 GAME = 4
 GAME_OVER = 5
+LOADING = 6
 
 # Current game state
-game_state = MENU
+game_state = LOADING
 
-# Font
-font_large = pygame.font.SysFont(None, 60)
-font_medium = pygame.font.SysFont(None, 40)
-font_small = pygame.font.SysFont(None, 30)
+# Fonts by (name, render scale), loaded by get_font() on first use
+FONT_SIZES = {"large": 60, "medium": 40, "small": 30, "tiny": 20}
+fonts = {}
 
 # Car options
-car_types = [
-    {"name": "Sedan", "width": 40, "height": 70, "acceleration": 0.1, "max_speed": 20, "handling": 3},
-    {"name": "Sports", "width": 40, "height": 65, "acceleration": 0.15, "max_speed": 25, "handling": 4},
-    {"name": "SUV", "width": 45, "height": 80, "acceleration": 0.08, "max_speed": 18, "handling": 2}
-]
 selected_car_index = 0
 
 # Car colors
@@ -231,61 +404,142 @@ selected_color_index = 0
 # Game settings
 fullscreen = False
 sound_enabled = True
-difficulty = 1  # 1=easy, 2=medium, 3=hard
-background_mode = 0  # 0=day, 1=sunset, 2=night
+difficulty = args.difficulty  # 1=easy, 2=medium, 3=hard
+background_mode = args.background  # 0=day, 1=sunset, 2=night
 
 # Game variables
-score = 0
 high_score = 0
-game_time = 0
-
-# Car properties
-car_width = car_types[selected_car_index]["width"]
-car_height = car_types[selected_car_index]["height"]
-car_x = SCREEN_WIDTH // 2 - car_width // 2
-# Position the car vertically between center and bottom (about 3/4 down the screen)
-car_y = SCREEN_HEIGHT * 3 // 4 - car_height // 2
-car_speed = 0
-car_acceleration = car_types[selected_car_index]["acceleration"]
-car_max_speed = car_types[selected_car_index]["max_speed"]
-car_rotation = 0
-car_rotation_speed = car_types[selected_car_index]["handling"]
-car_friction = 0.05
+
+# Best runs of every car and difficulty, kept on disk between sessions; opened by main() and
+# loaded by the asset loader. last_run is the run that just ended, as the leaderboard lists it
+leaderboard = None
+last_run = None
+LEADERBOARD_LINES = 5  # runs listed on the game over screen
+
+# Player car color (the rest of the car lives in the simulation state)
 car_color = car_colors[selected_color_index]
 
-# Gear system
-current_gear = 1
-max_gear = 5
-gear_speeds = {
-    1: 5,
-    2: 8,
-    3: 12,
-    4: 16,
-    5: 20
-}
-
-# Road properties
-road_width = 400
-road_x = (SCREEN_WIDTH - road_width) // 2
-road_line_width = 10
-road_line_height = 50
-road_line_gap = 30
-road_lines = []
-for i in range(-1, SCREEN_HEIGHT // (road_line_height + road_line_gap) + 2):
-    road_lines.append(i * (road_line_height + road_line_gap))
-
-# Traffic cars
-traffic_cars = []
-traffic_spawn_timer = 0
-traffic_spawn_delay = 120  # frames between spawns
-
-# Trees
-trees = []
-tree_spawn_timer = 0
-
-# Game loop
-clock = pygame.time.Clock()
-running = True
+# Simulation state and the edge-triggered inputs (gear shifts) waiting for the next step
+state = GameState(selected_car_index, difficulty)
+previous_state = state
+pending_inputs = 0
+
+# Interpolated state drawn last frame; its buffers are reused for the next one
+game_view = None
+
+# Input recording of the current game (--record) and the ticks left to play back (--replay)
+recorder = None
+replay_inputs = None
+
+# Connection to the race server (--connect); it predicts `state` between the server's snapshots
+net_client = None
+GHOST_ALPHA = 128  # the opponent's car is drawn see-through, since it drives on another copy of the road
+
+# Particle effects (see particles.py), moved along with the road as view.distance changes
+particles = ParticleSystem(SCREEN_HEIGHT)
+particle_distance = None  # view.distance when the particles were last updated
+EXHAUST_COLOR = (150, 150, 160)
+SMOKE_COLOR = (210, 210, 210)
+EXHAUST_RATE = 40  # exhaust particles per second while the throttle is held
+SHIFT_SMOKE = 12  # tire smoke particles per rear wheel on a gear shift
+CRASH_DEBRIS = 60  # debris particles per car in a crash
+CRASH_SMOKE = 40
+CRASH_LINGER = 1.0  # seconds the wreck stays on screen before the game over screen
+crash_linger = None  # seconds left of it, once the car has crashed
+
+# Fixed-timestep loop: unsimulated time carried between frames, and how many
+# ticks one frame may run before the game slows down instead of catching up
+accumulator = 0.0
+MAX_TICKS_PER_FRAME = 5
+FRAME_RATE = 60  # display frame cap; the simulation always runs at TICK_RATE
+
+# Background layers, keyed by (background_mode, screen size)
+background_cache = {}
+background_cache_stats = {"hits": 0, "misses": 0}
+
+# Sprite atlas: cars keyed by (width, height, color, direction, scale), trees by (background mode, scale)
+car_sprites = {}
+tree_sprites = {}
+# Rotated player sprites, least recently used first
+rotated_car_sprites = OrderedDict()
+ROTATION_STEP = 1  # degrees per rotated sprite
+ROTATED_SPRITE_CACHE_SIZE = 64
+TREE_OFFSET = (-20, -40)  # sprite top-left relative to the tree's trunk position
+# Particle sprites by render scale: a list indexed like ParticleSystem.sprite_indices(), with each sprite's half size
+particle_sprites = {}
+PARTICLE_KEY = (255, 0, 255)  # colorkey of the particle sprites' transparent corners
+
+# Rendered track chunks keyed by (chunk key, background mode, scale), least recently used first;
+# enough for the chunks on screen and the next ones in both directions
+road_tiles = OrderedDict()
+ROAD_TILE_CACHE_SIZE = 16
+ROAD_TILE_KEY = (255, 0, 255)  # colorkey of the tiles' transparent parts
+
+# Rendered text keyed by (font, text, color), least recently used first
+text_cache = OrderedDict()
+TEXT_CACHE_SIZE = 256
+text_cache_stats = {"hits": 0, "misses": 0}
+
+# Dirty-rectangle rendering: when enabled, only regions that changed are repainted and presented
+dirty_rect_mode = args.dirty_rects
+dirty_rects = []
+full_redraw = True
+last_screen_key = None  # what the screen showed when it was last fully repainted
+game_sprite_rects = []  # where the moving GAME sprites were drawn last frame
+particle_rect = None  # the box around the particles drawn last frame
+road_rects = []  # where the road tiles were drawn last frame
+hud_lines = []  # (text, rect) of each HUD line last frame
+
+# Menu screens composed once per (state, selection, settings) key, least recently used first
+menu_layers = OrderedDict()
+MENU_LAYER_CACHE_SIZE = 16
+
+# Menus sleep on the event queue while idle, waking at least this often (ms)
+IDLE_TIMEOUT = 500
+
+# Frame profiler, toggled with F3; timings are written to PROFILE_CSV on exit
+PROFILE_PHASES = ("events", "simulation", "sound", "particles", "background", "sprites", "hud", "menus", "present",
+                  "wait")
+PROFILE_CSV = args.profile_csv
+PROFILE_OVERLAY_INTERVAL = 30  # frames between overlay refreshes
+profiler = FrameProfiler(PROFILE_PHASES, PROFILE_CSV)
+profile_overlay = None
+profile_overlay_age = 0
+
+# Input held down for a whole benchmark run (--hold)
+BENCHMARK_INPUTS = {"none": 0, "up": INPUT_UP, "down": INPUT_DOWN}
+
+# Seconds from STARTED to the end of each startup phase, printed once the first frame is shown
+startup_times = {}
+
+def render_text(font, text, color):
+    """Font.render with antialiasing, served from the text cache when possible"""
+    key = (font, text, color)
+    surface = text_cache.get(key)
+    if surface is None:
+        text_cache_stats["misses"] += 1
+        surface = font.render(text, True, color)
+        text_cache[key] = surface
+        if len(text_cache) > TEXT_CACHE_SIZE:
+            text_cache.popitem(last=False)
+    else:
+        text_cache_stats["hits"] += 1
+        text_cache.move_to_end(key)
+    return surface
+
+def text_blits(font, text, color, position):
+    """Blits and bounding rect for text whose digits are composed from cached glyphs"""
+    x, y = position
+    height = 0
+    blits = []
+    # Digits are rendered one glyph at a time so changing numbers never miss the cache
+    for piece in re.split(r"(\d)", text):
+        if piece:
+            surface = render_text(font, piece, color)
+            blits.append((surface, (x, y)))
+            x += surface.get_width()
+            height = max(height, surface.get_height())
+    return blits, pygame.Rect(position, (x - position[0], height))
 
 # Button class for menus
 class Button:
@@ -295,18 +549,22 @@ class Button:
         self.color = color
         self.hover_color = hover_color
         self.is_hovered = False
+        self.changed = False  # hover state changed since the button was last drawn
         
     def draw(self):
         color = self.hover_color if self.is_hovered else self.color
         pygame.draw.rect(screen, color, self.rect, border_radius=10)
         pygame.draw.rect(screen, BLACK, self.rect, 3, border_radius=10)
         
-        text_surface = font_medium.render(self.text, True, BLACK)
+        text_surface = render_text(get_font("medium"), self.text, BLACK)
         text_rect = text_surface.get_rect(center=self.rect.center)
         screen.blit(text_surface, text_rect)
         
     def check_hover(self, mouse_pos):
-        self.is_hovered = self.rect.collidepoint(mouse_pos)
+        hovered = self.rect.collidepoint(mouse_pos)
+        if hovered != self.is_hovered:
+            self.is_hovered = hovered
+            self.changed = True
         return self.is_hovered
         
     def is_clicked(self, mouse_pos, mouse_click):
@@ -326,6 +584,8 @@ fullscreen_button = Button(SCREEN_WIDTH//2 - 150, 150, 300, 50, "Fullscreen: Off
 sound_button = Button(SCREEN_WIDTH//2 - 150, 220, 300, 50, "Sound: On")
 difficulty_button = Button(SCREEN_WIDTH//2 - 150, 290, 300, 50, "Difficulty: Easy")
 background_button = Button(SCREEN_WIDTH//2 - 150, 360, 300, 50, "Background: Day")
+renderer_button = Button(SCREEN_WIDTH//2 - 150, 430, 300, 50, "Renderer: Full")
+resolution_button = Button(SCREEN_WIDTH//2 - 150, 500, 300, 50, "Resolution: Full")
 
 # Car selection buttons
 prev_car_button = Button(SCREEN_WIDTH//4 - 50, SCREEN_HEIGHT//2, 100, 40, "Previous")
@@ -341,156 +601,440 @@ select_color_button = Button(SCREEN_WIDTH//2 - 60, SCREEN_HEIGHT - 100, 120, 40,
 play_again_button = Button(SCREEN_WIDTH//2 - 100, 300, 200, 50, "Play Again")
 menu_button = Button(SCREEN_WIDTH//2 - 100, 370, 200, 50, "Main Menu")
 
-def draw_car(x, y, rotation, car_type, color):
-    # Create a surface for the car
-    car_surface = pygame.Surface((car_type["width"], car_type["height"]), pygame.SRCALPHA)
-    
+def render_car_sprite(width, height, color, direction):
+    """Render a car once; "up" cars have headlights at the top, "down" cars at the bottom"""
+    car_surface = pygame.Surface((width, height), pygame.SRCALPHA)
+
     # Draw car body
-    pygame.draw.rect(car_surface, color, (0, 0, car_type["width"], car_type["height"]), border_radius=5)
-    
+    pygame.draw.rect(car_surface, color, (0, 0, width, height), border_radius=5)
+
     # Draw windows
-    pygame.draw.rect(car_surface, BLUE, (5, 10, car_type["width"] - 10, 15))
-    pygame.draw.rect(car_surface, BLUE, (5, car_type["height"] - 30, car_type["width"] - 10, 15))
-    
+    pygame.draw.rect(car_surface, BLUE, (5, 10, width - 10, 15))
+    pygame.draw.rect(car_surface, BLUE, (5, height - 30, width - 10, 15))
+
     # Draw wheels
     pygame.draw.rect(car_surface, BLACK, (-5, 10, 10, 20), border_radius=5)
-    pygame.draw.rect(car_surface, BLACK, (car_type["width"] - 5, 10, 10, 20), border_radius=5)
-    pygame.draw.rect(car_surface, BLACK, (-5, car_type["height"] - 30, 10, 20), border_radius=5)
-    pygame.draw.rect(car_surface, BLACK, (car_type["width"] - 5, car_type["height"] - 30, 10, 20), border_radius=5)
-    
-    # Add headlights
-    pygame.draw.circle(car_surface, YELLOW, (5, 5), 3)
-    pygame.draw.circle(car_surface, YELLOW, (car_type["width"] - 5, 5), 3)
-    
-    # Add taillights
-    pygame.draw.circle(car_surface, RED, (5, car_type["height"] - 5), 3)
-    pygame.draw.circle(car_surface, RED, (car_type["width"] - 5, car_type["height"] - 5), 3)
-    
-    # Rotate the car
-    rotated_car = pygame.transform.rotate(car_surface, rotation)
-    new_rect = rotated_car.get_rect(center=(x + car_type["width"] // 2, y + car_type["height"] // 2))
-    
-    # Draw the rotated car
-    screen.blit(rotated_car, new_rect.topleft)
-    
-    return new_rect  # Return the rectangle for collision detection
-
-def draw_traffic_car(car):
-    # Draw a traffic car
-    car_surface = pygame.Surface((car["width"], car["height"]), pygame.SRCALPHA)
-    pygame.draw.rect(car_surface, car["color"], (0, 0, car["width"], car["height"]), border_radius=5)
-    pygame.draw.rect(car_surface, BLUE, (5, 10, car["width"] - 10, 15))
-    pygame.draw.rect(car_surface, BLUE, (5, car["height"] - 30, car["width"] - 10, 15))
-    pygame.draw.rect(car_surface, BLACK, (-5, 10, 10, 20), border_radius=5)
-    pygame.draw.rect(car_surface, BLACK, (car["width"] - 5, 10, 10, 20), border_radius=5)
-    pygame.draw.rect(car_surface, BLACK, (-5, car["height"] - 30, 10, 20), border_radius=5)
-    pygame.draw.rect(car_surface, BLACK, (car["width"] - 5, car["height"] - 30, 10, 20), border_radius=5)
-    
+    pygame.draw.rect(car_surface, BLACK, (width - 5, 10, 10, 20), border_radius=5)
+    pygame.draw.rect(car_surface, BLACK, (-5, height - 30, 10, 20), border_radius=5)
+    pygame.draw.rect(car_surface, BLACK, (width - 5, height - 30, 10, 20), border_radius=5)
+
     # Add headlights and taillights
-    if car["direction"] == "down":
-        # Taillights (red) at the top
-        pygame.draw.circle(car_surface, RED, (5, 5), 3)
-        pygame.draw.circle(car_surface, RED, (car["width"] - 5, 5), 3)
-        # Headlights (yellow) at the bottom
-        pygame.draw.circle(car_surface, YELLOW, (5, car["height"] - 5), 3)
-        pygame.draw.circle(car_surface, YELLOW, (car["width"] - 5, car["height"] - 5), 3)
+    front, back = (YELLOW, RED) if direction == "up" else (RED, YELLOW)
+    pygame.draw.circle(car_surface, front, (5, 5), 3)
+    pygame.draw.circle(car_surface, front, (width - 5, 5), 3)
+    pygame.draw.circle(car_surface, back, (5, height - 5), 3)
+    pygame.draw.circle(car_surface, back, (width - 5, height - 5), 3)
+
+    return car_surface.convert_alpha()
+
+def scale_sprite(sprite, scale):
+    """A sprite drawn at the logical resolution, resized for a render scale"""
+    if scale == 1:
+        return sprite
+    width, height = sprite.get_size()
+    return pygame.transform.smoothscale(sprite, (max(1, round(width * scale)), max(1, round(height * scale))))
+
+def get_car_sprite(width, height, color, direction="up", scale=1):
+    """Look up a car sprite in the atlas, rendering it on first use"""
+    key = (width, height, color, direction, scale)
+    sprite = car_sprites.get(key)
+    if sprite is None:
+        sprite = scale_sprite(render_car_sprite(width, height, color, direction), scale)
+        car_sprites[key] = sprite
+    return sprite
+
+def get_rotated_car_sprite(car_type, color, rotation, scale=1):
+    """Look up a rotated player sprite, keeping the most recent angles in an LRU"""
+    key = (car_type["width"], car_type["height"], color, round(rotation / ROTATION_STEP) % (360 // ROTATION_STEP),
+           scale)
+    sprite = rotated_car_sprites.get(key)
+    if sprite is None:
+        base = get_car_sprite(car_type["width"], car_type["height"], color, scale=scale)
+        sprite = pygame.transform.rotate(base, key[3] * ROTATION_STEP)
+        rotated_car_sprites[key] = sprite
+        if len(rotated_car_sprites) > ROTATED_SPRITE_CACHE_SIZE:
+            rotated_car_sprites.popitem(last=False)
     else:
-        # Headlights (yellow) at the top
-        pygame.draw.circle(car_surface, YELLOW, (5, 5), 3)
-        pygame.draw.circle(car_surface, YELLOW, (car["width"] - 5, 5), 3)
-        # Taillights (red) at the bottom
-        pygame.draw.circle(car_surface, RED, (5, car["height"] - 5), 3)
-        pygame.draw.circle(car_surface, RED, (car["width"] - 5, car["height"] - 5), 3)
-    
-    screen.blit(car_surface, (car["x"], car["y"]))
-    
-    return pygame.Rect(car["x"], car["y"], car["width"], car["height"])
+        rotated_car_sprites.move_to_end(key)
+    return sprite
 
-def draw_tree(tree):
-    # Draw a tree
+def render_tree_sprite(mode):
+    """Render a tree for a background mode; the trunk's top-left sits at TREE_OFFSET"""
+    tree_surface = pygame.Surface((50, 70), pygame.SRCALPHA)
     trunk_width = 10
     trunk_height = 30
-    trunk_x = tree["x"]
-    trunk_y = tree["y"]
-    
+    trunk_x, trunk_y = -TREE_OFFSET[0], -TREE_OFFSET[1]
+
     # Adjust tree appearance based on background mode
-    if background_mode == 0:  # Day
+    if mode == 0:  # Day
         # Draw trunk
-        pygame.draw.rect(screen, (139, 69, 19), (trunk_x, trunk_y, trunk_width, trunk_height))
+        pygame.draw.rect(tree_surface, (139, 69, 19), (trunk_x, trunk_y, trunk_width, trunk_height))
         # Draw foliage
-        pygame.draw.circle(screen, (0, 100, 0), (trunk_x + trunk_width//2, trunk_y - 15), 25)
-    elif background_mode == 1:  # Sunset
+        pygame.draw.circle(tree_surface, (0, 100, 0), (trunk_x + trunk_width//2, trunk_y - 15), 25)
+    elif mode == 1:  # Sunset
         # Draw trunk
-        pygame.draw.rect(screen, (100, 50, 10), (trunk_x, trunk_y, trunk_width, trunk_height))
+        pygame.draw.rect(tree_surface, (100, 50, 10), (trunk_x, trunk_y, trunk_width, trunk_height))
         # Draw foliage with sunset lighting
-        pygame.draw.circle(screen, (0, 80, 0), (trunk_x + trunk_width//2, trunk_y - 15), 25)
-        pygame.draw.circle(screen, (255, 165, 0), (trunk_x + trunk_width//2, trunk_y - 25), 10, 2)
+        pygame.draw.circle(tree_surface, (0, 80, 0), (trunk_x + trunk_width//2, trunk_y - 15), 25)
+        pygame.draw.circle(tree_surface, (255, 165, 0), (trunk_x + trunk_width//2, trunk_y - 25), 10, 2)
     else:  # Night
         # Draw trunk
-        pygame.draw.rect(screen, (60, 30, 10), (trunk_x, trunk_y, trunk_width, trunk_height))
+        pygame.draw.rect(tree_surface, (60, 30, 10), (trunk_x, trunk_y, trunk_width, trunk_height))
         # Draw foliage
-        pygame.draw.circle(screen, (0, 40, 0), (trunk_x + trunk_width//2, trunk_y - 15), 25)
+        pygame.draw.circle(tree_surface, (0, 40, 0), (trunk_x + trunk_width//2, trunk_y - 15), 25)
 
-def draw_road():
-    # Draw road
-    pygame.draw.rect(screen, DARK_GRAY, (road_x, 0, road_width, SCREEN_HEIGHT))
+    return tree_surface.convert_alpha()
 
-    # Draw only center line
-    for y in road_lines:
-        # Adjust line color based on background mode
-        line_color = WHITE
-        if background_mode == 2:  # Night mode - make lines glow
-            line_color = (255, 255, 200)  # Slightly yellow to simulate reflection
+def get_tree_sprite(mode, scale=1):
+    """Look up the tree sprite for a background mode"""
+    sprite = tree_sprites.get((mode, scale))
+    if sprite is None:
+        sprite = scale_sprite(render_tree_sprite(mode), scale)
+        tree_sprites[mode, scale] = sprite
+    return sprite
 
-        # Draw center line only
-        pygame.draw.rect(screen, line_color, (SCREEN_WIDTH // 2 - road_line_width // 2, y, road_line_width, road_line_height))
+def render_road_tile(chunk, mode, scale=1):
+    """Render a track chunk's asphalt, yellow edges and dashed lane lines on a colorkeyed tile
 
-    # Add road edges
+    Returns the tile and the x of its left edge in framebuffer pixels; the
+    tile's top row is the chunk's furthest row.
+    """
+    # Road geometry of every pixel row, furthest first, and the logical x of every pixel column
+    rows = (numpy.arange(round(CHUNK_LENGTH * scale)) / scale).astype(int)
+    center = chunk["center"][::-1][rows]
+    width = chunk["width"][::-1][rows]
+    lanes = chunk["lanes"][::-1][rows]
+    left = center - width / 2
+    right = center + width / 2
+    x0 = math.floor(left.min() * scale)
+    columns = (numpy.arange(x0, math.ceil(right.max() * scale)) / scale)[:, None]  # surfarray order: x, y
+
+    # Palette indices: 0 transparent, 1 asphalt, 2 edge, 3 lane line
     edge_width = 5
-    pygame.draw.rect(screen, YELLOW, (road_x, 0, edge_width, SCREEN_HEIGHT))
-    pygame.draw.rect(screen, YELLOW, (road_x + road_width - edge_width, 0, edge_width, SCREEN_HEIGHT))
-
-def draw_hud():
-    # Draw speed
-    speed_text = f"Speed: {abs(int(car_speed * 10))} km/h"
-    speed_surface = font_small.render(speed_text, True, WHITE)
-    screen.blit(speed_surface, (20, 20))
-    
-    # Draw gear
-    gear_text = f"Gear: {current_gear}"
-    gear_surface = font_small.render(gear_text, True, WHITE)
-    screen.blit(gear_surface, (20, 50))
-    
-    # Draw score
-    score_text = f"Score: {score}"
-    score_surface = font_small.render(score_text, True, WHITE)
-    screen.blit(score_surface, (SCREEN_WIDTH - 150, 20))
-    
-    # Draw high score
-    high_score_text = f"High Score: {high_score}"
-    high_score_surface = font_small.render(high_score_text, True, WHITE)
-    screen.blit(high_score_surface, (SCREEN_WIDTH - 200, 50))
-    
-    # Draw car type
-    car_type_text = f"Car: {car_types[selected_car_index]['name']}"
-    car_type_surface = font_small.render(car_type_text, True, WHITE)
-    screen.blit(car_type_surface, (20, 80))
-    
-    # Draw difficulty
+    pixels = numpy.zeros((len(columns), len(rows)), dtype=numpy.uint8)
+    on_road = (columns >= left) & (columns < right)
+    pixels[on_road] = 1
+    pixels[on_road & ((columns < left + edge_width) | (columns >= right - edge_width))] = 2
+    # A dash starts every road_line_height + road_line_gap rows along the track
+    distance = chunk["index"] * CHUNK_LENGTH + CHUNK_LENGTH - 1 - rows
+    dash = (SCREEN_HEIGHT - distance) % (road_line_height + road_line_gap) < road_line_height
+    for divider in range(1, MAX_LANES):
+        x = left + divider * width / lanes
+        pixels[(columns >= x - road_line_width / 2) & (columns < x + road_line_width / 2) &
+               dash & (divider < lanes)] = 3
+
+    # Night mode - make lines glow slightly yellow to simulate reflection
+    tile = pygame.Surface(pixels.shape, depth=8)
+    tile.set_palette([ROAD_TILE_KEY, DARK_GRAY, YELLOW, (255, 255, 200) if mode == 2 else WHITE])
+    pygame.surfarray.blit_array(tile, pixels)
+    tile = tile.convert()
+    tile.set_colorkey(ROAD_TILE_KEY, pygame.RLEACCEL)
+    return tile, x0
+
+def get_road_tile(track, index, mode, scale=1):
+    """Look up the rendered tile of a track chunk, keeping the most recent ones in an LRU"""
+    chunk = track.chunk(index)
+    key = (chunk["key"], mode, scale)
+    tile = road_tiles.get(key)
+    if tile is None:
+        tile = render_road_tile(chunk, mode, scale)
+        road_tiles[key] = tile
+        if len(road_tiles) > ROAD_TILE_CACHE_SIZE:
+            road_tiles.popitem(last=False)
+    else:
+        road_tiles.move_to_end(key)
+    return tile
+
+def draw_car(x, y, rotation, car_type, color):
+    # Draw the pre-rendered car at the requested rotation
+    rotated_car, position = car_blit(x, y, rotation, car_type, color)
+    return screen.blit(rotated_car, position)
+
+def car_blit(x, y, rotation, car_type, color, scale=1):
+    # Sprite and position of a car rotated around its center
+    rotated_car = get_rotated_car_sprite(car_type, color, rotation, scale)
+    center = ((x + car_type["width"] // 2) * scale, (y + car_type["height"] // 2) * scale)
+    return rotated_car, rotated_car.get_rect(center=center).topleft
+
+def traffic_blits(traffic):
+    # Sprites and positions of the traffic cars on screen, in framebuffer pixels
+    y = traffic.y[:traffic.count]
+    live = numpy.flatnonzero((y < SCREEN_HEIGHT) & (y + traffic.height[:traffic.count] > 0))
+    sprites = [get_car_sprite(width, height, traffic_colors[color], "down" if direction == DOWN else "up",
+                              render_scale)
+               for width, height, color, direction in zip(traffic.width[live].tolist(),
+                                                          traffic.height[live].tolist(),
+                                                          traffic.color[live].tolist(),
+                                                          traffic.direction[live].tolist())]
+    x = (traffic.x[live] * render_scale).astype(int)
+    y = (traffic.y[live] * render_scale).astype(int)
+    return list(zip(sprites, zip(x.tolist(), y.tolist())))
+
+def tree_blits(trees):
+    # Sprites and positions of all trees
+    tree_sprite = get_tree_sprite(background_mode, render_scale)
+    live = slice(0, trees.count)
+    x = (trees.x[live] * render_scale).astype(int) + round(TREE_OFFSET[0] * render_scale)
+    y = (trees.y[live] * render_scale).astype(int) + round(TREE_OFFSET[1] * render_scale)
+    return [(tree_sprite, position) for position in zip(x.tolist(), y.tolist())]
+
+def render_particle_sprite(shape, radius, color, alpha):
+    """Render one frame of a particle look: a round puff or a square chip of debris
+
+    The sprites are colorkeyed with a whole-surface alpha and RLE-accelerated,
+    which blits small sprites a few times faster than per-pixel alpha.
+    """
+    size = max(1, round(radius * 2))
+    sprite = pygame.Surface((size, size))
+    sprite.fill(PARTICLE_KEY)
+    if shape == "circle":
+        pygame.draw.circle(sprite, color, (size / 2, size / 2), size / 2)
+    else:
+        sprite.fill(color)
+    sprite = sprite.convert()
+    sprite.set_colorkey(PARTICLE_KEY, pygame.RLEACCEL)
+    sprite.set_alpha(alpha, pygame.RLEACCEL)
+    return sprite
+
+def get_particle_sprites(scale):
+    """The sprites of every particle look used so far at a render scale, and their half sizes as an array"""
+    sprites, half_sizes = particle_sprites.get(scale, ([], None))
+    if len(sprites) < len(particles.looks) * PARTICLE_FRAMES:
+        for style, color in particles.looks[len(sprites) // PARTICLE_FRAMES:]:
+            shape = PARTICLE_STYLES[style]["shape"]
+            sprites += [render_particle_sprite(shape, radius * scale, color, alpha)
+                        for radius, alpha in sprite_frames(style)]
+        half_sizes = numpy.array([sprite.get_width() // 2 for sprite in sprites])
+        particle_sprites[scale] = (sprites, half_sizes)
+    return sprites, half_sizes
+
+def particle_blits():
+    # Sprites and positions of the live particles in framebuffer pixels, and the box around them (or None).
+    # The blits are made one at a time as they are drawn: for thousands of particles, a list of them all
+    # costs more in allocation and garbage collection than the drawing does
+    if not particles.count:
+        return (), None
+    sprites, half_sizes = get_particle_sprites(render_scale)
+    index = particles.sprite_indices()
+    half = half_sizes[index]
+    live = slice(0, particles.count)
+    x = (particles.x[live] * render_scale).astype(numpy.intp) - half
+    y = (particles.y[live] * render_scale).astype(numpy.intp) - half
+    left, top = int(x.min()), int(y.min())
+    rect = pygame.Rect(left, top, int((x + 2 * half).max()) + 1 - left, int((y + 2 * half).max()) + 1 - top)
+    return zip(map(sprites.__getitem__, index.tolist()), zip(x.tolist(), y.tolist())), rect
+
+def car_point(view, right, back):
+    # Screen position of a point `right` and `back` from the player car's center; the car points up
+    # when its rotation is 0 and turns counter-clockwise
+    car_type = view.car_type
+    angle = math.radians(view.car_rotation)
+    return (view.car_x + car_type["width"] / 2 + right * math.cos(angle) + back * math.sin(angle),
+            view.car_y + car_type["height"] / 2 - right * math.sin(angle) + back * math.cos(angle))
+
+def update_particles(view, events, throttle, seconds):
+    # Move the particles along with the road, then add this frame's exhaust, tire smoke and crash debris
+    global particle_distance
+    scroll = view.distance - particle_distance if particle_distance is not None else 0.0
+    particle_distance = view.distance
+    particles.update(seconds, scroll)
+
+    car_type = view.car_type
+    width, height = car_type["width"], car_type["height"]
+    backwards = math.pi / 2 - math.radians(view.car_rotation)
+    if throttle and not view.game_over:
+        particles.emit("exhaust", EXHAUST_COLOR, EXHAUST_RATE * seconds, *car_point(view, -width / 4, height / 2),
+                       backwards)
+    if "gear_shift" in events:
+        for wheel in (-0.4, 0.4):
+            particles.emit("smoke", SMOKE_COLOR, SHIFT_SMOKE, *car_point(view, wheel * width, 0.35 * height),
+                           backwards)
+    if "crash" in events:
+        x, y = car_point(view, 0, 0)
+        colors = [car_color]
+        slot = view.crash_slot
+        if 0 <= slot < view.traffic.count:
+            # Debris flies from halfway between the two cars
+            traffic = view.traffic
+            x = (x + traffic.x[slot] + traffic.width[slot] / 2) / 2
+            y = (y + traffic.y[slot] + traffic.height[slot] / 2) / 2
+            colors.append(traffic_colors[traffic.color[slot]])
+        for color in colors:
+            particles.emit("debris", color, CRASH_DEBRIS, x, y)
+        particles.emit("smoke", SMOKE_COLOR, CRASH_SMOKE, x, y, spread=math.pi)
+    if args.particles > particles.count:
+        # Benchmark load: chips bursting out of the middle of the screen
+        particles.emit("debris", SMOKE_COLOR, args.particles - particles.count, SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2)
+
+def road_blits(view):
+    # Tiles and positions of the track chunks on screen; screen row y shows the track
+    # base + SCREEN_HEIGHT - y rows along, so a chunk's furthest row is its top
+    base = math.floor(view.distance)
+    first = (base + 1) // CHUNK_LENGTH
+    last = (base + SCREEN_HEIGHT) // CHUNK_LENGTH
+    blits = []
+    for index in range(first, last + 1):
+        tile, x = get_road_tile(view.track, index, background_mode, render_scale)
+        top = base + SCREEN_HEIGHT + 1 - (index + 1) * CHUNK_LENGTH
+        blits.append((tile, (x, round(top * render_scale))))
+    # Render the next chunk in the driving direction before it scrolls into view
+    get_road_tile(view.track, last + 1 if view.car_speed >= 0 else first - 1, background_mode, render_scale)
+    return blits
+
+def render_profile_overlay():
+    # Panel with the rolling p50/p95/p99 frame time of each phase, in milliseconds
+    stats = profiler.percentiles()
+    rows = [("ms", ("p50", "p95", "p99"))] + [(phase, [f"{value:.2f}" for value in values])
+                                             for phase, values in stats.items()]
+    font = get_font("tiny", render_scale)
+    line_height = font.get_linesize()
+    panel = pygame.Surface((round(230 * render_scale), line_height * len(rows) + round(8 * render_scale)),
+                           pygame.SRCALPHA)
+    panel.fill((0, 0, 0, 180))
+    for i, (name, values) in enumerate(rows):
+        y = round(4 * render_scale) + i * line_height
+        blits, _ = text_blits(font, name, WHITE, (round(6 * render_scale), y))
+        for column, value in enumerate(values):
+            blits += text_blits(font, value, WHITE, (round((95 + column * 45) * render_scale), y))[0]
+        panel.blits(blits, doreturn=False)
+    return panel
+
+def profile_overlay_blit():
+    # The profiler panel in the bottom-left corner, refreshed every PROFILE_OVERLAY_INTERVAL frames
+    global profile_overlay, profile_overlay_age
+    profile_overlay_age += 1
+    if profile_overlay is None or profile_overlay_age >= PROFILE_OVERLAY_INTERVAL:
+        profile_overlay = render_profile_overlay()
+        profile_overlay_age = 0
+    return profile_overlay, (0, screen.get_height() - profile_overlay.get_height())
+
+def ghost_blits(view):
+    # The opponent's car in a network race, placed by how far ahead or behind it is
+    opponent = net_client.interpolate_opponent() if net_client is not None else None
+    if opponent is None:
+        return []
+    car_index, x, distance, rotation, _ = opponent
+    y = view.car_y - (distance - view.distance)
+    if not -CHUNK_LENGTH < y < SCREEN_HEIGHT + CHUNK_LENGTH:
+        return []
+    opponent_color = car_colors[(selected_color_index + 1) % len(car_colors)]
+    sprite, position = car_blit(x, y, rotation, car_types[car_index], opponent_color, render_scale)
+    ghost = sprite.copy()
+    ghost.set_alpha(GHOST_ALPHA)
+    return [(ghost, position)]
+
+def game_blits(view):
+    # Everything in the GAME scene that moves over the road, back to front (trees never overlap the road)
+    blits = (tree_blits(view.trees) + traffic_blits(view.traffic) + ghost_blits(view) +
+             [car_blit(view.car_x, view.car_y, view.car_rotation, view.car_type, car_color, render_scale)])
+    if profiler.enabled:
+        blits.append(profile_overlay_blit())
+    return blits
+
+def draw_game(view):
+    # Draw the GAME scene; in dirty-rect mode only the regions that changed are repainted, while the road stands still
+    global game_sprite_rects, hud_lines, road_rects, particle_rect, full_redraw
+    road = road_blits(view)
+    profiler.lap("background")
+    sprites = game_blits(view)
+    profiler.lap("sprites")
+    smoke, smoke_rect = particle_blits()
+    profiler.lap("particles")
+    hud = hud_blits()
+    profiler.lap("hud")
+
+    # Once the road scrolls, the whole road band changes and repainting it rect by rect costs more than
+    # drawing the frame afresh, so a scrolling frame is drawn and presented whole, as the full renderer does
+    new_road_rects = [tile.get_rect(topleft=position) for tile, position in road]
+    if screen_needs_redraw((GAME, background_mode)) or new_road_rects != road_rects:
+        full_redraw = True
+        draw_background()
+        screen.blits(road, doreturn=False)
+        road_rects = new_road_rects
+        profiler.lap("background")
+        game_sprite_rects = screen.blits(sprites)
+        profiler.lap("sprites")
+        screen.blits(smoke, doreturn=False)
+        particle_rect = smoke_rect
+        profiler.lap("particles")
+        for _, blits, _ in hud:
+            screen.blits(blits, doreturn=False)
+        hud_lines = [(text, rect) for text, _, rect in hud]
+        profiler.lap("hud")
+        return
+
+    # Erase the sprites where they were last frame and paint them where they are now
+    new_rects = [surface.get_rect(topleft=position) for surface, position in sprites]
+    dirty = game_sprite_rects + new_rects
+    # The particles are too many to track one by one, so the box around them all is repainted
+    dirty += [rect for rect in (particle_rect, smoke_rect) if rect is not None]
+
+    # HUD panels stay on screen unless their text changed or a sprite passed under them
+    redrawn_hud = []
+    for i, (text, blits, rect) in enumerate(hud):
+        old_text, old_rect = hud_lines[i]
+        if text != old_text or rect.collidelist(dirty) != -1:
+            dirty += [old_rect, rect]
+            redrawn_hud += blits
+            hud_lines[i] = (text, rect)
+
+    profiler.lap("hud")
+    background = get_background()
+    screen.blits([(background, rect, rect) for rect in dirty], doreturn=False)
+    # The parts of the road tiles under each dirty rect
+    screen.blits([(tile, clip, clip.move(-tile_rect.x, -tile_rect.y))
+                  for (tile, _), tile_rect in zip(road, new_road_rects)
+                  for clip in (tile_rect.clip(rect) for rect in dirty) if clip], doreturn=False)
+    profiler.lap("background")
+    screen.blits(sprites, doreturn=False)
+    profiler.lap("sprites")
+    screen.blits(smoke, doreturn=False)
+    profiler.lap("particles")
+    screen.blits(redrawn_hud, doreturn=False)
+    profiler.lap("hud")
+    game_sprite_rects = new_rects
+    particle_rect = smoke_rect
+    dirty_rects.extend(dirty)
+
+def hud_blits():
+    # (text, blits, rect) for each HUD line
     difficulty_names = ["Easy", "Medium", "Hard"]
-    difficulty_text = f"Difficulty: {difficulty_names[difficulty-1]}"
-    difficulty_surface = font_small.render(difficulty_text, True, WHITE)
-    screen.blit(difficulty_surface, (SCREEN_WIDTH - 200, 80))
-    
-    # Draw background mode
     background_names = ["Day", "Sunset", "Night"]
-    bg_text = f"Background: {background_names[background_mode]} (Press B to change)"
-    bg_surface = font_small.render(bg_text, True, WHITE)
-    screen.blit(bg_surface, (SCREEN_WIDTH // 2 - bg_surface.get_width() // 2, 20))
+    lines = [
+        (f"Speed: {abs(int(state.car_speed * 10))} km/h", (20, 20)),
+        (f"Gear: {state.current_gear}", (20, 50)),
+        (f"Score: {state.score}", (SCREEN_WIDTH - 150, 20)),
+        (f"High Score: {high_score}", (SCREEN_WIDTH - 200, 50)),
+        (f"Car: {state.car_type['name']}", (20, 80)),
+        (f"Difficulty: {difficulty_names[difficulty-1]}", (SCREEN_WIDTH - 200, 80)),
+        (f"Background: {background_names[background_mode]} (Press B to change)", None),
+    ]
+    if net_client is not None:
+        lines.append((race_status(), (20, 110)))
+    font = get_font("small", render_scale)
+    hud = []
+    for text, position in lines:
+        if position is None:  # centered
+            position = (round(SCREEN_WIDTH // 2 * render_scale) - font.size(text)[0] // 2, round(20 * render_scale))
+        else:
+            position = (round(position[0] * render_scale), round(position[1] * render_scale))
+        hud.append((text, *text_blits(font, text, WHITE, position)))
+    return hud
+
+def race_status():
+    # One line on how the network race is going
+    if net_client.status == RACE_WAITING:
+        return "Waiting for an opponent..."
+    if net_client.status == RACE_OVER:
+        return {"Won": "You won the race!", "Lost": "You lost the race", "Draw": "The race was a draw"}[
+            net_client.result()]
+    if net_client.finished:
+        return "Finished! Waiting for the result..." if not state.game_over else "Crashed out of the race"
+    return f"Finish in {max(0, int(net_client.distance - state.distance))} m"
 
 def draw_menu():
     # Draw title
-    title_text = font_large.render("CAR RACING GAME", True, WHITE)
+    title_text = render_text(get_font("large"), "CAR RACING GAME", WHITE)
     screen.blit(title_text, (SCREEN_WIDTH//2 - title_text.get_width()//2, 100))
     
     # Draw buttons
@@ -501,7 +1045,7 @@ def draw_menu():
 
 def draw_car_selection():
     # Draw title
-    title_text = font_large.render("SELECT YOUR CAR", True, WHITE)
+    title_text = render_text(get_font("large"), "SELECT YOUR CAR", WHITE)
     screen.blit(title_text, (SCREEN_WIDTH//2 - title_text.get_width()//2, 50))
     
     # Draw car preview
@@ -519,7 +1063,7 @@ def draw_car_selection():
     
     y_pos = SCREEN_HEIGHT//2 + 100
     for text in info_text:
-        text_surface = font_small.render(text, True, WHITE)
+        text_surface = render_text(get_font("small"), text, WHITE)
         screen.blit(text_surface, (SCREEN_WIDTH//2 - text_surface.get_width()//2, y_pos))
         y_pos += 30
     
@@ -531,7 +1075,7 @@ def draw_car_selection():
 
 def draw_color_selection():
     # Draw title
-    title_text = font_large.render("SELECT CAR COLOR", True, WHITE)
+    title_text = render_text(get_font("large"), "SELECT CAR COLOR", WHITE)
     screen.blit(title_text, (SCREEN_WIDTH//2 - title_text.get_width()//2, 50))
     
     # Draw car preview with selected color
@@ -541,7 +1085,7 @@ def draw_color_selection():
     
     # Draw color name
     color_names = ["Red", "Blue", "Green", "Yellow", "Orange", "Purple"]
-    color_text = font_medium.render(color_names[selected_color_index], True, WHITE)
+    color_text = render_text(get_font("medium"), color_names[selected_color_index], WHITE)
     screen.blit(color_text, (SCREEN_WIDTH//2 - color_text.get_width()//2, SCREEN_HEIGHT//2 + 100))
     
     # Draw buttons
@@ -552,7 +1096,7 @@ def draw_color_selection():
 
 def draw_settings():
     # Draw title
-    title_text = font_large.render("SETTINGS", True, WHITE)
+    title_text = render_text(get_font("large"), "SETTINGS", WHITE)
     screen.blit(title_text, (SCREEN_WIDTH//2 - title_text.get_width()//2, 80))
     
     # Update button texts based on settings
@@ -564,391 +1108,544 @@ def draw_settings():
     
     background_names = ["Day", "Sunset", "Night"]
     background_button.text = f"Background: {background_names[background_mode]}"
+    renderer_button.text = f"Renderer: {'Dirty rects' if dirty_rect_mode else 'Full'}"
+    resolution_button.text = f"Resolution: {'Full' if render_scale == 1 else f'{render_scale:.0%}'}"
     
     # Draw buttons
     fullscreen_button.draw()
     sound_button.draw()
     difficulty_button.draw()
     background_button.draw()
+    renderer_button.draw()
+    resolution_button.draw()
     back_button.draw()
 
 def draw_game_over():
     # Draw game over text
-    game_over_text = font_large.render("GAME OVER", True, RED)
+    game_over_text = render_text(get_font("large"), "GAME OVER", RED)
     screen.blit(game_over_text, (SCREEN_WIDTH//2 - game_over_text.get_width()//2, 100))
     
     # Draw score
-    score_text = font_medium.render(f"Score: {score}", True, WHITE)
+    score_text = render_text(get_font("medium"), f"Score: {state.score}", WHITE)
     screen.blit(score_text, (SCREEN_WIDTH//2 - score_text.get_width()//2, 180))
     
-    # Draw high score
-    if score > high_score:
-        new_high_score_text = font_medium.render("NEW HIGH SCORE!", True, YELLOW)
+    # Draw the race result, or the high score
+    if net_client is not None:
+        race_text = render_text(get_font("medium"), race_status(), YELLOW)
+        screen.blit(race_text, (SCREEN_WIDTH//2 - race_text.get_width()//2, 220))
+    elif state.score > high_score:
+        new_high_score_text = render_text(get_font("medium"), "NEW HIGH SCORE!", YELLOW)
         screen.blit(new_high_score_text, (SCREEN_WIDTH//2 - new_high_score_text.get_width()//2, 220))
     else:
-        high_score_text = font_medium.render(f"High Score: {high_score}", True, WHITE)
+        high_score_text = render_text(get_font("medium"), f"High Score: {high_score}", WHITE)
         screen.blit(high_score_text, (SCREEN_WIDTH//2 - high_score_text.get_width()//2, 220))
     
+    # Draw the best runs of this car and difficulty, with the run that just ended in yellow (below them
+    # if it didn't make the list)
+    car_name = state.car_type["name"]
+    runs = leaderboard.top(car_name, state.difficulty, LEADERBOARD_LINES)
+    title = f"Best runs: {car_name}, {['Easy', 'Medium', 'Hard'][state.difficulty - 1]}"
+    title_text = render_text(get_font("small"), title, LIGHT_GRAY)
+    screen.blit(title_text, (SCREEN_WIDTH//2 - title_text.get_width()//2, 435))
+    lines = [(f"{rank}.", run) for rank, run in enumerate(runs, 1)]
+    if last_run is not None and last_run not in runs:
+        lines.append(("You:", last_run))
+    font = get_font("tiny")
+    for i, (label, run) in enumerate(lines):
+        score, game_time, timestamp = run
+        seconds = game_time // TICK_RATE
+        line = (f"{label}  {score}  in {seconds // 60}:{seconds % 60:02}  on "
+                f"{time.strftime('%Y-%m-%d', time.localtime(timestamp))}")
+        line_text = render_text(font, line, YELLOW if run == last_run else WHITE)
+        screen.blit(line_text, (SCREEN_WIDTH//2 - line_text.get_width()//2, 470 + i * (font.get_linesize() + 3)))
+
     # Draw buttons
     play_again_button.draw()
     menu_button.draw()
 
-def spawn_traffic():
-    # Spawn a traffic car
-    lane_width = road_width / 2  # Divide road into 2 lanes
+def draw_loading(progress):
+    # Title and progress bar while the assets load
+    screen.fill(BLACK)
+    title_text = render_text(get_font("large"), "LOADING", WHITE)
+    screen.blit(title_text, (SCREEN_WIDTH//2 - title_text.get_width()//2, 200))
+    bar = pygame.Rect(SCREEN_WIDTH//4, SCREEN_HEIGHT//2, SCREEN_WIDTH//2, 30)
+    pygame.draw.rect(screen, GREEN, (bar.x, bar.y, bar.width * progress, bar.height))
+    pygame.draw.rect(screen, WHITE, bar, 3)
 
-    # Determine direction and lane based on direction (50/50 chance)
-    direction = "down" if random.random() < 0.5 else "up"
+def queue_assets(loader):
+    """Queue the sounds, sprites and backgrounds to prepare in the background, menu assets first"""
+    loader.add(MENU_ASSETS, "mixer", get_audio)
+    loader.add(MENU_ASSETS, "menu_select sound", lambda: get_audio().load_effect("menu_select"))
+    loader.add(GAME_ASSETS, "gear_shift sound", lambda: get_audio().load_effect("gear_shift"))
+    loader.add(GAME_ASSETS, "crash sound", lambda: get_audio().load_effect("crash"))
+    loader.add(GAME_ASSETS, "engine sounds", lambda: get_audio().load_engine())
+    loader.add(MENU_ASSETS, "leaderboard", lambda: leaderboard.load(
+        [(car_type["name"], level) for car_type in car_types for level in (1, 2, 3)]))
 
-    # Cars going down use left lane, cars going up use right lane
-    lane = 0 if direction == "down" else 1
-    lane_x = road_x + lane * lane_width + lane_width/2 - 20
+    # The GAME scene at the framebuffer's current size, the current background mode first (road tiles
+    # depend on the track, so they are rendered on the main thread as chunks come into view)
+    size, scale = framebuffer.get_size(), render_scale
+    for mode in sorted(range(3), key=lambda mode: mode != background_mode):
+        loader.add(GAME_ASSETS, f"background {mode}", lambda mode=mode: get_background_layer(mode, size))
+        loader.add(GAME_ASSETS, f"tree {mode}", lambda mode=mode: get_tree_sprite(mode, scale))
+    for color in traffic_colors:
+        for direction in ("up", "down"):
+            loader.add(GAME_ASSETS, "traffic car", lambda color=color, direction=direction: get_car_sprite(
+                traffic_car_width, traffic_car_height, color, direction, scale))
 
-    traffic_colors = [RED, BLUE, GREEN, YELLOW, PURPLE]
-    car_color = random.choice(traffic_colors)
+def reset_game():
+    """Set up a new game; returns False if it could not start (no race server answered)"""
+    global state, previous_state, pending_inputs, accumulator, game_view, recorder, net_client, particle_distance
+    global crash_linger, replay_inputs
 
-    # Set starting position based on direction
-    y_pos = -100 if direction == "down" else SCREEN_HEIGHT + 100
+    leave_race()
+    if args.connect:
+        client = RaceClient(parse_address(args.connect), selected_car_index)
+        try:
+            client.connect()
+        except (ConnectionError, OSError) as e:
+            print(f"Could not join a race: {e}")
+            client.close()
+            return False
+        net_client = client
+        state = client.state
+    else:
+        state = GameState(selected_car_index, difficulty, seed=args.seed)
+    previous_state = state
+    pending_inputs = 0
+    accumulator = 0.0
+    game_view = None
+    particles.clear()
+    particle_distance = None
+    crash_linger = None
+    replay_inputs = None  # a replay sets its own after this
+    if args.record:
+        recorder = InputRecorder(state)
+    
+    # Stop any playing sounds
+    stop_engine_sound()
+    return True
 
-    traffic_car = {
-        "x": lane_x,
-        "y": y_pos,
-        "width": 40,
-        "height": 70,
-        "speed": random.uniform(1, 3) * (1 if direction == "down" else -1),
-        "color": car_color,
-        "direction": direction
-    }
+def leave_race():
+    # Close the connection to the race server, if there is one
+    global net_client
+    if net_client is not None:
+        net_client.close()
+        net_client = None
 
-    traffic_cars.append(traffic_car)
+def record_run():
+    # Put the game that just ended on the leaderboard; replayed games were recorded when they were first played
+    global last_run, high_score
+    last_run = None if args.replay else leaderboard.record(
+        state.score, state.car_type["name"], state.difficulty, state.game_time)
+    if state.score > high_score:
+        high_score = state.score
 
-def spawn_tree():
-    # Spawn trees on either side of the road
-    side = random.choice(["left", "right"])
-    if side == "left":
-        x = random.randint(50, road_x - 50)
-    else:
-        x = random.randint(road_x + road_width + 20, SCREEN_WIDTH - 50)
-    
-    tree = {
-        "x": x,
-        "y": -50,
-        "speed": 2
+def save_recording():
+    # Write the current game's inputs to the --record file
+    global recorder
+    if recorder is not None:
+        recorder.save(args.record, state)
+        print(f"Recorded {recorder.ticks} ticks to {args.record}")
+        recorder = None
+
+def write_benchmark_report(path, seconds, frames):
+    # Frame rate, frame-time percentiles and peak memory of the measured frames, as JSON
+    stats = {phase: dict(zip(("p50", "p95", "p99"), values)) for phase, values in profiler.percentiles().items()}
+    try:
+        import resource
+        peak_memory_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":  # reported in bytes there
+            peak_memory_kb //= 1024
+    except ImportError:  # not available on Windows
+        peak_memory_kb = None
+    report = {
+        "frames": frames,
+        "seconds": seconds,
+        "fps": frames / seconds,
+        "frame_ms": stats.pop("frame"),
+        "phases_ms": stats,
+        "peak_memory_kb": peak_memory_kb,
+        "traffic": len(state.traffic),
+        "traffic_on_screen": int(numpy.count_nonzero((state.traffic.y[:state.traffic.count] < SCREEN_HEIGHT) &
+                                                     (state.traffic.y[:state.traffic.count] > -traffic_car_height))),
+        "particles": len(particles),
+        "first_frame_ms": startup_times["first frame"] * 1000,
     }
-    
-    trees.append(tree)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
 
-def reset_game():
-    global car_x, car_y, car_speed, car_rotation, current_gear
-    global traffic_cars, trees, score, game_time
-    
-    car_x = SCREEN_WIDTH // 2 - car_width // 2
-    car_y = SCREEN_HEIGHT * 3 // 4 - car_height // 2  # Position car between center and bottom
-    car_speed = 0
-    car_rotation = 0
-    current_gear = 1
-    traffic_cars = []
-    trees = []
-    score = 0
-    game_time = 0
-    
-    # Stop any playing sounds
-    engine_sound.stop()
+def report_startup():
+    # How long the imports, the display and the first frame took to be ready, from STARTED
+    print("Startup: " + ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in startup_times.items()))
 
-# Main game loop
-while running:
-    # Handle events
-    mouse_click = False
-    mouse_pos = pygame.mouse.get_pos()
-    
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        elif event.type == pygame.KEYDOWN:
-            if game_state == GAME:
-                if event.key == pygame.K_q:  # Shift up
-                    if current_gear < max_gear:
-                        current_gear += 1
-                        play_sound(gear_shift_sound)
-                elif event.key == pygame.K_z:  # Shift down
-                    if current_gear > 1:
-                        current_gear -= 1
-                        play_sound(gear_shift_sound)
-                elif event.key == pygame.K_b:  # Change background during gameplay
-                    background_mode = (background_mode + 1) % 3
-                    play_sound(menu_select_sound)
-                elif event.key == pygame.K_ESCAPE:  # Return to menu
-                    game_state = MENU
-                    engine_sound.stop()
-            elif event.key == pygame.K_F11:  # Toggle fullscreen
-                fullscreen = not fullscreen
-                if fullscreen:
-                    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.FULLSCREEN)
-                else:
-                    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        elif event.type == pygame.MOUSEBUTTONDOWN:
-            mouse_click = True
-    
-    # Fill background
-    screen.fill(BLACK)
-    
-    # Handle different game states
-    if game_state == MENU:
-        draw_menu()
-        
-        # Check button interactions
-        play_button.check_hover(mouse_pos)
-        car_select_button.check_hover(mouse_pos)
-        settings_button.check_hover(mouse_pos)
-        quit_button.check_hover(mouse_pos)
-        
-        if play_button.is_clicked(mouse_pos, mouse_click):
-            game_state = COLOR_SELECT
-            play_sound(menu_select_sound)
-        elif car_select_button.is_clicked(mouse_pos, mouse_click):
-            game_state = CAR_SELECT
-            play_sound(menu_select_sound)
-        elif settings_button.is_clicked(mouse_pos, mouse_click):
-            game_state = SETTINGS
-            play_sound(menu_select_sound)
-        elif quit_button.is_clicked(mouse_pos, mouse_click):
-            running = False
-    
-    elif game_state == CAR_SELECT:
-        draw_car_selection()
-        
-        # Check button interactions
-        prev_car_button.check_hover(mouse_pos)
-        next_car_button.check_hover(mouse_pos)
-        select_car_button.check_hover(mouse_pos)
-        back_button.check_hover(mouse_pos)
-        
-        if prev_car_button.is_clicked(mouse_pos, mouse_click):
-            selected_car_index = (selected_car_index - 1) % len(car_types)
-        elif next_car_button.is_clicked(mouse_pos, mouse_click):
-            selected_car_index = (selected_car_index + 1) % len(car_types)
-        elif select_car_button.is_clicked(mouse_pos, mouse_click):
-            # Update car properties based on selection
-            car_width = car_types[selected_car_index]["width"]
-            car_height = car_types[selected_car_index]["height"]
-            car_acceleration = car_types[selected_car_index]["acceleration"]
-            car_max_speed = car_types[selected_car_index]["max_speed"]
-            car_rotation_speed = car_types[selected_car_index]["handling"]
-            game_state = COLOR_SELECT
-        elif back_button.is_clicked(mouse_pos, mouse_click):
-            game_state = MENU
-    
-    elif game_state == COLOR_SELECT:
-        draw_color_selection()
-        
-        # Check button interactions
-        prev_color_button.check_hover(mouse_pos)
-        next_color_button.check_hover(mouse_pos)
-        select_color_button.check_hover(mouse_pos)
-        back_button.check_hover(mouse_pos)
-        
-        if prev_color_button.is_clicked(mouse_pos, mouse_click):
-            selected_color_index = (selected_color_index - 1) % len(car_colors)
-        elif next_color_button.is_clicked(mouse_pos, mouse_click):
-            selected_color_index = (selected_color_index + 1) % len(car_colors)
-        elif select_color_button.is_clicked(mouse_pos, mouse_click):
-            car_color = car_colors[selected_color_index]
-            reset_game()
+def main(argv=None):
+    """Parse the command line, open the window and run the game until it is closed"""
+    global args, PROFILE_CSV, profiler, profile_overlay, game_state, state, previous_state, pending_inputs
+    global selected_car_index, selected_color_index, car_color, difficulty, background_mode, dirty_rect_mode
+    global fullscreen, sound_enabled, high_score, accumulator, game_view, recorder, replay_inputs
+    global render_scale, screen, crash_linger, leaderboard
+    startup_times["imports"] = time.perf_counter() - STARTED
+    args = parser.parse_args(argv)
+    difficulty = args.difficulty
+    background_mode = args.background
+    dirty_rect_mode = args.dirty_rects
+    render_scale = args.render_scale
+    PROFILE_CSV = args.profile_csv
+    leaderboard = Leaderboard(args.scores)
+    profiler = FrameProfiler(PROFILE_PHASES, PROFILE_CSV)
+    init_display()
+    startup_times["display"] = time.perf_counter() - STARTED
+
+    # Assets load on a worker thread behind the loading screen; the menus open once theirs are done
+    loader = AssetLoader()
+    queue_assets(loader)
+    loader.start()
+
+    # Game loop
+    clock = pygame.time.Clock()
+    running = True
+    frame_time = 0.0
+    idle = False  # nothing happened and nothing was presented last frame
+    last_state = None  # the game state handled last frame
+
+    # Replay: straight into the recorded game, fed from the recording instead of the keyboard
+    if args.replay:
+        recording = Recording(args.replay)
+        selected_car_index = recording.car_index
+        difficulty = recording.difficulty
+        reset_game()
+        state = previous_state = recording.new_state()
+        if recorder is not None:
+            recorder = InputRecorder(state)
+        replay_inputs = recording.inputs()
+        game_state = GAME
+
+    # Benchmark run: straight into a game (or the replay) with a held key, one tick per uncapped frame.
+    # A replay ends the run early if it finishes first.
+    benchmark_frame = 0
+    benchmark_start = None
+    if args.benchmark_frames:
+        benchmark_warmup = max(1, args.benchmark_warmup)
+        if not args.replay:
+            state = GameState(selected_car_index, difficulty, seed=args.seed, fixed_traffic=args.traffic)
+            state.invulnerable = True  # keep driving through crashes so every run is the same length
+            state.current_gear = args.gear
+            previous_state = state
             game_state = GAME
-        elif back_button.is_clicked(mouse_pos, mouse_click):
-            game_state = CAR_SELECT
-    
-    elif game_state == SETTINGS:
-        draw_settings()
-        
-        # Check button interactions
-        fullscreen_button.check_hover(mouse_pos)
-        sound_button.check_hover(mouse_pos)
-        difficulty_button.check_hover(mouse_pos)
-        back_button.check_hover(mouse_pos)
-        
-        if fullscreen_button.is_clicked(mouse_pos, mouse_click):
-            fullscreen = not fullscreen
-            if fullscreen:
-                screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.FULLSCREEN)
-            else:
-                screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        elif sound_button.is_clicked(mouse_pos, mouse_click):
-            sound_enabled = not sound_enabled
-        elif difficulty_button.is_clicked(mouse_pos, mouse_click):
-            difficulty = (difficulty % 3) + 1
-        elif background_button.is_clicked(mouse_pos, mouse_click):
-            background_mode = (background_mode + 1) % 3
-        elif back_button.is_clicked(mouse_pos, mouse_click):
-            game_state = MENU
-    
-    elif game_state == GAME:
-        # Get pressed keys
-        keys = pygame.key.get_pressed()
-        
-        # Handle car controls
-        if keys[pygame.K_UP]:
-            car_speed += car_acceleration
-        elif keys[pygame.K_DOWN]:
-            car_speed -= car_acceleration
+        profiler = FrameProfiler(PROFILE_PHASES, PROFILE_CSV, history=args.benchmark_frames)
+
+    # Main game loop
+    while running:
+        profiler.begin_frame()
+
+        # Handle events; idle menus block until something happens instead of redrawing at 60 FPS
+        mouse_click = False
+        if idle and game_state not in (GAME, LOADING):
+            event = pygame.event.wait(IDLE_TIMEOUT)
+            events = ([event] if event.type != pygame.NOEVENT else []) + pygame.event.get()
         else:
-            # Apply friction to slow down
-            if car_speed > 0:
-                car_speed -= car_friction
-            elif car_speed < 0:
-                car_speed += car_friction
-            
-            # Stop completely if speed is very low
-            if abs(car_speed) < car_friction:
-                car_speed = 0
-        
-        # Apply gear limits
-        max_speed_in_gear = min(gear_speeds[current_gear], car_max_speed)
-        if abs(car_speed) > max_speed_in_gear:
-            if car_speed > 0:
-                car_speed = max_speed_in_gear
-            else:
-                car_speed = -max_speed_in_gear
-        
-        # Handle steering
-        if car_speed != 0:  # Only allow steering when moving
+            events = pygame.event.get()
+        mouse_pos = window_to_logical(pygame.mouse.get_pos())
+
+        for event in events:
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_F3:  # Toggle the frame profiler, on any screen
+                    profiler.toggle()
+                    profile_overlay = None
+                elif game_state == GAME:
+                    if event.key == pygame.K_q:  # Shift up
+                        pending_inputs |= INPUT_SHIFT_UP
+                    elif event.key == pygame.K_z:  # Shift down
+                        pending_inputs |= INPUT_SHIFT_DOWN
+                    elif event.key == pygame.K_b:  # Change background during gameplay (on the next tick)
+                        pending_inputs |= INPUT_BACKGROUND
+                    elif event.key == pygame.K_ESCAPE:  # Return to menu
+                        if state.game_over:  # crashed, with the wreck still on screen: the run counts
+                            crash_linger = None
+                            record_run()
+                        game_state = MENU
+                        stop_engine_sound()
+                        save_recording()
+                        leave_race()
+                        replay_inputs = None
+                elif event.key == pygame.K_F11:  # Toggle fullscreen
+                    fullscreen = not fullscreen
+                    set_display_mode()
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                mouse_click = True
+            elif event.type == pygame.VIDEOEXPOSE:  # Window contents were lost
+                request_full_redraw()
+        profiler.lap("events")
+
+        # The game scene goes into the framebuffer, menus onto the canvas
+        screen = framebuffer if game_state == GAME else menu_canvas
+
+        # Handle different game states
+        entered = game_state != last_state
+        last_state = game_state
+        if game_state == LOADING:
+            progress = loader.progress()
+            if screen_needs_redraw((LOADING, round(progress * 100))):
+                draw_loading(progress)
+            if loader.finished(MENU_ASSETS):
+                high_score = max(high_score, leaderboard.best())
+                game_state = MENU
+
+        elif game_state == MENU:
+            # Check button interactions
+            play_button.check_hover(mouse_pos)
+            car_select_button.check_hover(mouse_pos)
+            settings_button.check_hover(mouse_pos)
+            quit_button.check_hover(mouse_pos)
+            show_menu_screen((MENU,), draw_menu, [play_button, car_select_button, settings_button, quit_button])
+
+            if play_button.is_clicked(mouse_pos, mouse_click):
+                game_state = COLOR_SELECT
+                play_sound("menu_select")
+            elif car_select_button.is_clicked(mouse_pos, mouse_click):
+                game_state = CAR_SELECT
+                play_sound("menu_select")
+            elif settings_button.is_clicked(mouse_pos, mouse_click):
+                game_state = SETTINGS
+                play_sound("menu_select")
+            elif quit_button.is_clicked(mouse_pos, mouse_click):
+                running = False
+
+        elif game_state == CAR_SELECT:
+            # Check button interactions
+            prev_car_button.check_hover(mouse_pos)
+            next_car_button.check_hover(mouse_pos)
+            select_car_button.check_hover(mouse_pos)
+            back_button.check_hover(mouse_pos)
+            show_menu_screen((CAR_SELECT, selected_car_index, selected_color_index), draw_car_selection,
+                             [prev_car_button, next_car_button, select_car_button, back_button])
+
+            if prev_car_button.is_clicked(mouse_pos, mouse_click):
+                selected_car_index = (selected_car_index - 1) % len(car_types)
+            elif next_car_button.is_clicked(mouse_pos, mouse_click):
+                selected_car_index = (selected_car_index + 1) % len(car_types)
+            elif select_car_button.is_clicked(mouse_pos, mouse_click):
+                # The selected car is applied when the next game starts
+                game_state = COLOR_SELECT
+            elif back_button.is_clicked(mouse_pos, mouse_click):
+                game_state = MENU
+
+        elif game_state == COLOR_SELECT:
+            # Check button interactions
+            prev_color_button.check_hover(mouse_pos)
+            next_color_button.check_hover(mouse_pos)
+            select_color_button.check_hover(mouse_pos)
+            back_button.check_hover(mouse_pos)
+            show_menu_screen((COLOR_SELECT, selected_car_index, selected_color_index), draw_color_selection,
+                             [prev_color_button, next_color_button, select_color_button, back_button])
+
+            if prev_color_button.is_clicked(mouse_pos, mouse_click):
+                selected_color_index = (selected_color_index - 1) % len(car_colors)
+            elif next_color_button.is_clicked(mouse_pos, mouse_click):
+                selected_color_index = (selected_color_index + 1) % len(car_colors)
+            elif select_color_button.is_clicked(mouse_pos, mouse_click):
+                car_color = car_colors[selected_color_index]
+                game_state = GAME if reset_game() else MENU
+            elif back_button.is_clicked(mouse_pos, mouse_click):
+                game_state = CAR_SELECT
+
+        elif game_state == SETTINGS:
+            # Check button interactions
+            fullscreen_button.check_hover(mouse_pos)
+            sound_button.check_hover(mouse_pos)
+            difficulty_button.check_hover(mouse_pos)
+            background_button.check_hover(mouse_pos)
+            renderer_button.check_hover(mouse_pos)
+            resolution_button.check_hover(mouse_pos)
+            back_button.check_hover(mouse_pos)
+            show_menu_screen((SETTINGS, fullscreen, sound_enabled, difficulty, background_mode, dirty_rect_mode,
+                              render_scale), draw_settings,
+                             [fullscreen_button, sound_button, difficulty_button, background_button,
+                              renderer_button, resolution_button, back_button])
+
+            if fullscreen_button.is_clicked(mouse_pos, mouse_click):
+                fullscreen = not fullscreen
+                set_display_mode()
+            elif sound_button.is_clicked(mouse_pos, mouse_click):
+                sound_enabled = not sound_enabled
+                if not sound_enabled:
+                    stop_engine_sound()
+            elif difficulty_button.is_clicked(mouse_pos, mouse_click):
+                difficulty = (difficulty % 3) + 1
+            elif background_button.is_clicked(mouse_pos, mouse_click):
+                background_mode = (background_mode + 1) % 3
+            elif renderer_button.is_clicked(mouse_pos, mouse_click):
+                dirty_rect_mode = not dirty_rect_mode
+            elif resolution_button.is_clicked(mouse_pos, mouse_click):
+                render_scale = LOW_RES_SCALE if render_scale == 1 else 1
+                create_framebuffer()
+            elif back_button.is_clicked(mouse_pos, mouse_click):
+                game_state = MENU
+
+        elif game_state == GAME:
+            # Turn the held keys into simulation inputs
+            keys = pygame.key.get_pressed()
+            held_inputs = BENCHMARK_INPUTS[args.hold]
+            if keys[pygame.K_UP]:
+                held_inputs |= INPUT_UP
+            if keys[pygame.K_DOWN]:
+                held_inputs |= INPUT_DOWN
             if keys[pygame.K_LEFT]:
-                car_rotation += car_rotation_speed
+                held_inputs |= INPUT_LEFT
             if keys[pygame.K_RIGHT]:
-                car_rotation -= car_rotation_speed
-        
-        # Update engine sound
-        update_engine_sound()
-        
-        # Calculate movement based on rotation and speed
-        angle_rad = math.radians(car_rotation)
-        car_x += -math.sin(angle_rad) * car_speed
-        
-        # Instead of moving the car vertically, move the road and obstacles
-        # Keep the car at a fixed vertical position
-        fixed_car_y = SCREEN_HEIGHT * 3 // 4 - car_height // 2
-        
-        # Calculate how much the car would have moved vertically
-        # Reverse the sign to fix the direction (positive car_speed should move road downward)
-        vertical_movement = math.cos(angle_rad) * car_speed
-        
-        # Apply the vertical movement to road lines, traffic, and trees instead of the car
-        for i in range(len(road_lines)):
-            road_lines[i] += vertical_movement
-            if road_lines[i] > SCREEN_HEIGHT:
-                road_lines[i] = -road_line_height
-            elif road_lines[i] < -road_line_height:
-                road_lines[i] = SCREEN_HEIGHT
-        
-        # Keep car within road boundaries (but allow full road access)
-        car_x = max(road_x, min(car_x, road_x + road_width - car_width))
-        car_y = fixed_car_y  # Keep car at fixed vertical position
-        
-        # Spawn traffic cars
-        traffic_spawn_timer += 1
-        if traffic_spawn_timer >= traffic_spawn_delay:
-            spawn_traffic()
-            traffic_spawn_timer = 0
-            # Adjust spawn rate based on difficulty
-            traffic_spawn_delay = 120 // difficulty
-        
-        # Spawn trees
-        tree_spawn_timer += 1
-        if tree_spawn_timer >= 60:  # Spawn trees every 60 frames
-            spawn_tree()
-            tree_spawn_timer = 0
-        
-        # Update traffic cars
-        for car in traffic_cars[:]:
-            car["y"] += car["speed"] + vertical_movement
-            # Remove cars that are off screen
-            if car["direction"] == "down" and car["y"] > SCREEN_HEIGHT:
-                traffic_cars.remove(car)
-                score += 10  # Score for passing a car
-            elif car["direction"] == "up" and car["y"] < -car["height"]:
-                traffic_cars.remove(car)
-                score += 10  # Score for passing a car
-        
-        # Update trees
-        for tree in trees[:]:
-            tree["y"] += vertical_movement
-            if tree["y"] > SCREEN_HEIGHT:
-                trees.remove(tree)
-        
-        # Draw everything
-        draw_background()  # Draw the dynamic background
-        
-        # Draw trees behind the road
-        for tree in trees:
-            draw_tree(tree)
-        
-        draw_road()
-        
-        # Draw traffic cars
-        traffic_rects = []
-        for car in traffic_cars:
-            traffic_rect = draw_traffic_car(car)
-            traffic_rects.append(traffic_rect)
-        
-        # Draw player car
-        player_car_rect = draw_car(car_x, car_y, car_rotation, 
-                                  car_types[selected_car_index], car_color)
-        
-        # Check for collisions
-        for rect in traffic_rects:
-            if player_car_rect.colliderect(rect):
-                play_sound(crash_sound)
-                if score > high_score:
-                    high_score = score
+                held_inputs |= INPUT_RIGHT
+
+            # Advance the simulation in fixed ticks for the time the last frame took; the first frame of a game
+            # starts from nothing, since the last one was a menu's, which may have slept on the event queue
+            if not entered:
+                accumulator += frame_time
+            ticks = 0
+            game_events = []  # the simulation's, from this frame's ticks
+            replay_finished = False
+            throttle = bool(held_inputs & INPUT_UP)
+            while accumulator >= TICK_SECONDS and ticks < MAX_TICKS_PER_FRAME:
+                if replay_inputs is not None:
+                    inputs = next(replay_inputs, None)
+                    if inputs is None:
+                        replay_finished = True
+                        break
+                else:
+                    inputs = held_inputs | pending_inputs
+                    pending_inputs = 0  # gear shifts and background changes apply to one tick only
+                throttle = bool(inputs & INPUT_UP)
+                if recorder is not None:
+                    recorder.record(inputs)
+                if inputs & INPUT_BACKGROUND:
+                    background_mode = (background_mode + 1) % 3
+                    play_sound("menu_select")
+                # Write the new tick over the state two ticks back instead of allocating one
+                spare = previous_state if previous_state is not state else None
+                previous_state = state
+                state = step(state, inputs, spare) if net_client is None else net_client.update(inputs, spare)
+                game_events += state.events
+                accumulator -= TICK_SECONDS
+                ticks += 1
+            if ticks == MAX_TICKS_PER_FRAME:
+                # Too far behind: drop the backlog rather than spiral
+                accumulator = min(accumulator, TICK_SECONDS)
+            profiler.lap("simulation")
+            if "gear_shift" in game_events:
+                play_sound("gear_shift")
+
+            # Update engine sound (it stopped if the car crashed)
+            if crash_linger is None:
+                update_engine_sound()
+            profiler.lap("sound")
+
+            # Draw everything (with the HUD) between the last two ticks
+            game_view = interpolate(previous_state, state, accumulator / TICK_SECONDS, game_view)
+            profiler.lap("simulation")
+            update_particles(game_view, game_events, throttle, frame_time)
+            profiler.lap("particles")
+            draw_game(game_view)
+
+            # Handle a crash (or the end of a replay, or of our part in a race); the wreck stays
+            # on screen for CRASH_LINGER seconds while the debris flies
+            if state.game_over and crash_linger is None:
+                play_sound("crash")
+                stop_engine_sound()
+                crash_linger = CRASH_LINGER
+            elif crash_linger is not None:
+                crash_linger -= frame_time
+            race_finished = net_client is not None and (net_client.finished or net_client.status == RACE_OVER)
+            if (crash_linger is not None and crash_linger <= 0) or replay_finished or race_finished:
+                crash_linger = None
+                record_run()
                 game_state = GAME_OVER
-                engine_sound.stop()
-        
-        # Draw HUD
-        draw_hud()
-        
-        # Increase score based on speed
-        if car_speed > 0:
-            score += int(car_speed / 10)
-        
-        # Increase game time
-        game_time += 1
-    
-    elif game_state == GAME_OVER:
-        draw_game_over()
-        
-        # Check button interactions
-        play_again_button.check_hover(mouse_pos)
-        menu_button.check_hover(mouse_pos)
-        
-        if play_again_button.is_clicked(mouse_pos, mouse_click):
-            reset_game()
-            game_state = GAME
-        elif menu_button.is_clicked(mouse_pos, mouse_click):
-            game_state = MENU
-    
-    # Update display
-    pygame.display.flip()
-    
-    # Cap the frame rate
-    clock.tick(60)
+                stop_engine_sound()
+                save_recording()
+                replay_inputs = None
 
-# Quit Pygame
-pygame.quit()
-sys.exit()
+        elif game_state == GAME_OVER:
+            # Keep in touch with the race server until it has the result
+            if net_client is not None:
+                net_client.update(0)
+            # Check button interactions
+            play_again_button.check_hover(mouse_pos)
+            menu_button.check_hover(mouse_pos)
+            show_menu_screen((GAME_OVER, state.score, high_score, net_client and race_status(), last_run,
+                              tuple(leaderboard.top(state.car_type["name"], state.difficulty, LEADERBOARD_LINES))),
+                             draw_game_over,
+                             [play_again_button, menu_button])
 
-def play_sound(sound, volume=1.0):
-    """Play a sound if sound is enabled"""
-    if sound_enabled:
-        sound.set_volume(volume)
-        sound.play()
+            if play_again_button.is_clicked(mouse_pos, mouse_click):
+                game_state = GAME if reset_game() else MENU
+            elif menu_button.is_clicked(mouse_pos, mouse_click):
+                game_state = MENU
+                leave_race()
 
-def update_engine_sound():
-    """Update engine sound based on car speed"""
-    if sound_enabled:
-        # Adjust volume based on speed
-        volume = min(1.0, abs(car_speed) / car_max_speed)
-        engine_sound.set_volume(volume)
-        
-        # Play engine sound if not already playing
-        if not pygame.mixer.get_busy():
-            engine_sound.play(-1)  # Loop indefinitely
+        profiler.lap("menus")
+
+        # Update display
+        idle = not present() and not events
+        profiler.lap("present")
+        if "first frame" not in startup_times:
+            startup_times["first frame"] = time.perf_counter() - STARTED
+            report_startup()
+            if args.benchmark_frames:
+                loader.wait()  # after the first frame is timed, so loading doesn't compete with the measured ones
+        if "assets" not in startup_times and loader.finished():
+            startup_times["assets"] = time.perf_counter() - STARTED
+            print(f"Assets loaded after {startup_times['assets'] * 1000:.1f} ms")
+            for error in loader.errors:
+                print(f"Could not load {error}")
+
+        # Cap the frame rate and measure the frame for the simulation
+        if args.benchmark_frames:
+            # Uncapped, with exactly one tick per frame so every run does the same work
+            clock.tick()
+            frame_time = TICK_SECONDS
+        else:
+            frame_time = clock.tick(FRAME_RATE) / 1000
+        profiler.lap("wait")
+        profiler.end_frame()
+
+        if args.benchmark_frames:
+            benchmark_frame += 1
+            if benchmark_frame == benchmark_warmup:
+                profiler.toggle()
+                benchmark_start = time.perf_counter()
+            elif benchmark_start is None and game_state != GAME:
+                sys.exit("The replay ended before the benchmark warm-up did")
+            elif benchmark_frame == benchmark_warmup + args.benchmark_frames or game_state != GAME:
+                write_benchmark_report(args.benchmark_report, time.perf_counter() - benchmark_start,
+                                       benchmark_frame - benchmark_warmup)
+                running = False
+
+    # Report how often the background and text had to be rebuilt
+    print(f"Background cache: {background_cache_stats['hits']} hits, {background_cache_stats['misses']} misses")
+    text_lookups = max(1, text_cache_stats["hits"] + text_cache_stats["misses"])
+    print(f"Text cache: {text_cache_stats['hits']} hits, {text_cache_stats['misses']} misses "
+          f"({100 * text_cache_stats['hits'] / text_lookups:.1f}% hit rate)")
+    # Report how full the entity pools got in the last game, for sizing them
+    for name, pool in (("Traffic", state.traffic), ("Tree", state.trees)):
+        print(f"{name} pool: high-water mark {pool.high_water}/{pool.capacity} at difficulty {state.difficulty}"
+              f", {pool.dropped} spawns dropped")
+    print(f"Particles: high-water mark {particles.high_water}/{particles.budget}, "
+          f"{particles.dropped} emissions dropped")
+
+    save_recording()
+    leave_race()
+    loader.close()
+    leaderboard.close()
+    for error in leaderboard.errors:
+        print(f"Leaderboard not saved: {error}")
+    profile_path = profiler.close()
+    if profile_path:
+        print(f"Frame timings written to {profile_path}")
+
+    # Quit Pygame
+    pygame.quit()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
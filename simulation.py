@@ -0,0 +1,671 @@
+"""Render-free simulation core for the racing game.
+
+step() advances a GameState by one frame from explicit input flags and returns
+a new state. Nothing in here touches a Surface or the display, so the game
+logic can run headless, as fast as the CPU allows. All randomness comes from
+a generator stored in the state, so a seed and the inputs of every tick
+reproduce a game exactly; the road itself is the seed's Track (see track.py).
+
+Traffic and trees live in EntityPools: one NumPy array per field rather than
+an object per car or tree, since step() and the renderer work on whole
+columns at once. A car or tree is just its slot index in its pool.
+"""
+import math
+import random
+
+import numpy
+
+from collision import UniformGrid, boxes_overlap
+from track import Track, MAX_LANES
+from traffic import drive, DRIVE_INTERVAL, IDM_MIN_GAP, LANE_CHANGE_COOLDOWN, LANE_CHANGE_INTERVAL
+
+# Playfield dimensions
+SCREEN_WIDTH = 800
+SCREEN_HEIGHT = 600
+
+# Fixed simulation rate; every speed, timer and game_time is counted in ticks
+TICK_RATE = 60
+TICK_SECONDS = 1 / TICK_RATE
+
+# Positions that move further than this in one tick (reused entity slots)
+# are not interpolated
+MAX_LERP_DISTANCE = 64
+
+# Input flags, combined into one bitmask per frame
+INPUT_UP = 1
+INPUT_DOWN = 2
+INPUT_LEFT = 4
+INPUT_RIGHT = 8
+INPUT_SHIFT_UP = 16    # Q pressed this frame
+INPUT_SHIFT_DOWN = 32  # Z pressed this frame
+INPUT_BACKGROUND = 64  # B pressed this frame; only the renderer uses it, step() ignores it
+
+# Car options
+car_types = [
+    {"name": "Sedan", "width": 40, "height": 70, "acceleration": 0.1, "max_speed": 20, "handling": 3},
+    {"name": "Sports", "width": 40, "height": 65, "acceleration": 0.15, "max_speed": 25, "handling": 4},
+    {"name": "SUV", "width": 45, "height": 80, "acceleration": 0.08, "max_speed": 18, "handling": 2}
+]
+car_friction = 0.05
+
+# Gear system
+max_gear = 5
+gear_speeds = {
+    1: 5,
+    2: 8,
+    3: 12,
+    4: 16,
+    5: 20
+}
+
+# Road markings; the road's shape comes from the track
+road_line_width = 10
+road_line_height = 50
+road_line_gap = 30
+
+# Traffic
+traffic_colors = [(255, 0, 0), (0, 0, 255), (0, 255, 0), (255, 255, 0), (128, 0, 128)]
+traffic_car_width = 40
+traffic_car_height = 70
+# Cars kept on the road per lane per 1000 rows of the traffic area, by difficulty
+traffic_density = {1: 2, 2: 3.5, 3: 6}
+traffic_desired_speeds = (1, 3)  # range of the speeds cars would drive at on an empty road
+lane_change_speed = 8  # how far a car moves sideways per frame, following the road or changing lanes
+tree_spawn_delay = 60  # frames between tree spawns
+
+# Traffic directions as stored in the traffic pool's direction field
+DOWN = 1
+UP = -1
+
+# Per-entity fields of the traffic and tree arrays
+traffic_fields = {
+    "x": numpy.float64,
+    "y": numpy.float64,
+    "speed": numpy.float64,  # along the screen: positive drives DOWN
+    "drift": numpy.float64,  # sideways movement per tick, towards the middle of the car's lane
+    "desired_speed": numpy.float64,  # the speed the car would drive at with nothing in its way, unsigned
+    "width": numpy.int16,
+    "height": numpy.int16,
+    "direction": numpy.int8,
+    "lane": numpy.int8,  # lane counted from the middle of the road, on the side for the direction
+    "lane_timer": numpy.int16,  # ticks until the car may change lanes again
+    "color": numpy.uint8,  # index into traffic_colors
+    "passed": numpy.bool_,  # it has been beyond_exit(), and scored if it got there from the screen
+}
+tree_fields = {
+    "x": numpy.float64,
+    "y": numpy.float64,
+}
+
+# Entity pool sizes; traffic is denser on harder difficulties, so its pool
+# scales with difficulty. Check the pools' high_water marks when tuning these.
+traffic_pool_size_per_difficulty = 256
+tree_pool_size = 256
+
+# Trees are removed once they are wholly this far past either edge of the screen.
+# Trees inside the margin can still drift back into view; beyond it they never matter.
+CULL_MARGIN = 150
+
+# Traffic keeps driving this far past either edge of the screen, so the cars
+# that come into view have already queued and overtaken on the way
+TRAFFIC_MARGIN = 6000
+# A traffic area for headless games (env.py, batch.py) that trade those queues for speed
+SMALL_TRAFFIC_MARGIN = 300
+
+# Rows of road looked up above and below the screen, covering every live entity
+VIEW_MARGIN = TRAFFIC_MARGIN + 100
+ROAD_ROWS = SCREEN_HEIGHT + 2 * VIEW_MARGIN + 1
+
+
+# Broad-phase grid over the playfield (the road wanders across it): columns about a lane wide,
+# rows taller than any car. Below GRID_MIN_TRAFFIC cars, testing every car directly is cheaper.
+# Cars in the traffic area beyond the grid land in its border rows, which the player never reaches.
+# (x, y, width, height, cell width, cell height); every state has its own grid (GameState.traffic_grid).
+TRAFFIC_GRID = (0, -200, SCREEN_WIDTH, SCREEN_HEIGHT + 400, 100, 100)
+GRID_MIN_TRAFFIC = 32
+
+
+class EntityPool:
+    """Fixed-size structure-of-arrays pool; the live entities are packed into the first `count` slots
+
+    Spawning takes the first free slot after the live ones and removal swaps
+    the last live entity into the freed slot, so both are O(1) and nothing is
+    allocated after the pool is built. Slot indices are only stable until the
+    next removal.
+
+    There are no per-entity objects (such as slotted TrafficCar or Tree
+    views): an entity is its slot, and its fields are read and written as
+    pool.x[slot] and so on.
+    """
+
+    def __init__(self, fields, capacity):
+        self.fields = fields
+        self.capacity = capacity
+        self.count = 0
+        self.high_water = 0  # most entities live at once, for sizing the pool
+        self.dropped = 0  # spawns refused because the pool was full
+        for name, dtype in fields.items():
+            setattr(self, name, numpy.zeros(capacity, dtype=dtype))
+        self.arrays = [getattr(self, name) for name in fields]  # the field arrays, in fields order
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, **values):
+        """Store a new entity in the next free slot and return the slot, or None if the pool is full"""
+        if self.count == self.capacity:
+            self.dropped += 1
+            return None
+        slot = self.count
+        for name, value in values.items():
+            getattr(self, name)[slot] = value
+        self.count += 1
+        self.high_water = max(self.high_water, self.count)
+        return slot
+
+    def remove(self, slot):
+        """Free a slot by moving the last live entity into it"""
+        last = self.count - 1
+        if slot != last:
+            for array in self.arrays:
+                array[slot] = array[last]
+        self.count = last
+
+    def remove_where(self, mask):
+        """Remove the live entities where mask (over the first `count` slots) is set"""
+        if not mask.any():
+            return
+        # Highest slot first, so every entity swapped down has already been checked
+        for slot in numpy.flatnonzero(mask)[::-1].tolist():
+            self.remove(slot)
+
+    def copy(self, into=None):
+        """Return a copy of this pool, reusing the arrays of `into` if it has the same capacity
+
+        Only the live slots are copied; spawn() writes every field of a slot it reuses.
+        """
+        if into is None or into.capacity != self.capacity:
+            into = EntityPool(self.fields, self.capacity)
+        count = self.count
+        for source, target in zip(self.arrays, into.arrays):
+            target[:count] = source[:count]
+        into.count = self.count
+        into.high_water = self.high_water
+        into.dropped = self.dropped
+        return into
+
+
+def next_random(state):
+    """Next float in [0, 1) from the state's generator (splitmix64)"""
+    # The generator is a single integer, so copying a state copies it for free
+    state.rng = (state.rng + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    z = state.rng
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    z ^= z >> 31
+    return (z >> 11) / (1 << 53)
+
+
+def random_uniform(state, low, high):
+    """Float in [low, high) from the state's generator"""
+    return low + (high - low) * next_random(state)
+
+
+def random_int(state, low, high):
+    """Integer in [low, high], both included, from the state's generator"""
+    return low + int(next_random(state) * (high - low + 1))
+
+
+class GameState:
+    """Everything the simulation needs to advance one frame"""
+
+    def __init__(self, car_index=0, difficulty=1, traffic_capacity=None, seed=None, fixed_traffic=0,
+                 traffic_margin=None):
+        car_type = car_types[car_index]
+        self.car_index = car_index
+        self.difficulty = difficulty
+
+        # Random number generator; a random seed unless one is given
+        self.seed = random.getrandbits(64) if seed is None else seed & 0xFFFFFFFFFFFFFFFF
+        self.rng = self.seed
+
+        # Player car
+        self.car_x = SCREEN_WIDTH // 2 - car_type["width"] // 2
+        # Position the car vertically between center and bottom (about 3/4 down the screen)
+        self.car_y = SCREEN_HEIGHT * 3 // 4 - car_type["height"] // 2
+        self.car_speed = 0
+        self.car_rotation = 0
+        self.current_gear = 1
+
+        # Scrolling world: the bottom edge of the screen is `distance` rows along the track
+        self.track = Track(self.seed)  # shared by every copy; it only caches the seed's road
+        self.distance = 0.0
+        if traffic_capacity is None:
+            traffic_capacity = max(fixed_traffic, traffic_pool_size_per_difficulty * max(1, difficulty))
+        self.traffic = EntityPool(traffic_fields, traffic_capacity)
+        self.trees = EntityPool(tree_fields, tree_pool_size)
+        self.tree_spawn_timer = 0
+        # Keep exactly this many cars instead of the difficulty's density (benchmarks). They are there to be
+        # seen, so they drive just past the screen edges rather than the whole traffic area, stacked where a
+        # lane has no room for them all.
+        self.fixed_traffic = fixed_traffic
+        # Rows the traffic drives on past either screen edge (at most TRAFFIC_MARGIN); headless games that
+        # want speed over queues forming far off screen pass SMALL_TRAFFIC_MARGIN
+        if traffic_margin is None:
+            traffic_margin = CULL_MARGIN if fixed_traffic else TRAFFIC_MARGIN
+        self.traffic_margin = traffic_margin
+
+        self.score = 0
+        self.game_time = 0
+        self.game_over = False
+        self.invulnerable = False  # crashes raise "crash" but don't end the game (benchmarks)
+        self.crash_slot = -1  # traffic slot of the car hit last, valid while the game is over
+        # Collision broad phase, made by step() when first needed. Scratch space rather than state: copies
+        # keep their own, so states and their copies can be stepped on different threads.
+        self.traffic_grid = None
+
+        # Events raised by the last step ("gear_shift", "crash"), for sound and effects
+        self.events = []
+
+        # The traffic area starts out as busy as it is kept, but clear of the screen
+        populate_traffic(self)
+
+    @property
+    def car_type(self):
+        return car_types[self.car_index]
+
+    def copy(self, into=None):
+        """Return an independent copy of this state, reusing the buffers of `into` if given"""
+        if into is None:
+            into = GameState.__new__(GameState)
+            traffic = trees = grid = None
+            events = []
+        else:
+            traffic, trees, events, grid = into.traffic, into.trees, into.events, into.traffic_grid
+            events.clear()
+        into.__dict__.update(self.__dict__)
+        into.traffic = self.traffic.copy(traffic)
+        into.trees = self.trees.copy(trees)
+        into.events = events
+        into.traffic_grid = grid
+        return into
+
+
+def player_rect(state):
+    """Bounding box (x, y, width, height) of the rotated player car, matching pygame.transform.rotate"""
+    width = state.car_type["width"]
+    height = state.car_type["height"]
+    angle = math.radians(state.car_rotation)
+    sin_a = abs(math.sin(angle))
+    cos_a = abs(math.cos(angle))
+    rotated_width = int(cos_a * width + sin_a * height)
+    rotated_height = int(sin_a * width + cos_a * height)
+    center_x = int(state.car_x) + width // 2
+    center_y = int(state.car_y) + height // 2
+    return (center_x - rotated_width // 2, center_y - rotated_height // 2, rotated_width, rotated_height)
+
+
+def road_rows(state):
+    """(center, width, lanes) arrays of the road along the screen rows from -VIEW_MARGIN to
+    SCREEN_HEIGHT + VIEW_MARGIN, top to bottom; index them with row_index() or row_indices()"""
+    # Screen row y shows the track floor(distance) + SCREEN_HEIGHT - y rows along
+    start = math.floor(state.distance) - VIEW_MARGIN
+    center, width, lanes = state.track.rows(start, ROAD_ROWS)
+    return center[::-1], width[::-1], lanes[::-1]
+
+
+def row_index(y):
+    """Index into the road_rows() arrays of screen row y"""
+    return min(max(math.floor(y) + VIEW_MARGIN, 0), ROAD_ROWS - 1)
+
+
+def row_indices(y):
+    """Indices into the road_rows() arrays of an array of screen rows"""
+    rows = (y + VIEW_MARGIN).astype(numpy.intp)
+    # minimum/maximum rather than numpy.clip, whose overhead dominates on a few cars
+    return numpy.minimum(numpy.maximum(rows, 0, out=rows), ROAD_ROWS - 1, out=rows)
+
+
+def road_at(state, y):
+    """(center, width, lanes) of the road at screen row y"""
+    return state.track.at(math.floor(state.distance) + SCREEN_HEIGHT - math.floor(y))
+
+
+def _lane_column(lanes, direction, lane):
+    # Lanes count outwards from the middle of the road, the DOWN ones on the left (the smaller half);
+    # where there are fewer lanes than a car's lane number, it drives in the outermost one
+    down_lanes = lanes // 2
+    if direction == DOWN:
+        return down_lanes - 1 - min(lane, down_lanes - 1)
+    return down_lanes + min(lane, lanes - down_lanes - 1)
+
+
+# Lane from the left of the road, by [lane count][direction][lane number]; UP (-1) is the last entry
+LANE_COLUMNS = numpy.array([[[_lane_column(lanes, direction, lane) for lane in range(MAX_LANES // 2)]
+                             for direction in (0, DOWN, UP)] for lanes in range(MAX_LANES + 1)])
+
+
+def lane_x(center, width, lanes, direction, lane):
+    """x of the middle of a lane, on numbers or arrays"""
+    column = LANE_COLUMNS[lanes, direction, lane]
+    return center - width / 2 + (column + 0.5) * width / lanes
+
+
+def lane_centers(state, y):
+    """x of the middle of every lane at screen row y, left to right"""
+    center, width, lanes = road_at(state, y)
+    left = center - width / 2
+    return [left + (i + 0.5) * width / lanes for i in range(lanes)]
+
+
+def lane_columns(road, y, height, direction, lane):
+    """Lane from the left of the road (see LANE_COLUMNS) of cars at screen rows y, on arrays"""
+    lanes = road[2][row_indices(y + height / 2)]
+    return LANE_COLUMNS[lanes, direction, lane]
+
+
+def traffic_target(state, road):
+    """How many cars to keep in the traffic area: the fixed count if there is one, or as many as the
+    difficulty's density puts there, going by the lanes at the middle of the screen"""
+    if state.fixed_traffic:
+        return min(state.fixed_traffic, state.traffic.capacity)
+    lanes = int(road[2][row_index(SCREEN_HEIGHT / 2)])
+    rows = SCREEN_HEIGHT + 2 * state.traffic_margin
+    return min(int(traffic_density[state.difficulty] * lanes * rows / 1000), state.traffic.capacity)
+
+
+def beyond_exit(y, height, direction):
+    """Whether cars at rows y are off the screen past the edge they drive towards (DOWN ones the bottom)"""
+    return numpy.where(direction == DOWN, y > SCREEN_HEIGHT, y + height < 0)
+
+
+def spawn_traffic(state, y=None, road=None, stack=False):
+    """Spawn a traffic car where the road scrolls into the traffic area, unless a y position is given
+
+    Returns the car's slot, or None if its lane is taken there, unless `stack` is
+    set to put it there anyway. Pass step()'s road_rows() as `road` to save
+    looking them up again.
+    """
+    # Determine direction (50/50 chance), lane on that side of the road and speed
+    direction = DOWN if next_random(state) < 0.5 else UP
+    lane = random_int(state, 0, MAX_LANES // 2 - 1)
+    desired_speed = random_uniform(state, *traffic_desired_speeds)
+    color = random_int(state, 0, len(traffic_colors) - 1)
+
+    # Enter through the edge the car drifts away from: the top, unless the player drives slower than it
+    y_pos = y
+    if y is None:
+        vertical_movement = math.cos(math.radians(state.car_rotation)) * state.car_speed
+        moving_down = desired_speed * direction + vertical_movement >= 0
+        margin = state.traffic_margin
+        y_pos = -margin if moving_down else SCREEN_HEIGHT + margin - traffic_car_height
+
+    road = road_rows(state) if road is None else road
+    center, width, lanes = road
+    row = row_index(y_pos + traffic_car_height / 2)
+    column = LANE_COLUMNS[lanes[row], direction, lane]
+
+    # Keep clear of the cars already in that lane
+    traffic = state.traffic
+    if not stack:
+        close = numpy.flatnonzero(numpy.abs(traffic.y[:traffic.count] - y_pos) < traffic_car_height + IDM_MIN_GAP)
+        if len(close) and (lane_columns(road, traffic.y[close], traffic.height[close], traffic.direction[close],
+                                        traffic.lane[close]) == column).any():
+            return None
+    return traffic.spawn(
+        x=float(lane_x(center[row], width[row], lanes[row], direction, lane)) - traffic_car_width / 2,
+        y=y_pos,
+        width=traffic_car_width,
+        height=traffic_car_height,
+        speed=desired_speed * direction,
+        drift=0,
+        desired_speed=desired_speed,
+        color=color,
+        direction=direction,
+        lane=lane,
+        lane_timer=0,
+        passed=bool(beyond_exit(y_pos, traffic_car_height, direction)),
+    )
+
+
+def populate_traffic(state):
+    """Fill the traffic area to its target, as if the game had been running: off the screen at the
+    difficulty's density, or all over it with a fixed count of cars"""
+    road = road_rows(state)
+    if state.fixed_traffic:
+        bottom = SCREEN_HEIGHT + state.traffic_margin - traffic_car_height
+        for _ in range(traffic_target(state, road)):
+            spawn_traffic(state, random_uniform(state, -state.traffic_margin, bottom), road, stack=True)
+        return
+    margin = state.traffic_margin
+    span = margin - traffic_car_height  # rows a car can start at on each side of the screen
+    for _ in range(traffic_target(state, road)):
+        offset = random_uniform(state, 0, 2 * span)
+        spawn_traffic(state, -margin + offset if offset < span else SCREEN_HEIGHT + offset - span, road)
+
+
+def drive_traffic(state, road, vertical_movement):
+    """Speed every car up or down for the car ahead, move some to the other lane (see traffic.py)
+    and steer them all along their lanes, for the next DRIVE_INTERVAL ticks"""
+    traffic = state.traffic
+    live = slice(0, traffic.count)
+    if not traffic.count:
+        return
+    y = traffic.y[live]
+    height = traffic.height[live]
+    direction = traffic.direction[live]
+    lane = traffic.lane[live]
+    lanes = road[2][row_indices(y + height / 2)]
+    column = LANE_COLUMNS[lanes, direction, lane]
+    other_column = LANE_COLUMNS[lanes, direction, MAX_LANES // 2 - 1 - lane]
+    # How far along its direction of travel each car's front is: DOWN cars drive down the screen
+    front = numpy.where(direction == DOWN, y + height, -y)
+    timer = traffic.lane_timer[live]
+    # Drivers only think about changing lanes every LANE_CHANGE_INTERVAL ticks
+    if state.game_time % LANE_CHANGE_INTERVAL:
+        other_column = column
+    speed, change = drive(numpy.abs(traffic.speed[live]), traffic.desired_speed[live], column, other_column, front,
+                          height, lane == 0, timer, DRIVE_INTERVAL, state.fixed_traffic > 0)
+    speed *= direction
+    traffic.speed[live] = speed
+    numpy.maximum(timer - DRIVE_INTERVAL, 0, out=timer)
+    lane[change] = MAX_LANES // 2 - 1 - lane[change]
+    timer[change] = LANE_CHANGE_COOLDOWN
+
+    # Head for the middle of the lane where each car will be by the next update, which moves
+    # sideways with curves and lane-count changes, no faster than lane_change_speed.
+    # The road has scrolled by this tick's vertical_movement already; the cars move along it at their speeds.
+    speed *= DRIVE_INTERVAL
+    speed += y + height / 2 + vertical_movement
+    rows = row_indices(speed)
+    shift = lane_x(road[0][rows], road[1][rows], road[2][rows], direction, lane)
+    shift -= traffic.width[live] / 2 + traffic.x[live]
+    shift /= DRIVE_INTERVAL
+    traffic.drift[live] = numpy.minimum(numpy.maximum(shift, -lane_change_speed, out=shift), lane_change_speed,
+                                        out=shift)
+
+
+def spawn_tree(state, road):
+    # Spawn trees on either side of the road, clear of it where they appear
+    y = -50
+    center, width, _ = road
+    row = row_index(y)
+    road_left = int(center[row] - width[row] / 2)
+    road_right = int(math.ceil(center[row] + width[row] / 2))
+    side = "left" if next_random(state) < 0.5 else "right"
+    if side == "left":
+        x = random_int(state, 50, road_left - 50)
+    else:
+        x = random_int(state, road_right + 20, SCREEN_WIDTH - 50)
+
+    state.trees.spawn(x=x, y=y)
+
+
+def _lerp_positions(previous, current, alpha, out):
+    # Blend two position arrays into out (a copy of current), snapping the ones that jumped
+    count = min(len(previous), len(current))
+    delta = current[:count] - previous[:count]
+    smooth = numpy.abs(delta) < MAX_LERP_DISTANCE
+    out[:count][smooth] = previous[:count][smooth] + delta[smooth] * alpha
+
+
+def interpolate(previous, current, alpha, out=None):
+    """State to render at alpha (0..1) of the way from the previous step to the current one
+
+    Pass the view returned last frame as `out` to reuse its buffers.
+    """
+    view = current.copy(out)
+    view.car_x = previous.car_x + (current.car_x - previous.car_x) * alpha
+    view.car_rotation = previous.car_rotation + (current.car_rotation - previous.car_rotation) * alpha
+    view.distance = previous.distance + (current.distance - previous.distance) * alpha
+    # Pool slots only line up while nothing was removed in between; a moved
+    # entity usually jumps further than MAX_LERP_DISTANCE and is snapped
+    _lerp_positions(previous.traffic.x[:previous.traffic.count], current.traffic.x[:current.traffic.count],
+                    alpha, view.traffic.x)
+    _lerp_positions(previous.traffic.y[:previous.traffic.count], current.traffic.y[:current.traffic.count],
+                    alpha, view.traffic.y)
+    _lerp_positions(previous.trees.y[:previous.trees.count], current.trees.y[:current.trees.count],
+                    alpha, view.trees.y)
+    return view
+
+
+def step(state, inputs, out=None):
+    """Advance the game by one frame and return the new state
+
+    The input state is left untouched; pass a state that is no longer needed
+    as `out` to have the new state written into its buffers.
+    """
+    state = state.copy(out)
+    if state.game_over:
+        return state
+    car_type = state.car_type
+
+    # Gear changes
+    if inputs & INPUT_SHIFT_UP and state.current_gear < max_gear:
+        state.current_gear += 1
+        state.events.append("gear_shift")
+    elif inputs & INPUT_SHIFT_DOWN and state.current_gear > 1:
+        state.current_gear -= 1
+        state.events.append("gear_shift")
+
+    # Handle car controls
+    if inputs & INPUT_UP:
+        state.car_speed += car_type["acceleration"]
+    elif inputs & INPUT_DOWN:
+        state.car_speed -= car_type["acceleration"]
+    else:
+        # Apply friction to slow down
+        if state.car_speed > 0:
+            state.car_speed -= car_friction
+        elif state.car_speed < 0:
+            state.car_speed += car_friction
+
+        # Stop completely if speed is very low
+        if abs(state.car_speed) < car_friction:
+            state.car_speed = 0
+
+    # Apply gear limits
+    max_speed_in_gear = min(gear_speeds[state.current_gear], car_type["max_speed"])
+    if abs(state.car_speed) > max_speed_in_gear:
+        state.car_speed = max_speed_in_gear if state.car_speed > 0 else -max_speed_in_gear
+
+    # Handle steering
+    if state.car_speed != 0:  # Only allow steering when moving
+        if inputs & INPUT_LEFT:
+            state.car_rotation += car_type["handling"]
+        if inputs & INPUT_RIGHT:
+            state.car_rotation -= car_type["handling"]
+
+    # Calculate movement based on rotation and speed
+    angle_rad = math.radians(state.car_rotation)
+    state.car_x += -math.sin(angle_rad) * state.car_speed
+
+    # Instead of moving the car vertically, move the road and obstacles
+    # (positive car_speed moves the road downward)
+    vertical_movement = math.cos(angle_rad) * state.car_speed
+    state.distance += vertical_movement
+    road = road_rows(state)
+    center, width, lanes = road
+
+    # Keep car within road boundaries at its middle (but allow full road access)
+    state.car_y = SCREEN_HEIGHT * 3 // 4 - car_type["height"] // 2
+    row = row_index(state.car_y + car_type["height"] / 2)
+    road_left = center[row] - width[row] / 2
+    state.car_x = max(road_left, min(state.car_x, road_left + width[row] - car_type["width"]))
+
+    # Spawn traffic cars, one every DRIVE_INTERVAL ticks while the traffic area is below the difficulty's
+    # density (more often would mostly find the lane at the edge still taken by the last car)
+    if (not state.fixed_traffic and state.game_time % DRIVE_INTERVAL == 0 and
+            len(state.traffic) < traffic_target(state, road)):
+        spawn_traffic(state, road=road)
+
+    # Spawn trees; only while driving forward, or stopped cars would pile them up at the top edge
+    if vertical_movement > 0:
+        state.tree_spawn_timer += 1
+    if state.tree_spawn_timer >= tree_spawn_delay:
+        spawn_tree(state, road)
+        state.tree_spawn_timer = 0
+
+    # Update traffic cars, removing the ones that left the traffic area through either edge;
+    # they only change speed and steer every DRIVE_INTERVAL ticks, but move every tick
+    if state.game_time % DRIVE_INTERVAL == 0:
+        drive_traffic(state, road, vertical_movement)
+    traffic = state.traffic
+    live = slice(0, traffic.count)
+    traffic.y[live] += traffic.speed[live] + vertical_movement
+    traffic.x[live] += traffic.drift[live]
+    y = traffic.y[live]
+    height = traffic.height[live]
+    # Each car scores once, on the tick it leaves the screen through its exit edge; cars entering the traffic
+    # area beyond that edge start out passed
+    passing = beyond_exit(y, height, traffic.direction[live]) > traffic.passed[live]
+    if passing.any():
+        traffic.passed[live] |= passing
+        state.score += 10 * int(numpy.count_nonzero(passing))  # Score for passing a car
+    margin = state.traffic_margin
+    gone = (y > SCREEN_HEIGHT + margin) | (y + height < -margin)
+    if gone.any():
+        traffic.remove_where(gone)
+        # A fixed count of cars is kept exact by replacing the ones that left at once
+        if state.fixed_traffic:
+            for _ in range(traffic_target(state, road) - len(traffic)):
+                spawn_traffic(state, road=road, stack=True)
+
+    # Update trees (whole tree sprites fit within the margin)
+    trees = state.trees
+    y = trees.y[:trees.count]
+    y += vertical_movement
+    trees.remove_where((y > SCREEN_HEIGHT + CULL_MARGIN) | (y < -CULL_MARGIN))
+
+    # Check for collisions (Rect coordinates truncate like int()) with the cars level with the player;
+    # most of the traffic area is far up or down the road
+    live = slice(0, traffic.count)
+    box = player_rect(state)
+    y = numpy.trunc(traffic.y[live])
+    level = (y < box[1] + box[3]) & (y + traffic.height[live] > box[1])
+    candidates = numpy.flatnonzero(level)
+    if len(candidates) >= GRID_MIN_TRAFFIC:
+        grid = state.traffic_grid
+        if grid is None:
+            grid = state.traffic_grid = UniformGrid(*TRAFFIC_GRID)
+        grid.rebuild(numpy.trunc(traffic.x[live]), y, traffic.width[live], traffic.height[live], level)
+        hit = grid.first_hit(*box)
+    elif len(candidates):
+        hits = candidates[boxes_overlap(*box, numpy.trunc(traffic.x[candidates]), y[candidates],
+                                        traffic.width[candidates], traffic.height[candidates])]
+        hit = int(hits[0]) if len(hits) else -1
+    else:
+        hit = -1
+    if hit >= 0:
+        state.game_over = not state.invulnerable
+        state.crash_slot = hit
+        state.events.append("crash")
+
+    # Increase score based on speed
+    if state.car_speed > 0:
+        state.score += int(state.car_speed / 10)
+
+    # Increase game time
+    state.game_time += 1
+
+    return state
@@ -0,0 +1,115 @@
+"""Long-session soak test for the simulation.
+
+Plays hours of simulated time headlessly in a single game that never ends:
+the car is invulnerable, and a driving script keeps switching between
+driving forward, coasting to a stop and reversing, so traffic and trees
+leave the screen through both edges. Every reporting interval it prints the
+live entity counts and the memory traced by tracemalloc. A leak shows up as
+a count or a memory figure that keeps climbing; the run fails if a pool ever
+filled up or memory grew by more than --max-growth after the first interval.
+Tracing every allocation makes the simulation several times slower; an hour
+of play takes a few minutes.
+
+    python soak.py                           # one simulated hour
+    python soak.py --hours 8 --difficulty 3
+"""
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+from batch import shift_up, steer_towards
+from simulation import GameState, step, lane_centers, TICK_RATE, INPUT_UP, INPUT_DOWN, INPUT_SHIFT_DOWN
+from track import MAX_LANES
+
+# Driving script: each segment holds one mode for a random number of seconds
+MODES = ("forward", "coast", "reverse")
+SEGMENT_SECONDS = (5, 30)
+
+
+class Driver:
+    """Scripted driving that keeps changing direction, with its own RNG"""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.ticks_left = 0
+        self.mode = None
+        self.lane = 0
+
+    def __call__(self, state):
+        if self.ticks_left == 0:
+            self.mode = self.rng.choice(MODES)
+            self.lane = self.rng.randrange(MAX_LANES)
+            self.ticks_left = self.rng.randint(*SEGMENT_SECONDS) * TICK_RATE
+        self.ticks_left -= 1
+        # The lane counted from the left, or the rightmost one where the road has fewer
+        centers = lane_centers(state, state.car_y + state.car_type["height"] / 2)
+        inputs = steer_towards(state, centers[min(self.lane, len(centers) - 1)])
+        if self.mode == "forward":
+            inputs |= INPUT_UP | shift_up(state)
+        elif self.mode == "reverse":
+            inputs |= INPUT_DOWN
+            if state.current_gear > 1:  # reverse in first gear
+                inputs |= INPUT_SHIFT_DOWN
+        return inputs
+
+
+def format_sample(ticks, state, memory, growth, rate):
+    traffic, trees = state.traffic, state.trees
+    return (f"{ticks / TICK_RATE / 60:7.1f} min   traffic {len(traffic):3} (high {traffic.high_water}/"
+            f"{traffic.capacity})   trees {len(trees):3} (high {trees.high_water}/{trees.capacity})   "
+            f"memory {memory / 1024:8.1f} KB ({growth / 1024:+7.1f} KB)   {rate:6.0f} ticks/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test the simulation with hours of headless play")
+    parser.add_argument("--hours", type=float, default=1, help="simulated time to play")
+    parser.add_argument("--interval", type=float, default=10, help="simulated minutes between reports")
+    parser.add_argument("--difficulty", type=int, choices=[1, 2, 3], default=2)
+    parser.add_argument("--car", type=int, default=0, help="car type index")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-growth", type=float, default=256, metavar="KB",
+                        help="fail if traced memory grows by more than this after the first interval")
+    options = parser.parse_args()
+
+    tracemalloc.start()
+    state = GameState(options.car, options.difficulty, seed=options.seed)
+    state.invulnerable = True  # keep playing through crashes
+    drive = Driver(options.seed)
+    spare = None
+    total_ticks = int(options.hours * 3600 * TICK_RATE)
+    interval = max(1, int(options.interval * 60 * TICK_RATE))
+
+    baseline = None  # traced memory and snapshot after the first interval, once the pools have settled
+    growth = 0
+    start = time.perf_counter()
+    for ticks in range(interval, total_ticks + interval, interval):
+        ticks = min(ticks, total_ticks)
+        while state.game_time < ticks:
+            state, spare = step(state, drive(state), spare), state
+        memory = tracemalloc.get_traced_memory()[0]
+        if baseline is None:
+            baseline = memory, tracemalloc.take_snapshot()
+        growth = memory - baseline[0]
+        rate = state.game_time / (time.perf_counter() - start)
+        print(format_sample(ticks, state, memory, growth, rate), flush=True)
+
+    # Where the memory went since the first interval, largest first
+    for stat in tracemalloc.take_snapshot().compare_to(baseline[1], "lineno")[:3]:
+        print(f"  {stat}")
+    tracemalloc.stop()
+
+    failed = False
+    for name, pool in (("traffic", state.traffic), ("tree", state.trees)):
+        if pool.dropped:
+            print(f"FAILED: the {name} pool filled up and dropped {pool.dropped} spawns")
+            failed = True
+    if growth > options.max_growth * 1024:
+        print(f"FAILED: memory grew by {growth / 1024:.1f} KB, more than {options.max_growth:g} KB")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+import numpy
+
+from collision import UniformGrid, boxes_overlap
+
+
+def random_boxes(rng, count):
+    # Boxes the size of cars and trucks, some off the grid's area
+    x = rng.uniform(-150, 950, count)
+    y = rng.uniform(-400, 1200, count)
+    width = rng.uniform(10, 120, count)
+    height = rng.uniform(10, 260, count)
+    return x, y, width, height
+
+
+def brute_force_pairs(x, y, width, height, active):
+    pairs = []
+    for i in range(len(x)):
+        for j in range(i + 1, len(x)):
+            if active[i] and active[j] and boxes_overlap(x[i], y[i], width[i], height[i],
+                                                         x[j], y[j], width[j], height[j]):
+                pairs.append((i, j))
+    return pairs
+
+
+def test_overlapping_pairs_match_brute_force():
+    rng = numpy.random.default_rng(1)
+    grid = UniformGrid(0, -200, 800, 1000, 100, 100)
+    for count in (0, 1, 2, 30, 200):
+        x, y, width, height = random_boxes(rng, count)
+        active = rng.random(count) < 0.8
+        grid.rebuild(x, y, width, height, active)
+        assert grid.overlapping_pairs() == brute_force_pairs(x, y, width, height, active)
+
+
+def test_first_hit_matches_brute_force():
+    rng = numpy.random.default_rng(2)
+    grid = UniformGrid(0, -200, 800, 1000, 100, 100)
+    x, y, width, height = random_boxes(rng, 150)
+    grid.rebuild(x, y, width, height)
+    for qx, qy, qwidth, qheight in zip(*random_boxes(rng, 300)):
+        hits = numpy.flatnonzero(boxes_overlap(qx, qy, qwidth, qheight, x, y, width, height))
+        hit = grid.first_hit(qx, qy, qwidth, qheight)
+        if len(hits):
+            assert hit in hits
+        else:
+            assert hit == -1
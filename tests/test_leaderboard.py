@@ -0,0 +1,72 @@
+import sqlite3
+
+import pytest
+
+from leaderboard import Leaderboard, connect
+
+KEY = ("Sedan", 2)
+
+
+def test_runs_survive_a_reload(tmp_path):
+    path = str(tmp_path / "scores.db")
+    board = Leaderboard(path, size=3)
+    board.load([KEY])
+    for score, game_time in ((100, 50), (300, 90), (200, 70), (300, 80), (50, 10)):
+        board.record(score, *KEY, game_time)
+    board.close()
+    assert not board.errors
+
+    reloaded = Leaderboard(path, size=3)
+    reloaded.load([KEY, ("SUV", 1)])
+    reloaded.close()
+    assert reloaded.top(*KEY) == board.top(*KEY)
+    assert [run[:2] for run in reloaded.top(*KEY)] == [(300, 90), (300, 80), (200, 70)]
+    assert reloaded.top("SUV", 1) == []
+    assert reloaded.best() == 300
+
+
+def test_ties_keep_their_order_after_a_reload(tmp_path):
+    path = str(tmp_path / "scores.db")
+    board = Leaderboard(path, size=4)
+    board.load([KEY])
+    for game_time in (5, 9, 7, 9, 3, 9):
+        board.record(500, *KEY, game_time)
+    board.close()
+
+    reloaded = Leaderboard(path, size=4)
+    reloaded.load([KEY])
+    reloaded.close()
+    assert reloaded.top(*KEY) == board.top(*KEY)
+
+
+def test_runs_recorded_before_the_load_are_merged(tmp_path):
+    path = str(tmp_path / "scores.db")
+    connection = connect(path)
+    with connection:
+        connection.executemany("INSERT INTO runs (score, car, difficulty, game_time, timestamp) VALUES (?, ?, ?, ?, ?)",
+                               [(score, *KEY, score, 1.0) for score in (10, 40, 20, 30)])
+    connection.close()
+
+    board = Leaderboard(path, size=3)
+    board.record(35, *KEY, 35)
+    board.record(5, *KEY, 5)
+    board.load([KEY])
+    board.close()
+    assert [run[0] for run in board.top(*KEY)] == [40, 35, 30]
+    assert [run[0] for run in board.top(*KEY, 2)] == [40, 35]
+
+
+def test_runs_are_append_only(tmp_path):
+    path = str(tmp_path / "scores.db")
+    board = Leaderboard(path)
+    board.load([KEY])
+    board.record(100, *KEY, 10)
+    board.close()
+
+    connection = connect(path)
+    with pytest.raises(sqlite3.DatabaseError, match="append-only"):
+        connection.execute("UPDATE runs SET score = 1000")
+    with pytest.raises(sqlite3.DatabaseError, match="append-only"):
+        connection.execute("DELETE FROM runs")
+    assert connection.execute("SELECT score FROM runs").fetchall() == [(100,)]
+    connection.close()
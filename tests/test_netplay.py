@@ -0,0 +1,50 @@
+import random
+
+from netplay import SNAPSHOT_INTERVAL, capture, decode_delta, encode_delta, new_game, restore, snapshots_equal
+from simulation import INPUT_LEFT, INPUT_RIGHT, INPUT_UP, step
+
+
+def play(ticks, seed=7, traffic=0):
+    # The snapshot of every tick of a game
+    rng = random.Random(seed)
+    state = new_game(seed, 0, 2, traffic)
+    state.invulnerable = True
+    snapshots = [capture(state)]
+    for _ in range(ticks):
+        state = step(state, INPUT_UP | rng.choice((0, 0, INPUT_LEFT, INPUT_RIGHT)))
+        snapshots.append(capture(state))
+    return snapshots
+
+
+def test_snapshots_round_trip():
+    snapshots = play(300)
+    received = {}
+    for tick in range(0, len(snapshots), SNAPSHOT_INTERVAL):
+        # Against nothing, the last snapshot, and one long enough ago that the whole road has changed
+        for base_tick in (None, tick - SNAPSHOT_INTERVAL, tick - 30 * SNAPSHOT_INTERVAL):
+            base = received.get(base_tick)
+            decoded = decode_delta(encode_delta(snapshots[tick], base), base)
+            assert snapshots_equal(decoded, snapshots[tick])
+        received[tick] = decoded
+
+
+def test_fixed_traffic_round_trip():
+    snapshots = play(200, seed=3, traffic=300)
+    for tick in range(SNAPSHOT_INTERVAL, len(snapshots)):
+        base = snapshots[tick - SNAPSHOT_INTERVAL]
+        assert snapshots_equal(decode_delta(encode_delta(snapshots[tick], base), base), snapshots[tick])
+
+
+def test_restore_continues_the_game():
+    rng = random.Random(11)
+    template = new_game(11, 1, 3, 0)
+    state = template.copy()
+    into = None
+    for _ in range(200):
+        inputs = INPUT_UP | rng.choice((0, INPUT_LEFT, INPUT_RIGHT))
+        into = restore(decode_delta(encode_delta(capture(state))), template, into)
+        assert snapshots_equal(capture(into), capture(state))
+        state = step(state, inputs)
+        assert snapshots_equal(capture(step(into, inputs)), capture(state))
+        if state.game_over:
+            break
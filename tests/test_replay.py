@@ -0,0 +1,43 @@
+import random
+
+from replay import MAX_RUN, InputRecorder, Recording, replay
+from simulation import INPUT_LEFT, INPUT_RIGHT, INPUT_UP, GameState, step
+
+
+def test_round_trip_splits_long_runs(tmp_path):
+    state = GameState(1, 2, seed=1234)
+    recorder = InputRecorder(state)
+    inputs = [INPUT_UP] * (MAX_RUN * 2 + 5) + [INPUT_UP | INPUT_LEFT] * 3 + [0] + [INPUT_RIGHT] * MAX_RUN
+    for value in inputs:
+        recorder.record(value)
+    state.score, state.game_time = 4321, len(inputs)
+    path = tmp_path / "game.rep"
+    recorder.save(path, state)
+
+    recording = Recording(path)
+    assert (recording.seed, recording.car_index, recording.difficulty) == (1234, 1, 2)
+    assert (recording.final_score, recording.final_tick) == (4321, len(inputs))
+    assert recording.runs == [(INPUT_UP, MAX_RUN), (INPUT_UP, MAX_RUN), (INPUT_UP, 5),
+                              (INPUT_UP | INPUT_LEFT, 3), (0, 1), (INPUT_RIGHT, MAX_RUN)]
+    assert recording.ticks == len(inputs)
+    assert list(recording.inputs()) == inputs
+
+
+def test_replay_reproduces_the_game(tmp_path):
+    rng = random.Random(5)
+    state = GameState(0, 3, seed=99)
+    recorder = InputRecorder(state)
+    inputs = INPUT_UP
+    for _ in range(600):
+        if rng.random() < 0.1:
+            inputs = INPUT_UP | rng.choice((0, INPUT_LEFT, INPUT_RIGHT))
+        recorder.record(inputs)
+        state = step(state, inputs)
+        if state.game_over:
+            break
+    path = tmp_path / "game.rep"
+    recorder.save(path, state)
+
+    replayed = replay(Recording(path))
+    assert (replayed.score, replayed.game_time, replayed.game_over) == (state.score, state.game_time, state.game_over)
+    assert replayed.distance == state.distance
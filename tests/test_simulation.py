@@ -0,0 +1,47 @@
+import numpy
+
+from simulation import EntityPool, traffic_fields
+
+
+def fields_of(entity):
+    # A value for every field that tells entities apart; width holds the entity's number
+    return {name: entity if name == "width" else (entity * 7 + offset) % (2 if dtype == numpy.bool_ else 100)
+            for offset, (name, dtype) in enumerate(traffic_fields.items())}
+
+
+def test_swap_remove_keeps_fields_aligned():
+    rng = numpy.random.default_rng(3)
+    pool = EntityPool(traffic_fields, 64)
+    live = set()
+    for entity in range(2000):
+        if live and (pool.count == pool.capacity or rng.random() < 0.45):
+            slot = int(rng.integers(pool.count))
+            live.remove(int(pool.width[slot]))
+            pool.remove(slot)
+        else:
+            assert pool.spawn(**fields_of(entity)) == pool.count - 1
+            live.add(entity)
+        assert len(pool) == len(live)
+        assert set(pool.width[:pool.count].tolist()) == live
+        for slot in range(pool.count):
+            for name, value in fields_of(int(pool.width[slot])).items():
+                assert getattr(pool, name)[slot] == value
+
+
+def test_remove_where_and_copy():
+    pool = EntityPool(traffic_fields, 8)
+    for i in range(8):
+        pool.spawn(x=i, y=10 * i, width=i)
+    assert pool.spawn(x=0, y=0, width=0) is None
+    assert pool.dropped == 1
+    pool.remove_where(pool.x[:pool.count] % 3 == 0)
+    kept = sorted(zip(pool.width[:pool.count].tolist(), pool.y[:pool.count].tolist()))
+    assert kept == [(i, 10 * i) for i in range(8) if i % 3]
+
+    into = EntityPool(traffic_fields, 8)
+    copy = pool.copy(into)
+    assert copy is into and copy.count == pool.count
+    for name in traffic_fields:
+        assert numpy.array_equal(getattr(copy, name)[:copy.count], getattr(pool, name)[:pool.count])
+    copy.x[0] = -1
+    assert pool.x[0] != -1
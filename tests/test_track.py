@@ -0,0 +1,38 @@
+import random
+
+import numpy
+
+from track import CHUNK_LENGTH, CHUNKS_PER_SEGMENT, Track, boundary
+
+
+def test_chunks_do_not_depend_on_the_cache():
+    seed = 0xC0FFEE
+    cached = Track(seed)
+    order = list(range(4 * CHUNKS_PER_SEGMENT))
+    expected = [cached.chunk(index) for index in order]
+    random.Random(1).shuffle(order)
+    uncached = Track(seed, cache_size=1)
+    for index in order:
+        chunk = uncached.chunk(index)
+        for name in ("center", "width", "lanes"):
+            assert numpy.array_equal(chunk[name], expected[index][name])
+    assert uncached.generated == len(order)
+
+
+def test_segments_start_on_their_boundary():
+    for seed in (1, 2, 0xFFFFFFFFFFFFFFFF):
+        track = Track(seed, cache_size=1)
+        for k in range(40):
+            point = boundary(seed, k)
+            chunk = track.chunk(k * CHUNKS_PER_SEGMENT)
+            assert chunk["center"][0] == point["center"]
+            assert chunk["width"][0] == point["width"]
+            assert chunk["lanes"][0] == point["lanes"]
+
+
+def test_rows_match_at():
+    track = Track(5)
+    start = 3 * CHUNK_LENGTH - 17
+    center, width, lanes = track.rows(start, 2 * CHUNK_LENGTH)
+    for row in range(0, 2 * CHUNK_LENGTH, 7):
+        assert (center[row], width[row], lanes[row]) == track.at(start + row)
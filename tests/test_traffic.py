@@ -0,0 +1,140 @@
+import numpy
+
+from simulation import DOWN, SCREEN_HEIGHT, UP, GameState, beyond_exit, spawn_traffic, step, traffic_car_height
+from traffic import DRIVE_INTERVAL, IDM_MIN_GAP, drive
+
+HEIGHT = traffic_car_height
+
+
+def lane_of(fronts, speeds, desired):
+    # Arrays for drive() of cars all in one lane, with no other lane to change to
+    count = len(fronts)
+    column = numpy.zeros(count, dtype=numpy.intp)
+    return (numpy.array(speeds, dtype=float), numpy.array(desired, dtype=float), column, column,
+            numpy.array(fronts, dtype=float), numpy.full(count, HEIGHT, dtype=float), numpy.zeros(count, dtype=bool),
+            numpy.zeros(count, dtype=numpy.int16))
+
+
+def test_followers_keep_a_safe_gap_behind_a_slow_leader():
+    speed, desired, column, other, front, height, inner, timer = lane_of(
+        [0, 100, 200, 300, 400, 900], [5, 5, 5, 5, 5, 1], [6, 6, 6, 6, 6, 1])
+    for tick in range(3000):
+        if tick % DRIVE_INTERVAL == 0:
+            speed, change = drive(speed, desired, column, other, front, height, inner, timer, DRIVE_INTERVAL)
+            assert not change.any()
+        front += speed
+        # Nobody overtakes inside the lane, and every car stays clear of the one ahead
+        assert (numpy.diff(front) > 0).all()
+        assert (front[1:] - height[1:] - front[:-1]).min() >= IDM_MIN_GAP
+    # The queue ends up at the leader's speed
+    assert numpy.allclose(speed, 1)
+
+
+def test_a_car_with_nothing_ahead_reaches_its_desired_speed():
+    speed, desired, column, other, front, height, inner, timer = lane_of([0], [0], [2.5])
+    for _ in range(500):
+        speed, _ = drive(speed, desired, column, other, front, height, inner, timer, DRIVE_INTERVAL)
+        front += speed * DRIVE_INTERVAL
+    assert abs(speed[0] - 2.5) < 0.05
+
+
+def overtaking(behind_front, behind_speed):
+    # Car 0 in the outer lane (column 0) stuck behind slow car 1; car 2 in the inner lane (column 1) behind car 0
+    speed = numpy.array([3.0, 0.5, behind_speed])
+    desired = numpy.array([3.0, 0.5, 3.0])
+    column = numpy.array([0, 0, 1])
+    other = numpy.array([1, 1, 0])
+    front = numpy.array([1000.0, 1000.0 + 40 + HEIGHT, behind_front])
+    height = numpy.full(3, HEIGHT, dtype=float)
+    inner = column == 1
+    timer = numpy.zeros(3, dtype=numpy.int16)
+    return drive(speed, desired, column, other, front, height, inner, timer, DRIVE_INTERVAL)[1], timer
+
+
+def test_lane_change_with_room_behind():
+    change, _ = overtaking(behind_front=400, behind_speed=3.0)
+    assert change[0]
+    assert not change[1]
+
+
+def test_lane_change_refused_when_it_would_cut_off_the_car_behind():
+    # Just behind in the other lane and closing in fast: the change would make it brake hard
+    change, _ = overtaking(behind_front=1000 - HEIGHT - 2 * IDM_MIN_GAP, behind_speed=3.0)
+    assert not change[0]
+    # Level with it: no room at all
+    change, _ = overtaking(behind_front=1000, behind_speed=3.0)
+    assert not change[0]
+
+
+def test_lane_change_waits_for_the_cooldown():
+    speed = numpy.array([3.0, 0.5])
+    column = numpy.array([0, 0])
+    front = numpy.array([1000.0, 1000.0 + 40 + HEIGHT])
+    timer = numpy.array([DRIVE_INTERVAL, 0], dtype=numpy.int16)
+    _, change = drive(speed, numpy.array([3.0, 0.5]), column, numpy.array([1, 1]), front,
+                      numpy.full(2, HEIGHT, dtype=float), numpy.zeros(2, dtype=bool), timer, DRIVE_INTERVAL)
+    assert not change[0]
+
+
+def standing_still_with(y, direction):
+    # A game with the player stopped and one car at screen row y; the rest of the traffic area is far off
+    state = GameState(0, 1, seed=8)
+    state.invulnerable = True
+    state.traffic.count = 0
+    slot = spawn_traffic(state, float(y))
+    state.traffic.direction[slot] = direction
+    state.traffic.speed[slot] = state.traffic.desired_speed[slot] * direction
+    state.traffic.passed[slot] = beyond_exit(y, HEIGHT, direction)
+    return state, slot
+
+
+def drive_ticks(state, ticks):
+    # The ticks the score went up on, and by how much
+    gains = []
+    for tick in range(ticks):
+        score = state.score
+        state = step(state, 0)
+        if state.score != score:
+            gains.append((tick, state.score - score))
+    return state, gains
+
+
+def test_a_pass_is_scored_once_as_the_car_leaves_the_screen():
+    state, slot = standing_still_with(300, DOWN)
+    previous_y = state.traffic.y[slot]
+    crossed = None
+    for tick in range(600):
+        score = state.score
+        state = step(state, 0)
+        y = state.traffic.y[slot]
+        if crossed is None and y > SCREEN_HEIGHT >= previous_y:
+            crossed = tick
+            assert state.score == score + 10
+        else:
+            assert state.score == score
+        previous_y = y
+    assert crossed is not None and state.traffic.passed[slot]
+
+    # Back on the screen and out again: already scored
+    state.traffic.y[slot] = SCREEN_HEIGHT - 100
+    state, gains = drive_ticks(state, 300)
+    assert state.traffic.y[slot] > SCREEN_HEIGHT
+    assert gains == []
+
+
+def test_up_cars_are_scored_leaving_through_the_top():
+    state, slot = standing_still_with(50, UP)
+    state, gains = drive_ticks(state, 400)
+    assert state.traffic.y[slot] + HEIGHT < 0
+    assert [gain for _, gain in gains] == [10]
+
+
+def test_cars_that_never_were_on_the_screen_are_not_scored():
+    # Below the screen, driving on down: it has not passed the player, just never been seen
+    state, slot = standing_still_with(SCREEN_HEIGHT + 50, DOWN)
+    state, gains = drive_ticks(state, 300)
+    assert gains == []
+    # Above the screen, driving on up
+    state, slot = standing_still_with(-HEIGHT - 400, UP)
+    state, gains = drive_ticks(state, 300)
+    assert gains == []
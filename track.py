@@ -0,0 +1,198 @@
+"""Endless procedural track for the racing game.
+
+The road is generated lazily from a seed, as the player drives, by a pipeline
+of generators: boundaries() yields the road's center, width and lane count at
+the start of each segment, segments() pairs them up with what changes along
+the segment (a curve, a width change, a lane-count change or nothing), and
+chunks() samples the segments into per-row arrays CHUNK_LENGTH rows at a time.
+
+Each boundary is a pure function of the seed and its index, so the pipeline
+can be restarted at any chunk; driving backwards simply generates the old
+chunks again. Track keeps the chunks it made in an LRU of CHUNK_CACHE_SIZE,
+so memory and generation cost stay the same however far the car goes.
+
+Distances are counted in rows (pixels) along the road, growing in the
+driving direction. Nothing in here touches pygame.
+"""
+import itertools
+import threading
+from collections import OrderedDict
+
+import numpy
+
+FIELD_WIDTH = 800  # the playfield the road has to fit in (simulation.SCREEN_WIDTH)
+CHUNK_LENGTH = 200  # rows per chunk
+SEGMENT_LENGTH = 1600  # rows per segment, a whole number of chunks
+CHUNKS_PER_SEGMENT = SEGMENT_LENGTH // CHUNK_LENGTH
+CHUNK_CACHE_SIZE = 80  # more than the simulation's traffic area (simulation.ROAD_ROWS) and the renderer's prefetch
+
+# The first START_SEGMENTS segments (and everything behind the start) are the
+# old fixed road: straight, 400 wide, one lane each way
+START = {"center": 400, "width": 400, "lanes": 2}
+START_LANE_WIDTH = 200
+START_SEGMENTS = 1
+START_CHUNKS = START_SEGMENTS * CHUNKS_PER_SEGMENT
+
+# Shape limits; ROADSIDE leaves room for trees on both sides
+ROADSIDE = 110
+MIN_CENTER = 250
+MAX_CENTER = 550
+MIN_LANES = 2
+MAX_LANES = 4
+MIN_LANE_WIDTH = 100
+MAX_LANE_WIDTH = 180
+MAX_WIDTH = FIELD_WIDTH - 2 * ROADSIDE - 20
+
+# What changes along a segment, and how often
+KIND_WEIGHTS = (("straight", 0.25), ("curve", 0.45), ("width", 0.15), ("lanes", 0.15))
+# Every kind of change comes round at least once every HOLD_LIMIT segments,
+# so working out a boundary never looks further back than that
+HOLD_LIMIT = 9
+FORCED_KINDS = {0: "curve", 3: "width", 6: "lanes"}
+
+# Streams of _random(); the track's seed is salted so it doesn't repeat the traffic's numbers
+KIND, CENTER, LANE_WIDTH, LANES = range(4)
+SEED_SALT = 0x5DEECE66D
+
+_MASK = 0xFFFFFFFFFFFFFFFF
+
+
+def _random(seed, stream, index):
+    # Float in [0, 1) hashed from the seed, a stream and an index (splitmix64)
+    z = ((seed ^ SEED_SALT) + (index * 4 + stream + 1) * 0x9E3779B97F4A7C15) & _MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+    z ^= z >> 31
+    return (z >> 11) / (1 << 53)
+
+
+def segment_kind(seed, k):
+    """What changes along segment k: "straight", "curve", "width" or "lanes" """
+    if k < START_SEGMENTS:
+        return "straight"
+    forced = FORCED_KINDS.get(k % HOLD_LIMIT)
+    if forced is not None:
+        return forced
+    roll = _random(seed, KIND, k)
+    for kind, weight in KIND_WEIGHTS:
+        roll -= weight
+        if roll < 0:
+            return kind
+    return "straight"
+
+
+def _last_change(seed, kind, k):
+    # Index of the last segment before boundary k that changed `kind`, or None if it still has its START value
+    for j in range(k - 1, max(START_SEGMENTS, k - HOLD_LIMIT) - 1, -1):
+        if segment_kind(seed, j) == kind:
+            return j
+    return None
+
+
+def boundary(seed, k):
+    """The road's center, width and lane count where segment k starts"""
+    j = _last_change(seed, "lanes", k)
+    lanes = START["lanes"] if j is None else MIN_LANES + int(_random(seed, LANES, j) * (MAX_LANES - MIN_LANES + 1))
+    j = _last_change(seed, "width", k)
+    lane_width = START_LANE_WIDTH if j is None else \
+        MIN_LANE_WIDTH + (MAX_LANE_WIDTH - MIN_LANE_WIDTH) * _random(seed, LANE_WIDTH, j)
+    width = min(lanes * lane_width, MAX_WIDTH)
+    j = _last_change(seed, "curve", k)
+    center = START["center"] if j is None else MIN_CENTER + (MAX_CENTER - MIN_CENTER) * _random(seed, CENTER, j)
+    # Width changes can push a held center off the playfield
+    half = width / 2
+    center = min(max(center, ROADSIDE + half), FIELD_WIDTH - ROADSIDE - half)
+    return {"center": center, "width": width, "lanes": lanes}
+
+
+def boundaries(seed, first=0):
+    """Yield the boundaries from index `first` on"""
+    for k in itertools.count(first):
+        yield boundary(seed, k)
+
+
+def segments(seed, first=0):
+    """Yield the segments from index `first` on, with the boundaries they run between"""
+    points = boundaries(seed, first)
+    end = next(points)
+    for k in itertools.count(first):
+        start, end = end, next(points)
+        yield {"index": k, "kind": segment_kind(seed, k), "start": start, "end": end}
+
+
+def chunks(seed, segments, first):
+    """Yield the chunks from index `first` (which must lie in the first segment) on
+
+    Center and width ease from one boundary to the next with a smoothstep, so
+    curves have no kinks; the lane count switches halfway along.
+    """
+    for segment in segments:
+        segment_start = segment["index"] * SEGMENT_LENGTH
+        start, end = segment["start"], segment["end"]
+        first_chunk = segment["index"] * CHUNKS_PER_SEGMENT
+        for index in range(max(first, first_chunk), first_chunk + CHUNKS_PER_SEGMENT):
+            t = (index * CHUNK_LENGTH + numpy.arange(CHUNK_LENGTH) - segment_start) / SEGMENT_LENGTH
+            ease = t * t * (3 - 2 * t)
+            yield {
+                "index": index,
+                # Chunks of the starting straight look the same on every seed
+                "key": index if index < START_CHUNKS else (seed, index),
+                "kind": segment["kind"],
+                "center": start["center"] + (end["center"] - start["center"]) * ease,
+                "width": start["width"] + (end["width"] - start["width"]) * ease,
+                "lanes": numpy.where(t < 0.5, start["lanes"], end["lanes"]).astype(numpy.int8),
+            }
+
+
+class Track:
+    """One seed's track, generated a chunk at a time and kept in an LRU"""
+
+    def __init__(self, seed, cache_size=CHUNK_CACHE_SIZE):
+        self.seed = seed
+        self.cache_size = cache_size
+        self.generated = 0  # chunks made, counting the ones made again after being evicted
+        self._chunks = OrderedDict()  # least recently used first
+        self._stream = None
+        self._next_index = None  # the chunk _stream yields next
+        self._window = (None, None)  # (first, last) chunk indices and their rows concatenated, for rows()
+        # Copies of a game state share its track and may be stepped on different threads
+        self._lock = threading.RLock()
+
+    def chunk(self, index):
+        """The chunk holding rows [index * CHUNK_LENGTH, (index + 1) * CHUNK_LENGTH)"""
+        with self._lock:
+            chunk = self._chunks.get(index)
+            if chunk is not None:
+                self._chunks.move_to_end(index)
+                return chunk
+            if index != self._next_index:
+                # Not the next one along (the first chunk, or driving backwards): restart the pipeline there
+                self._stream = chunks(self.seed, segments(self.seed, index // CHUNKS_PER_SEGMENT), index)
+            chunk = next(self._stream)
+            self._next_index = index + 1
+            self.generated += 1
+            self._chunks[index] = chunk
+            if len(self._chunks) > self.cache_size:
+                self._chunks.popitem(last=False)
+            return chunk
+
+    def rows(self, start, count):
+        """(center, width, lanes) arrays for the `count` rows from distance `start` (an int) on"""
+        first = start // CHUNK_LENGTH
+        last = (start + count - 1) // CHUNK_LENGTH
+        span, arrays = self._window
+        if span != (first, last):
+            # The window only moves every CHUNK_LENGTH rows, so most calls just slice it
+            with self._lock:
+                parts = [self.chunk(index) for index in range(first, last + 1)]
+                arrays = tuple(numpy.concatenate([part[name] for part in parts])
+                               for name in ("center", "width", "lanes"))
+                self._window = ((first, last), arrays)
+        offset = start - first * CHUNK_LENGTH
+        return tuple(array[offset:offset + count] for array in arrays)
+
+    def at(self, distance):
+        """(center, width, lanes) of the row at a distance (an int)"""
+        chunk = self.chunk(distance // CHUNK_LENGTH)
+        row = distance % CHUNK_LENGTH
+        return float(chunk["center"][row]), float(chunk["width"][row]), int(chunk["lanes"][row])
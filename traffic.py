@@ -0,0 +1,133 @@
+"""Traffic behaviour for the racing game: car-following and lane changes.
+
+Every car accelerates towards its own desired speed and brakes for the car
+ahead in its lane by the Intelligent Driver Model (IDM): the closer it is
+and the faster it closes in, the harder it brakes. A car held up by the car
+ahead moves to the other lane on its side of the road when that lets it go
+faster without making the car it cuts in front of brake hard (a simplified
+MOBIL rule). When nothing holds it back, it moves back to the outer lane.
+
+Neighbours come from one sort per tick: the cars are sorted by lane and by
+how far along their direction of travel their front is. The car ahead of
+each car is then the next one in the sort, and a binary search finds the
+cars ahead and behind a car in the other lane. Nothing compares every pair
+of cars, so hundreds of cars cost little more than a few.
+
+Everything here works on plain arrays in pixels and ticks. The simulation
+works out which lane column each car is in and where its front is (see
+drive_traffic() in simulation.py). Nothing in here touches pygame or a
+GameState.
+"""
+import numpy
+
+# Intelligent Driver Model, in pixels and ticks
+IDM_ACCELERATION = 0.02  # the most a car speeds up per tick
+IDM_BRAKING = 0.05  # comfortable braking per tick
+IDM_MAX_BRAKING = 0.5  # hardest braking per tick, when cut off
+IDM_HEADWAY = 30  # ticks of travel a car keeps between itself and the car ahead
+IDM_MIN_GAP = 15  # pixels between bumpers when stopped in a queue
+IDM_EXPONENT = 4  # how sharply a car eases off as it nears its desired speed
+
+# Lane changes
+LANE_CHANGE_GAIN = 0.005  # acceleration a car must gain to move to the inner lane
+KEEP_OUTSIDE_BIAS = 0.002  # acceleration a car gives up to move back to the outer lane
+SAFE_BRAKING = 0.1  # the hardest a lane change may make the new car behind brake
+LANE_CHANGE_COOLDOWN = 120  # ticks a car stays in a lane after changing into it
+LANE_CHANGE_INTERVAL = 6  # ticks between a driver's looks at the other lane, like a reaction time
+
+# Drivers only adjust their speed every DRIVE_INTERVAL ticks, applying that many ticks of acceleration
+# at once; far quicker than their headway, and it divides the cost of driving by as much.
+# LANE_CHANGE_INTERVAL and LANE_CHANGE_COOLDOWN must be multiples of it.
+DRIVE_INTERVAL = 6
+
+_COLUMN_STRIDE = 1 << 20  # sort key spacing between lane columns; more than the span of any front position
+
+
+def idm_acceleration(speed, desired, gap, closing):
+    """Acceleration of cars going at `speed` towards `desired`, `gap` pixels behind a car they close on at `closing`
+
+    Pass an infinite gap for a car with nothing ahead of it.
+    """
+    wanted = IDM_MIN_GAP + speed * IDM_HEADWAY + speed * closing / (2 * (IDM_ACCELERATION * IDM_BRAKING) ** 0.5)
+    interaction = (numpy.maximum(wanted, 0) / numpy.maximum(gap, 1)) ** 2
+    acceleration = IDM_ACCELERATION * (1 - (speed / desired) ** IDM_EXPONENT - interaction)
+    return numpy.maximum(acceleration, -IDM_MAX_BRAKING)
+
+
+class LaneIndex:
+    """The cars sorted by lane column, then by how far along their direction of travel their front is"""
+
+    def __init__(self, column, front):
+        self.key = column * _COLUMN_STRIDE + front
+        self.order = numpy.argsort(self.key, kind="stable")
+        self.sorted_key = self.key[self.order]
+        self.sorted_column = column[self.order]
+
+    def leaders(self):
+        """Index of the car ahead of each car in its lane, or -1"""
+        leader = numpy.full(len(self.order), -1, dtype=numpy.intp)
+        same_lane = self.sorted_column[1:] == self.sorted_column[:-1]
+        leader[self.order[:-1][same_lane]] = self.order[1:][same_lane]
+        return leader
+
+    def around(self, column, front):
+        """(ahead, behind): the cars in `column` around a position `front` along it, or -1"""
+        position = numpy.searchsorted(self.sorted_key, column * _COLUMN_STRIDE + front)
+        count = len(self.order)
+        ahead_slot = numpy.minimum(position, count - 1)
+        behind_slot = numpy.maximum(position - 1, 0)
+        ahead = numpy.where((position < count) & (self.sorted_column[ahead_slot] == column),
+                            self.order[ahead_slot], -1)
+        behind = numpy.where((position > 0) & (self.sorted_column[behind_slot] == column),
+                             self.order[behind_slot], -1)
+        return ahead, behind
+
+
+def _following(leader, front, rear, speed, own_front, own_speed):
+    # Gap to and closing speed on a leader (-1 for none) of cars with the given fronts and speeds
+    has_leader = leader >= 0
+    gap = numpy.where(has_leader, rear[leader] - own_front, numpy.inf)
+    closing = numpy.where(has_leader, own_speed - speed[leader], 0)
+    return gap, closing
+
+
+def drive(speed, desired, column, other_column, front, height, inner, lane_timer, ticks=1, stacked=False):
+    """`ticks` ticks of driving for every car: returns (new speeds, mask of cars changing lanes)
+
+    Speeds are along each car's direction of travel. `column` is each car's
+    lane across the road, `other_column` the other lane on its side of the
+    road (the same column where there is only one). `front` is how far along
+    the direction of travel the car's front is, `inner` is set for cars in
+    the inner lane, and cars with a `lane_timer` left do not change lanes.
+    With `stacked` set, cars put on top of each other (see GameState.fixed_traffic)
+    drive through the cars they overlap.
+    """
+    rear = front - height
+    lanes = LaneIndex(column, front)
+    gap, closing = _following(lanes.leaders(), front, rear, speed, front, speed)
+    if stacked:
+        # Drive through the car ahead instead of braking for good behind it
+        gap[gap < 0] = numpy.inf
+    acceleration = idm_acceleration(speed, desired, gap, closing)
+
+    # Lane changes: only cars with another lane on their side and no recent change look
+    candidates = numpy.flatnonzero((other_column != column) & (lane_timer == 0))
+    change = numpy.zeros(len(speed), dtype=bool)
+    if len(candidates):
+        ahead, behind = lanes.around(other_column[candidates], front[candidates])
+        own_speed = speed[candidates]
+        new_gap, new_closing = _following(ahead, front, rear, speed, front[candidates], own_speed)
+        new_acceleration = idm_acceleration(own_speed, desired[candidates], new_gap, new_closing)
+        # The car that would end up behind, following this one instead of its current leader
+        has_behind = behind >= 0
+        behind_gap = numpy.where(has_behind, rear[candidates] - front[behind], numpy.inf)
+        behind_speed = speed[behind]
+        behind_acceleration = numpy.where(
+            has_behind, idm_acceleration(behind_speed, desired[behind], behind_gap, behind_speed - own_speed), 0)
+        safe = (new_gap > IDM_MIN_GAP) & (behind_gap > IDM_MIN_GAP) & (behind_acceleration > -SAFE_BRAKING)
+        threshold = numpy.where(inner[candidates], -KEEP_OUTSIDE_BIAS, LANE_CHANGE_GAIN)
+        go = safe & (new_acceleration - acceleration[candidates] > threshold)
+        change[candidates[go]] = True
+        acceleration[candidates[go]] = new_acceleration[go]
+
+    return numpy.maximum(speed + acceleration * ticks, 0), change